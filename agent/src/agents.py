@@ -1,38 +1,407 @@
+import asyncio
+import contextlib
 import os
+import threading
+import time
+import weakref
+
 import openai
 
+from backends import LLM_MAX_CONCURRENCY, LLM_TIMEOUT, load_backend
+from cache import get_result_cache, make_key
+from coalesce import get_single_flight
+from metrics import LLM_IN_FLIGHT, LLM_LATENCY, LLM_REQUESTS, observe_usage
+from prompts import prompt_version
+from scheduler import (LLM_ESTIMATED_COMPLETION_TOKENS, LLM_MAX_RETRIES, LLM_TPM_LIMIT, Scheduler, api_keys,
+                       backoff, retry_after)
+from structured import STRUCTURED_OUTPUT_RETRY, get_output_stats, json_mode_enabled, retry_prompt
+from tokens import count_tokens
+
+# Model used for completions, overridable through the environment
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+
 class Agent:
-    def __init__(self, name, instructions, api_key=None):
+    def __init__(self, name, instructions, api_key=None, cache=None, json_output=False):
         self.name = name
         self.instructions = instructions
-        
+        # Ask the provider for a JSON object (JSON mode) where the model supports it
+        self.json_output = json_output
+
+        # Results are cached per prompt version, so editing the instructions invalidates them
+        self.cache = cache if cache is not None else get_result_cache()
+        self.prompt_version = prompt_version(instructions)
+
         # Use the provided API key or fall back to environment variable
         if api_key:
             self.api_key = api_key
         else:
             self.api_key = os.getenv("OPENAI_API_KEY")
-            
+
         if not self.api_key:
             raise ValueError("API key is required. Provide it directly or set OPENAI_API_KEY environment variable.")
 
+    def cache_key(self, text, task):
+        """Cache key for running task on text with this agent's prompt and model"""
+        return make_key(text, task, self.prompt_version, MODEL)
+
+    def _run_cached(self, text, task, prompt, parse, use_cache=True):
+        """
+        Run prompt through the model and parse the output, going through the result cache.
+
+        With use_cache=False the cached entry is bypassed and refreshed. Error results
+        are never cached.
+        """
+        key = self.cache_key(text, task) if self.cache is not None else None
+        if key and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        result = self._complete(task, prompt, parse)
+        if key and "error" not in result:
+            self.cache.set(key, result)
+        return result
+
+    async def _arun_cached(self, text, task, prompt, parse, use_cache=True, timeout=None):
+        """
+        Async variant of _run_cached().
+
+        Concurrent calls for the same text, task and prompt version are coalesced into
+        a single completion whose result (or error) every caller receives.
+        """
+        key = self.cache_key(text, task)
+        if self.cache is not None and use_cache:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return cached
+
+        async def complete():
+            result = await self._acomplete(task, prompt, parse, timeout=timeout)
+            if self.cache is not None and "error" not in result:
+                await self.cache.aset(key, result)
+            return result
+
+        return await get_single_flight().do(key, complete)
+
+    async def _astream_cached(self, text, task, prompt, parse, use_cache=True, timeout=None):
+        """
+        Streaming variant of _arun_cached().
+
+        Yields ("token", text) for each piece of model output as it arrives, then one
+        ("result", parsed) once the full output has been parsed. A cache hit yields the
+        result straight away with no tokens.
+        """
+        key = self.cache_key(text, task) if self.cache is not None else None
+        if key and use_cache:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                yield "result", cached
+                return
+
+        chunks = []
+        async for delta in Runner.stream(self, prompt, timeout=timeout):
+            chunks.append(delta)
+            yield "token", delta
+
+        result = parse("".join(chunks))
+        if "error" in result and STRUCTURED_OUTPUT_RETRY:
+            result = await self._aretry(task, prompt, parse, result, timeout=timeout)
+        if key and "error" not in result:
+            await self.cache.aset(key, result)
+        yield "result", result
+
+    def _complete(self, task, prompt, parse):
+        """Run prompt and parse the output, re-asking once if it cannot be parsed or repaired"""
+        result = parse(Runner.run_sync(self, prompt).final_output)
+        if "error" in result and STRUCTURED_OUTPUT_RETRY and "raw_output" in result:
+            get_output_stats().record(task, "retries")
+            result = parse(Runner.run_sync(self, retry_prompt(prompt, result["raw_output"], result["error"])).final_output)
+            if "error" in result:
+                get_output_stats().record(task, "retry_failures")
+        return result
+
+    async def _acomplete(self, task, prompt, parse, timeout=None):
+        """Async variant of _complete()"""
+        result = parse((await Runner.run(self, prompt, timeout=timeout)).final_output)
+        if "error" in result and STRUCTURED_OUTPUT_RETRY:
+            result = await self._aretry(task, prompt, parse, result, timeout=timeout)
+        return result
+
+    async def _aretry(self, task, prompt, parse, failed, timeout=None):
+        """The one targeted retry for an output that could not be used, quoting what was wrong with it"""
+        if "raw_output" not in failed:
+            return failed
+        get_output_stats().record(task, "retries")
+        output = (await Runner.run(self, retry_prompt(prompt, failed["raw_output"], failed["error"]),
+                                   timeout=timeout)).final_output
+        result = parse(output)
+        if "error" in result:
+            get_output_stats().record(task, "retry_failures")
+        return result
+
+def _is_retryable(error):
+    """Rate limits, server errors and dropped connections are worth retrying; timeouts are not"""
+    if isinstance(error, openai.APITimeoutError):
+        return False
+    return isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError))
+
 class Runner:
+    """
+    Runs agents against a chat completions backend (the OpenAI API by default, see
+    backends.py and LLM_BACKEND).
+
+    Clients are created once per API key and reused, so every call goes over the
+    same pooled keep-alive connections instead of opening a new one. Async clients
+    use HTTP/2 and are scoped to the event loop that created them; the number of
+    in-flight async completions per loop is capped at LLM_MAX_CONCURRENCY.
+
+    Async calls are dispatched by a per-loop Scheduler that keeps each API key under
+    its RPM/TPM quota and serves interactive requests before bulk ones. Rate limit,
+    server and connection errors are retried with jittered backoff, honouring any
+    Retry-After the provider sends.
+    """
+    _lock = threading.Lock()
+    _backend = None
+    _sync_clients = {}
+    _loop_state = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get_backend(cls):
+        with cls._lock:
+            if cls._backend is None:
+                cls._backend = load_backend()
+            return cls._backend
+
+    @classmethod
+    def set_backend(cls, backend):
+        """Send completions to backend from now on; clients of the previous backend are dropped"""
+        with cls._lock:
+            cls._backend = backend
+            cls._sync_clients = {}
+            for state in cls._loop_state.values():
+                state["clients"].clear()
+
+    @classmethod
+    def _get_sync_client(cls, api_key):
+        backend = cls.get_backend()
+        with cls._lock:
+            client = cls._sync_clients.get(api_key)
+            if client is None:
+                client = backend.create_sync_client(api_key)
+                cls._sync_clients[api_key] = client
+            return client
+
+    @classmethod
+    def _get_loop_state(cls):
+        loop = asyncio.get_running_loop()
+        state = cls._loop_state.get(loop)
+        if state is None:
+            state = {"clients": {}, "schedulers": {}, "semaphore": asyncio.Semaphore(LLM_MAX_CONCURRENCY)}
+            cls._loop_state[loop] = state
+        return state
+
+    @classmethod
+    def _get_async_client(cls, api_key):
+        clients = cls._get_loop_state()["clients"]
+        client = clients.get(api_key)
+        if client is None:
+            client = cls.get_backend().create_async_client(api_key)
+            clients[api_key] = client
+        return client
+
+    @classmethod
+    def get_scheduler(cls, api_key):
+        """The running loop's scheduler for api_key (or the OPENAI_API_KEYS pool, when set)"""
+        schedulers = cls._get_loop_state()["schedulers"]
+        scheduler = schedulers.get(api_key)
+        if scheduler is None:
+            scheduler = Scheduler(api_keys(api_key))
+            schedulers[api_key] = scheduler
+        return scheduler
+
+    @staticmethod
+    def _messages(agent, prompt):
+        return [
+            {"role": "system", "content": agent.instructions},
+            {"role": "user", "content": prompt}
+        ]
+
     @staticmethod
-    def run_sync(agent, prompt):
-        # Configure the OpenAI client with the API key
-        client = openai.OpenAI(api_key=agent.api_key)
-        
-        # Make a request to the OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": agent.instructions},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
+    def _estimate_tokens(messages):
+        """Tokens a call is expected to use: the prompt as sent plus a typical completion"""
+        if not LLM_TPM_LIMIT:
+            return 0
+        return sum(count_tokens(m["content"], MODEL) for m in messages) + LLM_ESTIMATED_COMPLETION_TOKENS
+
+    @staticmethod
+    def _format_kwargs(agent):
+        """Extra request parameters for the agent, i.e. JSON mode for agents that answer in JSON"""
+        if agent.json_output and json_mode_enabled(MODEL):
+            return {"response_format": {"type": "json_object"}}
+        return {}
+
+    @classmethod
+    def run_sync(cls, agent, prompt, timeout=None):
+        client = cls._get_sync_client(agent.api_key)
+
+        # Make a request to the OpenAI API, retrying transient failures
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                response = client.chat.completions.create(
+                    model=MODEL,
+                    messages=cls._messages(agent, prompt),
+                    timeout=timeout or LLM_TIMEOUT,
+                    **cls._format_kwargs(agent),
+                )
+                _observe_call(agent, "ok", started)
+                observe_usage(agent.name, getattr(response, "usage", None))
+                break
+            except openai.APIError as e:
+                _observe_call(agent, type(e).__name__, started)
+                if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                    raise
+                time.sleep(backoff(attempt, retry_after(e) or 0))
+
         # Return a simple result object with the response
         return RunResult(response.choices[0].message.content)
 
+    @classmethod
+    @contextlib.asynccontextmanager
+    async def _completion(cls, agent, prompt, timeout, **kwargs):
+        """
+        Yield a chat completion (or stream) once the scheduler has granted budget and a
+        concurrency slot is free. The slot is held until the block exits.
+        """
+        state = cls._get_loop_state()
+        scheduler = cls.get_scheduler(agent.api_key)
+        messages = cls._messages(agent, prompt)
+        estimated = cls._estimate_tokens(messages)
+        kwargs.update(cls._format_kwargs(agent))
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            # Budget first, then a slot, so queued bulk work never holds slots interactive calls need
+            api_key = await scheduler.acquire(estimated)
+            client = cls._get_async_client(api_key)
+            async with state["semaphore"]:
+                # Upstream latency is timed from here, so queueing and our own overhead are excluded
+                started = time.perf_counter()
+                try:
+                    # Bound each attempt (queueing excluded) by the timeout
+                    with LLM_IN_FLIGHT.track_inprogress():
+                        response = await asyncio.wait_for(
+                            client.chat.completions.create(model=MODEL, messages=messages, timeout=timeout, **kwargs),
+                            timeout,
+                        )
+                except openai.APIError as e:
+                    _observe_call(agent, type(e).__name__, started)
+                    if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                        raise
+                    delay = backoff(attempt, retry_after(e) or 0)
+                    if isinstance(e, openai.RateLimitError):
+                        scheduler.cool_down(api_key, delay)
+                    scheduler.stats["retries"] += 1
+                except asyncio.TimeoutError:
+                    _observe_call(agent, "TimeoutError", started)
+                    raise
+                else:
+                    if not kwargs.get("stream"):
+                        _observe_call(agent, "ok", started)
+                        cls._settle(agent, scheduler, api_key, estimated, getattr(response, "usage", None))
+                        yield response
+                        return
+                    # A stream is timed, and its tokens settled, once it has been read to the end
+                    stream = _UsageTrackingStream(response)
+                    outcome = "exception"
+                    try:
+                        with LLM_IN_FLIGHT.track_inprogress():
+                            yield stream
+                        outcome = "ok"
+                    finally:
+                        _observe_call(agent, outcome, started)
+                        cls._settle_stream(agent, scheduler, api_key, estimated, stream)
+                    return
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _settle(agent, scheduler, api_key, estimated, usage):
+        """Count the tokens a completion used and correct the scheduler's estimate with them"""
+        if usage is None:
+            return
+        observe_usage(agent.name, usage)
+        if estimated:
+            scheduler.settle(api_key, estimated, usage.total_tokens)
+
+    @classmethod
+    def _settle_stream(cls, agent, scheduler, api_key, estimated, stream):
+        """
+        Settle a streamed completion from the usage in its last chunk or, when that
+        never arrived (the provider does not send it, or the stream was cut short),
+        from the prompt estimate plus the tokens of the text streamed so far
+        """
+        if stream.usage is not None:
+            cls._settle(agent, scheduler, api_key, estimated, stream.usage)
+        elif estimated:
+            prompt_tokens = estimated - LLM_ESTIMATED_COMPLETION_TOKENS
+            scheduler.settle(api_key, estimated, prompt_tokens + count_tokens("".join(stream.text), MODEL))
+
+    @classmethod
+    async def run(cls, agent, prompt, timeout=None):
+        """Run the agent without blocking the event loop"""
+        async with cls._completion(agent, prompt, timeout or LLM_TIMEOUT) as response:
+            return RunResult(response.choices[0].message.content)
+
+    @classmethod
+    async def stream(cls, agent, prompt, timeout=None):
+        """Run the agent and yield pieces of the output text as the model generates them"""
+        timeout = timeout or LLM_TIMEOUT
+        # include_usage makes the provider send the token counts in a final chunk without choices
+        async with cls._completion(agent, prompt, timeout, stream=True,
+                                   stream_options={"include_usage": True}) as stream:
+            deadline = asyncio.get_running_loop().time() + timeout
+            try:
+                async for chunk in stream:
+                    if asyncio.get_running_loop().time() > deadline:
+                        raise asyncio.TimeoutError(f"Streamed completion exceeded {timeout}s")
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+
+    @classmethod
+    async def aclose(cls):
+        """Close the pooled clients owned by the running event loop"""
+        state = cls._loop_state.pop(asyncio.get_running_loop(), None)
+        if state:
+            for scheduler in state["schedulers"].values():
+                scheduler.close()
+            for client in state["clients"].values():
+                await client.close()
+
+class _UsageTrackingStream:
+    """A streamed completion that keeps the text it yielded and the usage of its final chunk"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.text = []
+        self.usage = None
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            if getattr(chunk, "usage", None) is not None:
+                self.usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                self.text.append(chunk.choices[0].delta.content)
+            yield chunk
+
+    async def close(self):
+        await self._stream.close()
+
+def _observe_call(agent, outcome, started):
+    LLM_REQUESTS.labels(agent.name, outcome).inc()
+    if outcome == "ok":
+        LLM_LATENCY.labels(agent.name).observe(time.perf_counter() - started)
+
 class RunResult:
     def __init__(self, final_output):
         self.final_output = final_output
@@ -1,11 +1,18 @@
 from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel
+from pydantic import AnyHttpUrl, BaseModel
 from typing import Optional, List, Dict, Any, Union
 import uvicorn
+import asyncio
+import contextlib
+import json
 import os
+import time
 from dotenv import load_dotenv
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sse_starlette.sse import EventSourceResponse
+from pydantic import ValidationError
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,8 +22,43 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("OPENAI_API_KEY environment variable is required")
 
+# Per-task timeout (seconds) for the /process fan-out
+PROCESS_TASK_TIMEOUT = float(os.getenv("PROCESS_TASK_TIMEOUT", "60"))
+
+# Default and maximum number of articles a /batch request processes at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "128"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
 # Import our news processing agents
-from news_processor import NewsProcessor
+from news_processor import NewsProcessor, ALL_TASK_KEYS, TASKS
+from agents import Runner
+from cache import get_result_cache
+from coalesce import get_single_flight
+from prompts import get_prompt_registry
+from structured import get_output_stats
+from schemas import CategoryResponse, QuizChoice, QuizResponse, QuizSetResponse, SummaryResponse, TokenUsage
+from scheduler import PRIORITIES, priority as llm_priority
+import metrics
+import tokens
+from local_classifier import get_local_fast_path
+from jobs import JobStore, JobWorkerPool
+from quiz_set import check_request as check_quiz_request
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Start the background tasks with the server and stop them, then the LLM clients, with it"""
+    # Watch event loop lag while the server runs
+    loop_monitor = asyncio.ensure_future(metrics.monitor_event_loop())
+    job_workers.start()
+    try:
+        yield
+    finally:
+        # Jobs still running go back to the queue and are picked up after the restart
+        await job_workers.close()
+        loop_monitor.cancel()
+        # Close the pooled LLM connections
+        await Runner.aclose()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -25,7 +67,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url=None,  # disable default docs endpoint
     redoc_url=None,  # disable default redoc endpoint
-    openapi_url="/static/openapi.json"  # serve openapi.json from /static
+    openapi_url="/static/openapi.json",  # serve openapi.json from /static
+    lifespan=lifespan,
 )
 
 # Mount static files directory
@@ -36,90 +79,255 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 # Initialize our news processor agent
 news_processor = NewsProcessor(api_key=api_key)
 
+# Count and time every request for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Export the cache, coalescing, classifier and scheduler counters at scrape time
+metrics.register_stats({
+    "cache": lambda: get_result_cache() and get_result_cache().get_stats(),
+    "coalescing": lambda: get_single_flight().get_stats(),
+    "classifier": lambda: get_local_fast_path() and get_local_fast_path().get_stats(),
+    "scheduler": lambda: Runner.get_scheduler(api_key).get_stats(),
+})
+
 # Define request and response models
 class NewsTextRequest(BaseModel):
     text: str
+    bypass_cache: bool = False
+    priority: str = "interactive"
+
+class QuizRequest(NewsTextRequest):
+    # More than one question, or a difficulty mix, returns a QuizSetResponse from a single completion
+    count: Optional[int] = None
+    difficulty: Optional[Dict[str, int]] = None
 
-class CategoryResponse(BaseModel):
-    main_category: str
-    subcategory: str
-    explanation: str
+class ProcessRequest(NewsTextRequest):
+    timeout: Optional[float] = None
+    single_call: bool = False
 
-class QuizChoice(BaseModel):
-    A: str
-    B: str
-    C: str
-    D: str
+class BatchItem(BaseModel):
+    id: str
+    text: str
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    tasks: List[str] = ["CATEGORIZE", "QUIZ", "SUMMARIZE"]
+    concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+    single_call: bool = False
+    bypass_cache: bool = False
+    priority: str = "bulk"
 
-class QuizResponse(BaseModel):
-    question: str
-    choices: QuizChoice
-    correct_answer: str
-    explanation: str
+class JobRequest(BatchRequest):
+    callback_url: Optional[AnyHttpUrl] = None
 
-class SummaryResponse(BaseModel):
-    summary: str
-    key_points: List[str]
-    entities: List[str]
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    items: int
+    items_done: int
+    attempts: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    callback_url: Optional[str] = None
+    callback_status: Optional[str] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
 
 class ErrorResponse(BaseModel):
     error: str
     raw_output: Optional[str] = None
 
+class TaskStatus(BaseModel):
+    status: str
+    duration_ms: float
+    error: Optional[str] = None
+
+class ProcessResponse(BaseModel):
+    categorization: Optional[Dict[str, Any]] = None
+    quiz: Optional[Dict[str, Any]] = None
+    summary: Optional[Dict[str, Any]] = None
+    tasks: Dict[str, TaskStatus]
+    token_usage: Optional[TokenUsage] = None
+    duration_ms: float
+
 # Root endpoint - redirect to OpenAPI documentation
 @app.get("/", include_in_schema=False)
 async def root():
     return RedirectResponse(url="/static/openapi.html")
 
+def _priority(request):
+    """Scheduling priority class for the LLM calls made while serving request"""
+    if request.priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority: {request.priority}. Must be one of: {', '.join(PRIORITIES)}")
+    return llm_priority(request.priority)
+
 # Define API endpoints
 @app.post("/categorize", response_model=Union[CategoryResponse, ErrorResponse])
 async def categorize_news(request: NewsTextRequest):
     """Categorize news text into predefined categories and subcategories"""
-    try:
-        result = news_processor.categorize(request.text)
-        if "error" in result:
-            return ErrorResponse(**result)
-        return CategoryResponse(**result)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with _priority(request):
+        try:
+            result = await news_processor.acategorize(request.text, use_cache=not request.bypass_cache)
+            if "error" in result:
+                return ErrorResponse(**result)
+            return CategoryResponse(**result)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/quiz", response_model=Union[QuizResponse, ErrorResponse])
-async def generate_quiz(request: NewsTextRequest):
-    """Generate a multiple-choice quiz question based on news text"""
-    try:
-        result = news_processor.generate_quiz(request.text)
-        if "error" in result:
-            return ErrorResponse(**result)
-        return QuizResponse(**result)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.post("/quiz", response_model=Union[QuizResponse, QuizSetResponse, ErrorResponse])
+async def generate_quiz(request: QuizRequest):
+    """
+    Generate a multiple-choice quiz question based on news text
+
+    With `count` above 1 or a `difficulty` mix, returns that many distinct
+    questions generated in one completion and deduplicated against each other.
+    """
+    question_set = request.count not in (None, 1) or bool(request.difficulty)
+    if question_set:
+        _, _, _, error = check_quiz_request(request.count, request.difficulty)
+        if error:
+            raise HTTPException(status_code=400, detail=error["error"])
+    with _priority(request):
+        try:
+            if question_set:
+                result = await news_processor.agenerate_quiz_set(request.text, count=request.count,
+                                                                 difficulty=request.difficulty,
+                                                                 use_cache=not request.bypass_cache)
+                if "error" in result:
+                    return ErrorResponse(**result)
+                return QuizSetResponse(**result)
+            result = await news_processor.agenerate_quiz(request.text, use_cache=not request.bypass_cache)
+            if "error" in result:
+                return ErrorResponse(**result)
+            return QuizResponse(**result)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/summarize", response_model=Union[SummaryResponse, ErrorResponse])
 async def summarize_news(request: NewsTextRequest):
     """Generate a summary of news text with key points and entities"""
+    with _priority(request):
+        try:
+            result = await news_processor.asummarize(request.text, use_cache=not request.bypass_cache)
+            if "error" in result:
+                return ErrorResponse(**result)
+            return SummaryResponse(**result)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+def _stream_events(task, request, response_model):
+    """
+    Server-sent events for a streamed task.
+
+    Emits a `token` event ({"delta": ...}) for each piece of model output, then one
+    `result` event with the validated JSON object, or an `error` event if the output
+    could not be parsed or validated.
+    """
+    request_priority = _priority(request)
+
+    async def events():
+        with request_priority:
+            try:
+                async for kind, data in news_processor.astream(request.text, task=task,
+                                                               use_cache=not request.bypass_cache):
+                    if kind == "token":
+                        yield {"event": "token", "data": json.dumps({"delta": data})}
+                    elif "error" in data:
+                        yield {"event": "error", "data": ErrorResponse(**data).model_dump_json()}
+                    else:
+                        try:
+                            yield {"event": "result", "data": response_model(**data).model_dump_json()}
+                        except ValidationError as e:
+                            error = ErrorResponse(error=f"Invalid {task.lower()} result: {e}", raw_output=json.dumps(data))
+                            yield {"event": "error", "data": error.model_dump_json()}
+            except Exception as e:
+                yield {"event": "error", "data": ErrorResponse(error=str(e) or type(e).__name__).model_dump_json()}
+
+    return EventSourceResponse(events())
+
+@app.post("/quiz/stream")
+async def generate_quiz_stream(request: NewsTextRequest):
+    """Generate a quiz question, streaming model tokens over server-sent events"""
+    return _stream_events("QUIZ", request, QuizResponse)
+
+@app.post("/summarize/stream")
+async def summarize_news_stream(request: NewsTextRequest):
+    """Summarize news text, streaming model tokens over server-sent events"""
+    return _stream_events("SUMMARIZE", request, SummaryResponse)
+
+async def _run_task(coro, timeout):
+    """Run one task under a timeout and report its result and status"""
+    started = time.perf_counter()
+    result, status, error = None, "ok", None
     try:
-        result = news_processor.summarize(request.text)
+        result = await asyncio.wait_for(coro, timeout)
         if "error" in result:
-            return ErrorResponse(**result)
-        return SummaryResponse(**result)
+            status, error = "error", result["error"]
+    except asyncio.TimeoutError:
+        status, error = "timeout", f"Timed out after {timeout}s"
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        status, error = "error", str(e)
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    return result, TaskStatus(status=status, duration_ms=duration_ms, error=error)
 
-@app.post("/process", response_model=Dict[str, Any])
-async def process_all(request: NewsTextRequest):
-    """Process news text with all available methods: categorize, quiz, and summarize"""
-    try:
-        categorization = news_processor.categorize(request.text)
-        quiz = news_processor.generate_quiz(request.text)
-        summary = news_processor.summarize(request.text)
-        
-        return {
-            "categorization": categorization,
-            "quiz": quiz,
-            "summary": summary
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def _process_single_call(text, timeout, use_cache, names=tuple(ALL_TASK_KEYS)):
+    """Run TASK: ALL and split the combined result into per-task results and statuses"""
+    combined, status = await _run_task(news_processor.aprocess_all(text, use_cache=use_cache), timeout)
+    response = {"tasks": {}}
+    if status.status == "ok":
+        # One completion served every task, so its input token usage is reported once
+        response["token_usage"] = combined.get("token_usage")
+    for name in names:
+        result = None
+        task_status = status
+        if status.status == "ok":
+            result = combined.get(name)
+            if not isinstance(result, dict):
+                result = None
+                task_status = TaskStatus(status="error", duration_ms=status.duration_ms,
+                                         error=f"Missing {name} in combined result")
+            elif "error" in result:
+                task_status = TaskStatus(status="error", duration_ms=status.duration_ms,
+                                         error=result["error"])
+        response[name] = result
+        response["tasks"][name] = task_status
+    return response
+
+async def _process_fan_out(text, timeout, use_cache, names=tuple(ALL_TASK_KEYS)):
+    """Run the tasks as separate concurrent completions"""
+    outcomes = await asyncio.gather(*(
+        _run_task(news_processor.aprocess(text, task=ALL_TASK_KEYS[name], use_cache=use_cache), timeout)
+        for name in names
+    ))
+
+    response = {"tasks": {}}
+    for name, (result, status) in zip(names, outcomes):
+        response[name] = result
+        response["tasks"][name] = status
+    return response
+
+@app.post("/process", response_model=ProcessResponse)
+async def process_all(request: ProcessRequest):
+    """
+    Process news text with all available methods: categorize, quiz, and summarize
+
+    By default the three tasks run concurrently, each under its own timeout. With
+    `single_call` they are answered by one TASK: ALL completion instead, so the
+    article is only sent to the model once. A failed or timed out task does not
+    fail the request: its result is null and its entry in `tasks` carries the
+    status, duration and error.
+    """
+    timeout = request.timeout or PROCESS_TASK_TIMEOUT
+    started = time.perf_counter()
+    with _priority(request):
+        if request.single_call:
+            response = await _process_single_call(request.text, timeout, not request.bypass_cache)
+        else:
+            response = await _process_fan_out(request.text, timeout, not request.bypass_cache)
+    response["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return ProcessResponse(**response)
 
 # Health check endpoint
 @app.get("/health")
@@ -127,6 +335,175 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "version": "1.0.0"}
 
+async def _process_batch_item(item, names, timeout, single_call, use_cache, semaphore):
+    """Process one batch item once a concurrency slot is free; never raises"""
+    async with semaphore:
+        started = time.perf_counter()
+        if single_call:
+            response = await _process_single_call(item.text, timeout, use_cache, names)
+        else:
+            response = await _process_fan_out(item.text, timeout, use_cache, names)
+    statuses = response.pop("tasks")
+    failed = sum(status.status != "ok" for status in statuses.values())
+    return {
+        "id": item.id,
+        "status": "ok" if not failed else ("error" if failed == len(names) else "partial"),
+        **response,
+        "tasks": {name: status.model_dump() for name, status in statuses.items()},
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def _batch_task_names(request):
+    """Result names (categorization, quiz, summary) of the tasks a batch asks for; 400 for invalid requests"""
+    task_names = [task.upper() for task in request.tasks]
+    invalid = [task for task in task_names if task not in ALL_TASK_KEYS.values()]
+    if invalid or not task_names:
+        valid = [task for task in TASKS if task != "ALL"]
+        raise HTTPException(status_code=400, detail=f"Invalid tasks: {invalid or task_names}. Must be any of: {', '.join(valid)}")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {BATCH_MAX_ITEMS} items")
+    return [name for name, task in ALL_TASK_KEYS.items() if task in task_names]
+
+@app.post("/batch")
+async def process_batch(request: BatchRequest):
+    """
+    Process a list of articles and stream the results back as NDJSON
+
+    Articles are processed with bounded concurrency and each result line is
+    written as soon as its article finishes, so lines arrive in completion order,
+    not request order. Every line carries the article `id`, an overall `status`
+    (ok, partial or error), the requested task results and a per-task status and
+    timing breakdown. A failing article never fails the batch.
+    """
+    names = _batch_task_names(request)
+    timeout = request.timeout or PROCESS_TASK_TIMEOUT
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    request_priority = _priority(request)
+
+    async def stream():
+        # Item tasks inherit the priority class from the context they are created in
+        with request_priority:
+            pending = [
+                asyncio.ensure_future(_process_batch_item(item, names, timeout, request.single_call,
+                                                          not request.bypass_cache, semaphore))
+                for item in request.items
+            ]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Stop outstanding work if the client goes away mid-stream
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def _process_job(request, report_progress):
+    """Run a queued job: its items are processed like a /batch request and returned in request order"""
+    request = JobRequest(**request)
+    names = _batch_task_names(request)
+    timeout = request.timeout or PROCESS_TASK_TIMEOUT
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def process_item(item):
+        nonlocal done
+        result = await _process_batch_item(item, names, timeout, request.single_call, not request.bypass_cache,
+                                           semaphore)
+        done += 1
+        report_progress(done)
+        return result
+
+    with _priority(request):
+        results = await asyncio.gather(*(process_item(item) for item in request.items))
+    counts = {status: sum(result["status"] == status for result in results) for status in ("ok", "partial", "error")}
+    return {"items": results, **counts}
+
+# Persistent job queue, worked through by a pool of workers inside the server
+job_store = JobStore()
+job_workers = JobWorkerPool(job_store, _process_job)
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(request: JobRequest):
+    """
+    Queue a list of articles for processing and return the job right away
+
+    Takes the same fields as /batch plus an optional `callback_url`. The job is
+    stored persistently and processed by the server's worker pool; poll
+    `GET /jobs/{id}` for its status and result, or wait for the finished job to
+    be POSTed to `callback_url`. Queued and interrupted jobs survive a restart.
+    """
+    # Reject invalid tasks and priorities now rather than when a worker picks the job up
+    _batch_task_names(request)
+    _priority(request)
+    callback_url = str(request.callback_url) if request.callback_url else None
+    job = await asyncio.to_thread(job_store.create, request.model_dump(mode="json"), len(request.items), callback_url)
+    job_workers.notify()
+    return job
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """Number of jobs per status"""
+    return await asyncio.to_thread(job_store.get_stats)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Status and progress of a job, with its per-item results once it is done"""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+# Result cache statistics
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and sizes of the result cache"""
+    cache = get_result_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+# Request coalescing statistics
+@app.get("/coalescing/stats")
+async def coalescing_stats():
+    """How many requests shared an in-flight completion instead of starting their own"""
+    return get_single_flight().get_stats()
+
+# Local categorizer statistics
+@app.get("/classifier/stats")
+async def classifier_stats():
+    """How often the local categorizer answered versus fell back to the LLM"""
+    fast_path = get_local_fast_path()
+    if fast_path is None:
+        return {"enabled": False}
+    return {"enabled": True, **fast_path.get_stats()}
+
+# Structured output statistics
+@app.get("/output/stats")
+async def output_stats():
+    """Per task: outputs that parsed cleanly, were repaired locally or were invalid, and targeted retries"""
+    return get_output_stats().get_stats()
+
+# LLM scheduler statistics
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Dispatch, retry and rate limit counters, queue depth per priority class and per-key budgets"""
+    return Runner.get_scheduler(api_key).get_stats()
+
+# Prometheus metrics
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Request, task and upstream LLM counters and latency histograms in the Prometheus text format"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Prompt registry report
+@app.get("/prompts")
+async def prompt_report():
+    """Version hash and token count of each task prompt, and the input tokens it saves per call"""
+    return {"exact_token_counts": tokens.is_exact(), "prompts": get_prompt_registry().report()}
+
 # Run the server if this file is executed directly
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
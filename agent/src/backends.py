@@ -0,0 +1,100 @@
+import importlib
+import os
+
+import httpx
+import openai
+
+# Which completion backend the Runner uses: "openai" (default), "fake", or "module:ClassName"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# Connection settings, overridable through the environment
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "256"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+def _http_limits():
+    # Keep enough idle connections around to serve a full concurrency window
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONCURRENCY,
+        max_keepalive_connections=LLM_MAX_CONCURRENCY,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+def _http_timeout():
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+class CompletionBackend:
+    """
+    Where the Runner sends chat completions.
+
+    A backend hands out clients with the OpenAI SDK surface the Runner uses:
+    `client.chat.completions.create(model=..., messages=..., timeout=..., stream=...,
+    response_format=...)` returning a chat completion (or, with stream=True, an async
+    iterable of chunks with a `close()` method), `client.close()`, and OpenAI SDK
+    exceptions for failures so retries and rate limiting behave the same.
+    """
+    name = None
+
+    def create_sync_client(self, api_key):
+        raise NotImplementedError
+
+    def create_async_client(self, api_key):
+        """Called once per API key and event loop"""
+        raise NotImplementedError
+
+class OpenAIBackend(CompletionBackend):
+    """The OpenAI API, or any compatible server set through OPENAI_BASE_URL"""
+    name = "openai"
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+
+    def create_sync_client(self, api_key):
+        return openai.OpenAI(
+            api_key=api_key,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=httpx.Client(limits=_http_limits(), timeout=_http_timeout()),
+        )
+
+    def create_async_client(self, api_key):
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=httpx.AsyncClient(http2=True, limits=_http_limits(), timeout=_http_timeout()),
+        )
+
+class FakeBackend(CompletionBackend):
+    """
+    In-process fake of the OpenAI API (see fake_openai.py): schema-valid canned
+    answers with configurable latency and error rates, no network and no cost.
+    """
+    name = "fake"
+
+    def __init__(self, fake=None):
+        from fake_openai import FakeLLM
+
+        self.fake = fake or FakeLLM()
+
+    def create_sync_client(self, api_key):
+        from fake_openai import FakeSyncClient
+
+        return FakeSyncClient(self.fake)
+
+    def create_async_client(self, api_key):
+        from fake_openai import FakeAsyncClient
+
+        return FakeAsyncClient(self.fake)
+
+BACKENDS = {"openai": OpenAIBackend, "fake": FakeBackend}
+
+def load_backend(spec=LLM_BACKEND):
+    """Instantiate the backend named by spec: a key of BACKENDS or "module:ClassName" """
+    if spec in BACKENDS:
+        return BACKENDS[spec]()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown LLM backend: {spec}. Use one of {', '.join(BACKENDS)} or module:ClassName")
+    return getattr(importlib.import_module(module_name), class_name)()
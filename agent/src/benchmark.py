@@ -0,0 +1,211 @@
+"""
+Load benchmark for the agent API.
+
+Drives /categorize, /quiz, /summarize and /process at each requested concurrency
+level and reports throughput and p50/p95/p99 latency. While each run is going,
+/health is polled in the background: its latency should stay flat, so a high
+`health_p99` points at something blocking the event loop.
+
+By default the benchmark is fully offline. It starts the fake OpenAI server
+(fake_openai.py) and the API against it, with the result cache disabled, and
+stops both afterwards:
+
+    python benchmark.py --concurrency 1,16,64 --requests 200 --latency lognormal:0.8,0.4
+
+With --in-process the API uses the in-process fake backend (LLM_BACKEND=fake)
+instead of the HTTP server. With --url, an already running API is benchmarked
+as-is.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+ENDPOINTS = ["categorize", "quiz", "summarize", "process"]
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = """government minister announced plan budget city council company shares market rose fell percent
+report study researchers found university hospital patients climate energy wind solar project court ruled
+police said officials election voters campaign team season coach match players league record launch rocket
+mission space agency technology startup investors funding million billion year week today country region""".split()
+NAMES = ["Alice Moreno", "Jakarta", "Siemens", "Nairobi", "Olympic Committee", "Kenji Sato", "Brazil", "NASA"]
+
+def make_article(rng, words):
+    """A synthetic article of roughly the given number of words"""
+    sentences = []
+    while sum(len(s.split()) for s in sentences) < words:
+        body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+        sentences.append(f"{rng.choice(NAMES)} {body} {rng.randint(2, 9999)}.")
+    return " ".join(sentences)
+
+def percentile(values, p):
+    """Nearest-rank percentile of values (0 for no values)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+async def probe_health(client, url, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get(f"{url}/health")
+            latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+
+async def run_level(client, url, endpoint, concurrency, articles, bypass_cache):
+    """Send every article to endpoint with the given number of concurrent workers"""
+    queue = list(articles)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            text = queue.pop()
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/{endpoint}", json={"text": text, "bypass_cache": bypass_cache})
+                body = response.json()
+                failed = response.status_code != 200 or "error" in body or (
+                    endpoint == "process" and any(t["status"] != "ok" for t in body["tasks"].values()))
+            except (httpx.HTTPError, ValueError):
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    health, stop = [], asyncio.Event()
+    prober = asyncio.ensure_future(probe_health(client, url, stop, health))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0) * 1000, 1),
+        "health_p99_ms": round(percentile(health, 99) * 1000, 1),
+    }
+
+async def run_benchmark(args, url):
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 8)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        results = []
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                # Fresh articles per run so neither the cache nor coalescing hides the model latency;
+                # --duplicate-rate reuses some to measure them on purpose
+                articles = []
+                for _ in range(args.requests):
+                    if articles and rng.random() < args.duplicate_rate:
+                        articles.append(rng.choice(articles))
+                    else:
+                        articles.append(make_article(rng, args.article_words))
+                result = await run_level(client, url, endpoint, concurrency, articles, args.bypass_cache)
+                results.append(result)
+                print_row(result)
+        return results
+
+COLUMNS = ["endpoint", "concurrency", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+           "health_p99_ms"]
+
+def print_header():
+    print("  ".join(f"{c:>14}" for c in COLUMNS))
+
+def print_row(result):
+    print("  ".join(f"{result[c]:>14}" for c in COLUMNS), flush=True)
+
+def wait_ready(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process for {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+def start_services(args):
+    """Start the fake OpenAI server (unless --in-process) and the API; returns (api url, processes)"""
+    fake_options = ["--latency", args.latency, "--rate-limit-rate", str(args.rate_limit_rate),
+                    "--error-rate", str(args.error_rate), "--malformed-rate", str(args.malformed_rate),
+                    "--seed", str(args.seed)]
+    env = {**os.environ, "OPENAI_API_KEY": "fake", "RESULT_CACHE_ENABLED": "0"}
+    processes = []
+    if args.in_process:
+        env.update({"LLM_BACKEND": "fake", "FAKE_LLM_LATENCY": args.latency,
+                    "FAKE_LLM_RATE_LIMIT_RATE": str(args.rate_limit_rate), "FAKE_LLM_ERROR_RATE": str(args.error_rate),
+                    "FAKE_LLM_MALFORMED_RATE": str(args.malformed_rate), "FAKE_LLM_SEED": str(args.seed)})
+    else:
+        fake = subprocess.Popen([sys.executable, "fake_openai.py", "--port", str(args.fake_port), *fake_options],
+                                cwd=SRC_DIR)
+        processes.append(fake)
+        wait_ready(f"http://127.0.0.1:{args.fake_port}/stats", fake)
+        env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.fake_port}/v1"
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "api:app", "--port", str(args.api_port),
+                            "--log-level", "warning"], cwd=SRC_DIR, env=env)
+    processes.append(api)
+    url = f"http://127.0.0.1:{args.api_port}"
+    wait_ready(f"{url}/health", api)
+    return url, processes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent API against a fake OpenAI backend")
+    parser.add_argument("--url", help="Benchmark a running API instead of starting one against the fake backend")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated endpoints to drive")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--article-words", type=int, default=300)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Share of requests that repeat an article")
+    parser.add_argument("--bypass-cache", action="store_true", help="Send bypass_cache with every request")
+    parser.add_argument("--timeout", type=float, default=120, help="Client timeout per request in seconds")
+    parser.add_argument("--in-process", action="store_true", help="Use LLM_BACKEND=fake instead of the fake server")
+    parser.add_argument("--latency", default="lognormal:0.8,0.4", help="Fake completion latency distribution")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--fake-port", type=int, default=9911)
+    parser.add_argument("--api-port", type=int, default=9920)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    args.endpoints = [e.strip().strip("/") for e in args.endpoints.split(",") if e.strip()]
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    processes = []
+    try:
+        url = args.url.rstrip("/") if args.url else None
+        if url is None:
+            url, processes = start_services(args)
+        print_header()
+        results = asyncio.run(run_benchmark(args, url))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
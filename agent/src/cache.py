@@ -0,0 +1,176 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Cache settings, overridable through the environment
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(os.path.dirname(__file__), "result_cache.sqlite3"))
+RESULT_CACHE_MEMORY_SIZE = int(os.getenv("RESULT_CACHE_MEMORY_SIZE", "1024"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ROWS = int(os.getenv("RESULT_CACHE_MAX_ROWS", "100000"))
+
+# Run disk eviction once every this many writes
+EVICT_EVERY = 100
+
+def normalize_text(text):
+    """Normalize news text so that whitespace-only differences share a cache entry"""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def make_key(text, task, prompt_version, model):
+    """Content-addressed key for a result: normalized text, task, prompt version and model"""
+    payload = "\x1f".join([text_hash(normalize_text(text)), task.upper(), prompt_version, model])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    Two-tier cache for agent results.
+
+    A bounded in-memory LRU sits in front of a SQLite table. Entries expire after
+    `ttl` seconds, and the table is trimmed back to `max_rows` entries (least
+    recently used first). Only JSON-serializable results should be stored; callers
+    get their own copy of a cached result.
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, memory_size=RESULT_CACHE_MEMORY_SIZE,
+                 ttl=RESULT_CACHE_TTL, max_rows=RESULT_CACHE_MAX_ROWS):
+        self.path = path
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+
+    def _memory_get(self, key, now):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if now - created_at > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        now = time.time()
+        with self._lock:
+            value = self._memory_get(key, now)
+            if value is not None:
+                self.stats["memory_hits"] += 1
+                return copy.deepcopy(value)
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                    value = json.loads(row[0])
+                    self._memory_set(key, value, row[1])
+                    self.stats["disk_hits"] += 1
+                    return copy.deepcopy(value)
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """Store a result under key in both tiers"""
+        now = time.time()
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._memory_set(key, value, now)
+            self.stats["writes"] += 1
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        """Drop expired rows, then the least recently used rows above max_rows"""
+        expired = self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,)).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        ).rowcount
+        self.stats["evictions"] += expired + overflow
+
+    async def aget(self, key):
+        """get() for async callers: memory hits return directly, disk lookups run in a thread"""
+        with self._lock:
+            value = self._memory_get(key, time.time())
+            if value is not None:
+                self.stats["memory_hits"] += 1
+                return copy.deepcopy(value)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self.set, key, value)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM results")
+
+    def get_stats(self):
+        """Hit/miss counters plus the current size of each tier"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = (
+                self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] if self._conn is not None else 0
+            )
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Process-wide result cache shared by all agents, or None when caching is disabled"""
+    global _default_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
@@ -0,0 +1,55 @@
+import asyncio
+import copy
+import threading
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one.
+
+    The first caller for a key starts the work; callers arriving while it is still
+    running wait for the same result instead of starting their own. An exception is
+    raised to every waiter. The work runs as its own task, so a waiter that is
+    cancelled (for example by its own timeout) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key, factory):
+        """Return the result of factory() for key, sharing it with concurrent callers"""
+        with self._lock:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(factory())
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._forget(key, task))
+                self.stats["leaders"] += 1
+                leader = True
+            else:
+                self.stats["coalesced"] += 1
+                leader = False
+
+        result = await asyncio.shield(task)
+        # Followers get their own copy so that nobody mutates a shared result
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._inflight)
+        total = stats["leaders"] + stats["coalesced"]
+        stats["coalesced_ratio"] = round(stats["coalesced"] / total, 4) if total else 0.0
+        return stats
+
+_single_flight = SingleFlight()
+
+def get_single_flight():
+    """Process-wide SingleFlight shared by all agents"""
+    return _single_flight
@@ -0,0 +1,367 @@
+"""
+Fake OpenAI chat completions API for load tests and offline development.
+
+Answers are canned but schema-valid for every task prompt in prompts.py, and are
+derived from the article so that different articles get different answers.
+Latency follows a configurable distribution, and a configurable share of calls
+fail with 429 (with Retry-After) or 500, or come back as malformed JSON.
+
+Use it in-process with LLM_BACKEND=fake, or run it as a server and point the
+agent at it:
+
+    python fake_openai.py --port 9911 --latency lognormal:0.8,0.4 --rate-limit-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:9911/v1 OPENAI_API_KEY=fake uvicorn api:app
+
+Latency distributions: fixed:SECONDS, uniform:LOW,HIGH, normal:MEAN,STD,
+lognormal:MEDIAN,SIGMA and exponential:MEAN.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from prompts import get_prompt_registry
+from tokens import count_tokens
+
+# Defaults, overridable through the environment or the command line
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "lognormal:0.8,0.4")
+FAKE_LLM_TOKEN_DELAY = float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.005"))
+FAKE_LLM_RATE_LIMIT_RATE = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_MALFORMED_RATE = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+FAKE_LLM_RETRY_AFTER = float(os.getenv("FAKE_LLM_RETRY_AFTER", "1"))
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+ENTITY_RE = re.compile(r"\b[A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*")
+# "Write 5 questions (...), plus 1 spare questions" as sent with QUIZ_SET
+QUESTION_COUNT_RE = re.compile(r"Write (\d+) questions(?:.*?plus (\d+) spare)?")
+
+class LatencyDistribution:
+    """Samples call latencies in seconds from a distribution given as "name:param,param" """
+
+    def __init__(self, spec, rng):
+        self.spec = spec
+        self.rng = rng
+        name, _, params = spec.partition(":")
+        self.name = name
+        self.params = [float(p) for p in params.split(",") if p]
+        samplers = {
+            "fixed": lambda seconds: seconds,
+            "uniform": lambda low, high: rng.uniform(low, high),
+            "normal": lambda mean, std: rng.gauss(mean, std),
+            "lognormal": lambda median, sigma: rng.lognormvariate(math.log(median), sigma),
+            "exponential": lambda mean: rng.expovariate(1 / mean),
+        }
+        if name not in samplers:
+            raise ValueError(f"Unknown latency distribution: {name}. Use one of {', '.join(samplers)}")
+        self._sample = samplers[name]
+
+    def sample(self):
+        return max(0.0, self._sample(*self.params))
+
+class FakeReply:
+    """What the fake decided for one call: an error status, or content after a delay"""
+
+    def __init__(self, status, delay, content=None, prompt_tokens=0, retry_after=None):
+        self.status = status
+        self.delay = delay
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.retry_after = retry_after
+
+class FakeLLM:
+    """Decides the latency, outcome and content of each fake completion"""
+
+    def __init__(self, latency=FAKE_LLM_LATENCY, token_delay=FAKE_LLM_TOKEN_DELAY,
+                 rate_limit_rate=FAKE_LLM_RATE_LIMIT_RATE, error_rate=FAKE_LLM_ERROR_RATE,
+                 malformed_rate=FAKE_LLM_MALFORMED_RATE, retry_after=FAKE_LLM_RETRY_AFTER, seed=FAKE_LLM_SEED):
+        self.rng = random.Random(seed)
+        self.latency = LatencyDistribution(latency, self.rng)
+        self.token_delay = token_delay
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.retry_after = retry_after
+        self.prompts = {prompt.text: task for task, prompt in get_prompt_registry().prompts.items()}
+        self.categories = get_prompt_registry().categories_data["categories"]
+        self.stats = {"completions": 0, "rate_limited": 0, "errors": 0, "malformed": 0}
+
+    # Content
+
+    def _task(self, system):
+        task = self.prompts.get(system)
+        if task:
+            return task
+        # Unknown prompt: guess from the JSON format it asks for
+        for marker, task in (('"categorization"', "ALL"), ('"notes"', "CONDENSE"), ('"main_category"', "CATEGORIZE"),
+                             ('"questions"', "QUIZ_SET"), ('"question"', "QUIZ")):
+            if marker in system:
+                return task
+        return "SUMMARIZE"
+
+    def _article(self, user):
+        return user.split("NEWS TEXT:\n", 1)[-1].strip()
+
+    def _pick(self, article, options, salt=""):
+        digest = hashlib.sha256((salt + article).encode("utf-8")).digest()
+        return options[digest[0] % len(options)]
+
+    def _categorize(self, article):
+        category = self._pick(article, self.categories)
+        subcategory = self._pick(article, category["subcategories"], "sub")
+        return {"main_category": category["name"], "subcategory": subcategory,
+                "explanation": f"The article is mainly about {subcategory.lower()}."}
+
+    def _quiz(self, article, sentences):
+        fact = sentences[0][:160] if sentences else "The article reports a recent event."
+        answer = self._pick(article, ["A", "B", "C", "D"], "answer")
+        distractors = iter(["The article does not mention this.", "The opposite of what was reported happened.",
+                            "The event was postponed indefinitely."])
+        choices = {letter: fact if letter == answer else next(distractors) for letter in "ABCD"}
+        return {"question": "Which of the following statements is reported in the article?", "choices": choices,
+                "correct_answer": answer, "explanation": f"The article states: {fact}"}
+
+    def _quiz_set(self, article, sentences, user):
+        # One question per sentence; short articles repeat sentences, which dedupe_questions drops
+        match = QUESTION_COUNT_RE.search(user)
+        count = int(match.group(1)) + int(match.group(2) or 0) if match else 3
+        questions = []
+        for i in range(count):
+            fact = sentences[i % len(sentences)] if sentences else "the article reports a recent event"
+            question = self._quiz(article + str(i), [fact])
+            question["question"] = f"Which statement about \"{' '.join(fact.split()[:6])}\" is reported in the article?"
+            question["difficulty"] = ("easy", "medium", "hard")[i % 3]
+            questions.append(question)
+        return {"questions": questions}
+
+    def _summarize(self, article, sentences):
+        entities = list(dict.fromkeys(ENTITY_RE.findall(article)))[:5] or ["Unknown"]
+        return {"summary": " ".join(sentences[:2])[:400] or article[:400], "key_points": sentences[:3] or [article[:200]],
+                "entities": entities}
+
+    def answer(self, messages):
+        """Schema-valid JSON answer for the task prompt in messages"""
+        task = self._task(messages[0]["content"])
+        article = self._article(messages[-1]["content"])
+        sentences = [s.strip() for s in SENTENCE_RE.split(article) if s.strip()]
+        if task == "CATEGORIZE":
+            result = self._categorize(article)
+        elif task == "QUIZ":
+            result = self._quiz(article, sentences)
+        elif task == "QUIZ_SET":
+            result = self._quiz_set(article, sentences, messages[-1]["content"])
+        elif task == "CONDENSE":
+            result = {"notes": " ".join(sentences[:3])[:600] or article[:600]}
+        elif task == "ALL":
+            result = {"categorization": self._categorize(article), "quiz": self._quiz(article, sentences),
+                      "summary": self._summarize(article, sentences)}
+        else:
+            result = self._summarize(article, sentences)
+        return json.dumps(result)
+
+    def _malform(self, content):
+        kind = self.rng.choice(["fence", "prose", "truncate"])
+        if kind == "fence":
+            return f"```json\n{content}\n```"
+        if kind == "prose":
+            return f"Here is the JSON you asked for:\n{content}\nLet me know if you need anything else."
+        return content[:max(1, len(content) - self.rng.randint(2, 20))]
+
+    # Calls
+
+    def reply(self, messages):
+        """Decide the outcome of one call"""
+        self.stats["completions"] += 1
+        delay = self.latency.sample()
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return FakeReply(429, min(delay, 0.05), retry_after=self.retry_after)
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            return FakeReply(500, delay)
+        content = self.answer(messages)
+        if self.rng.random() < self.malformed_rate:
+            self.stats["malformed"] += 1
+            content = self._malform(content)
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        return FakeReply(200, delay, content, prompt_tokens)
+
+    @staticmethod
+    def completion(reply, model):
+        return {
+            "id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": reply.content}}],
+            "usage": {"prompt_tokens": reply.prompt_tokens, "completion_tokens": count_tokens(reply.content),
+                      "total_tokens": reply.prompt_tokens + count_tokens(reply.content)},
+        }
+
+    @classmethod
+    def chunks(cls, reply, model, include_usage=False):
+        """
+        Streamed completion chunks, a few characters at a time, then (with
+        stream_options={"include_usage": True}) a last chunk with the usage and no choices
+        """
+        completion_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        for i in range(0, len(reply.content), 8):
+            yield {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                   "choices": [{"index": 0, "delta": {"content": reply.content[i:i + 8]}, "finish_reason": None}]}
+        yield {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+               "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        if include_usage:
+            yield {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                   "choices": [], "usage": cls.completion(reply, model)["usage"]}
+
+    @staticmethod
+    def error_body(reply):
+        if reply.status == 429:
+            return {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}}
+        return {"error": {"message": "The server had an error while processing your request (fake)",
+                          "type": "server_error", "code": None}}
+
+    def error_headers(self, reply):
+        return {"retry-after": str(reply.retry_after)} if reply.retry_after is not None else {}
+
+# In-process clients used by backends.FakeBackend
+
+def _raise_for(fake, reply):
+    """Raise the OpenAI SDK exception a real client would for an error reply"""
+    request = httpx.Request("POST", "http://fake-openai/v1/chat/completions")
+    body = fake.error_body(reply)
+    response = httpx.Response(reply.status, headers=fake.error_headers(reply), json=body, request=request)
+    error_class = openai.RateLimitError if reply.status == 429 else openai.InternalServerError
+    raise error_class(body["error"]["message"], response=response, body=body)
+
+def _timeout_error():
+    return openai.APITimeoutError(request=httpx.Request("POST", "http://fake-openai/v1/chat/completions"))
+
+class _Namespace:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+class FakeAsyncStream:
+    def __init__(self, fake, reply, model, include_usage=False):
+        self.fake = fake
+        self.reply = reply
+        self.model = model
+        self.include_usage = include_usage
+
+    async def __aiter__(self):
+        for chunk in self.fake.chunks(self.reply, self.model, self.include_usage):
+            await asyncio.sleep(self.fake.token_delay)
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    async def close(self):
+        pass
+
+class FakeAsyncClient:
+    """Stands in for openai.AsyncOpenAI"""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.chat = _Namespace(completions=_Namespace(create=self._create))
+
+    async def _create(self, model, messages, timeout=None, stream=False, stream_options=None, **kwargs):
+        reply = self.fake.reply(messages)
+        if timeout is not None and reply.delay > timeout:
+            await asyncio.sleep(timeout)
+            raise _timeout_error()
+        await asyncio.sleep(reply.delay)
+        if reply.status != 200:
+            _raise_for(self.fake, reply)
+        if stream:
+            return FakeAsyncStream(self.fake, reply, model, bool((stream_options or {}).get("include_usage")))
+        return ChatCompletion.model_validate(self.fake.completion(reply, model))
+
+    async def close(self):
+        pass
+
+class FakeSyncClient:
+    """Stands in for openai.OpenAI"""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.chat = _Namespace(completions=_Namespace(create=self._create))
+
+    def _create(self, model, messages, timeout=None, **kwargs):
+        reply = self.fake.reply(messages)
+        if timeout is not None and reply.delay > timeout:
+            time.sleep(timeout)
+            raise _timeout_error()
+        time.sleep(reply.delay)
+        if reply.status != 200:
+            _raise_for(self.fake, reply)
+        return ChatCompletion.model_validate(self.fake.completion(reply, model))
+
+    def close(self):
+        pass
+
+# HTTP server
+
+def create_app(fake):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI(title="Fake OpenAI API", docs_url=None, redoc_url=None)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        reply = fake.reply(body["messages"])
+        await asyncio.sleep(reply.delay)
+        if reply.status != 200:
+            return JSONResponse(fake.error_body(reply), status_code=reply.status, headers=fake.error_headers(reply))
+        if body.get("stream"):
+            async def events():
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                for chunk in fake.chunks(reply, body["model"], include_usage):
+                    await asyncio.sleep(fake.token_delay)
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return fake.completion(reply, body["model"])
+
+    @app.get("/stats")
+    async def stats():
+        return fake.stats
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9911)
+    parser.add_argument("--latency", default=FAKE_LLM_LATENCY, help="Latency distribution (see module docstring)")
+    parser.add_argument("--token-delay", type=float, default=FAKE_LLM_TOKEN_DELAY, help="Seconds between streamed chunks")
+    parser.add_argument("--rate-limit-rate", type=float, default=FAKE_LLM_RATE_LIMIT_RATE, help="Share of calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=FAKE_LLM_ERROR_RATE, help="Share of calls answered with 500")
+    parser.add_argument("--malformed-rate", type=float, default=FAKE_LLM_MALFORMED_RATE,
+                        help="Share of answers wrapped in prose or fences, or cut off")
+    parser.add_argument("--retry-after", type=float, default=FAKE_LLM_RETRY_AFTER, help="Retry-After sent with 429s")
+    parser.add_argument("--seed", default=FAKE_LLM_SEED)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    fake = FakeLLM(latency=args.latency, token_delay=args.token_delay, rate_limit_rate=args.rate_limit_rate,
+                   error_rate=args.error_rate, malformed_rate=args.malformed_rate, retry_after=args.retry_after,
+                   seed=args.seed)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
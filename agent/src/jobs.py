@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import httpx
+
+from scheduler import backoff
+
+# Job settings, overridable through the environment
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(os.path.dirname(__file__), "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# A running job whose worker stopped renewing its lease for this long is picked up again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+# Jobs that were picked up this many times without finishing (e.g. they keep crashing the process) fail
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", "3"))
+# A running job's items_done is written at most once per this many items or seconds
+JOB_PROGRESS_EVERY = int(os.getenv("JOB_PROGRESS_EVERY", "25"))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1"))
+
+# How often idle workers look for jobs created by another process
+POLL_INTERVAL = 1.0
+# Drop finished jobs past their retention once every this many new jobs
+PURGE_EVERY = 100
+
+logger = logging.getLogger(__name__)
+
+class JobStore:
+    """
+    Persistent job queue in a SQLite table.
+
+    Jobs go from queued to running to done or failed. A worker holds a running
+    job under a lease it keeps renewing; when the process dies the lease runs out
+    and the job is claimed again, so queued and interrupted work survives a
+    restart. Finished jobs are kept for `retention` seconds.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, lease=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                 retention=JOB_RETENTION):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._creates = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " request TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " callback_url TEXT,"
+            " callback_status TEXT,"
+            " items INTEGER NOT NULL,"
+            " items_done INTEGER NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_until REAL,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)")
+
+    def create(self, request, items, callback_url=None):
+        """Queue a job for request (a JSON-serializable dict) and return its view"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, request, callback_url, items, created_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, json.dumps(request), callback_url, items, now),
+            )
+            self._creates += 1
+            if self._creates % PURGE_EVERY == 0:
+                self._purge(now)
+        return self.get(job_id)
+
+    def claim(self):
+        """
+        Mark the oldest queued job (or running job with an expired lease) as running
+        and return it with its request, or None when there is nothing to do
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        "SELECT id, request, attempts FROM jobs"
+                        " WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)"
+                        " ORDER BY created_at LIMIT 1",
+                        (now,),
+                    ).fetchone()
+                    if row is None or row[2] < self.max_attempts:
+                        break
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                        (f"Gave up after {row[2]} interrupted attempts", now, row[0]),
+                    )
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, items_done = 0,"
+                        " lease_until = ?, started_at = ? WHERE id = ?",
+                        (now + self.lease, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row[0], "request": json.loads(row[1])}
+
+    def renew(self, job_id):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                               (time.time() + self.lease, job_id))
+
+    def progress(self, job_id, items_done):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET items_done = ? WHERE id = ?", (items_done, job_id))
+
+    def release(self, job_id):
+        """Put a running job back in the queue, e.g. when the server shuts down mid-job"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_until = NULL"
+                " WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def finish(self, job_id, result=None, error=None):
+        """Store the result of a job (status done), or its error (status failed)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                ("failed" if error else "done", None if result is None else json.dumps(result), error, time.time(),
+                 job_id),
+            )
+
+    def set_callback_status(self, job_id, status):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (status, job_id))
+
+    def get(self, job_id):
+        """The job as returned by the API, or None for an unknown ID"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, result, error, callback_url, callback_status, items, items_done, attempts,"
+                " created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        (job_id, status, result, error, callback_url, callback_status, items, items_done, attempts,
+         created_at, started_at, finished_at) = row
+        return {
+            "id": job_id,
+            "status": status,
+            "items": items,
+            "items_done": items if status == "done" else items_done,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "callback_url": callback_url,
+            "callback_status": callback_status,
+            "error": error,
+            "result": None if result is None else json.loads(result),
+        }
+
+    def _purge(self, now):
+        self._conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                           (now - self.retention,))
+
+    def get_stats(self):
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"queued": 0, "running": 0, "done": 0, "failed": 0, **dict(rows)}
+
+class ProgressReporter:
+    """
+    The report_progress callback of a running job. Called on the event loop for
+    every finished item, it writes items_done in a worker thread only every
+    `every` items or `interval` seconds, and never has more than one write in flight.
+    """
+
+    def __init__(self, store, job_id, every=JOB_PROGRESS_EVERY, interval=JOB_PROGRESS_INTERVAL):
+        self.store = store
+        self.job_id = job_id
+        self.every = every
+        self.interval = interval
+        self._reported = 0
+        self._reported_at = time.monotonic()
+        self._write = None
+
+    def __call__(self, items_done):
+        if self._write is not None and not self._write.done():
+            return
+        if items_done - self._reported < self.every and time.monotonic() - self._reported_at < self.interval:
+            return
+        self._reported, self._reported_at = items_done, time.monotonic()
+        self._write = asyncio.ensure_future(asyncio.to_thread(self.store.progress, self.job_id, items_done))
+
+    async def wait(self):
+        """Let the last write finish, so it cannot land after the job's final status"""
+        if self._write is not None:
+            await asyncio.gather(self._write, return_exceptions=True)
+
+class JobWorkerPool:
+    """
+    Processes jobs from a JobStore with a fixed number of asyncio workers.
+
+    `process(request, report_progress)` does the actual work and returns the job
+    result; `report_progress(items_done)` may be called as items finish and only
+    writes to the store now and then (see ProgressReporter). When a
+    job has a callback URL, its final view is POSTed there, retried with backoff.
+    """
+
+    def __init__(self, store, process, workers=JOB_WORKERS):
+        self.store = store
+        self.process = process
+        self.workers = workers
+        self._tasks = []
+        self._wakeup = None
+        self._http = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._http = httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    def notify(self):
+        """Wake an idle worker, e.g. right after a job was queued"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def close(self):
+        """Stop the workers; jobs they were running go back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def _work(self):
+        while True:
+            job = None
+            try:
+                job = await asyncio.to_thread(self.store.claim)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except Exception as e:
+                # Whatever goes wrong with one job must not take its worker down with it
+                logger.exception("Job worker error%s", f" on job {job['id']}" if job else "")
+                if job is not None:
+                    await self._fail(job["id"], f"{type(e).__name__}: {e}")
+                else:
+                    await asyncio.sleep(POLL_INTERVAL)
+
+    async def _fail(self, job_id, error):
+        """Mark a job that is still running as failed, e.g. after an error outside its processing"""
+        try:
+            view = await asyncio.to_thread(self.store.get, job_id)
+            if view and view["status"] == "running":
+                await asyncio.to_thread(self.store.finish, job_id, error=error)
+        except Exception:
+            logger.exception("Could not mark job %s as failed", job_id)
+
+    async def _keep_lease(self, job_id):
+        while True:
+            await asyncio.sleep(self.store.lease / 4)
+            await asyncio.to_thread(self.store.renew, job_id)
+
+    async def _run(self, job):
+        job_id = job["id"]
+        lease = asyncio.ensure_future(self._keep_lease(job_id))
+        progress = ProgressReporter(self.store, job_id)
+        try:
+            result = await self.process(job["request"], progress)
+        except asyncio.CancelledError:
+            await asyncio.shield(asyncio.to_thread(self.store.release, job_id))
+            raise
+        except Exception as e:
+            await progress.wait()
+            await asyncio.to_thread(self.store.finish, job_id, error=f"{type(e).__name__}: {e}")
+        else:
+            await progress.wait()
+            await asyncio.to_thread(self.store.finish, job_id, result)
+        finally:
+            lease.cancel()
+        await self._deliver(job_id)
+
+    async def _deliver(self, job_id):
+        """POST the finished job to its callback URL, if it has one"""
+        view = await asyncio.to_thread(self.store.get, job_id)
+        if not view or not view["callback_url"]:
+            return
+        status = None
+        for attempt in range(JOB_CALLBACK_RETRIES + 1):
+            try:
+                response = await self._http.post(view["callback_url"], json=view, headers={"X-Job-Id": job_id})
+                if response.status_code < 400:
+                    status = "delivered"
+                    break
+                status = f"failed: HTTP {response.status_code}"
+                if response.status_code < 500 and response.status_code != 429:
+                    break
+            except Exception as e:
+                # Not only httpx.HTTPError: a malformed URL raises httpx.InvalidURL, for one
+                status = f"failed: {type(e).__name__}"
+            if attempt < JOB_CALLBACK_RETRIES:
+                await asyncio.sleep(backoff(attempt))
+        await asyncio.to_thread(self.store.set_callback_status, job_id, status)
@@ -0,0 +1,200 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+# Local classifier settings, overridable through the environment
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", os.path.join(os.path.dirname(__file__), "local_classifier.npz"))
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.8"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = set("""
+a an and are as at be been but by for from had has have he her his i if in into is it its
+more most not of on or our she so than that the their them there these they this to was we
+were which who will with would you your said says also after before about over new one two
+""".split())
+
+def tokenize(text):
+    """Lowercased unigrams and bigrams with stopwords and single characters removed"""
+    words = [w for w in TOKEN_RE.findall((text or "").lower()) if len(w) > 1 and w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+class LocalCategorizer:
+    """
+    TF-IDF + softmax regression over the categories.json taxonomy, in plain NumPy.
+
+    The model predicts a subcategory; the main category follows from the taxonomy.
+    Confidence is the predicted class probability, which callers compare against a
+    threshold to decide whether to trust the prediction or ask the LLM.
+    """
+
+    def __init__(self, vocabulary=None, idf=None, weights=None, bias=None, labels=None, parents=None):
+        self.vocabulary = vocabulary or {}
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.labels = labels or []
+        self.parents = parents or {}
+
+    # Features
+
+    def _features(self, text):
+        """Sparse l2-normalized TF-IDF vector of text as (indices, values)"""
+        counts = Counter(t for t in tokenize(text) if t in self.vocabulary)
+        if not counts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        indices = np.fromiter((self.vocabulary[t] for t in counts), dtype=np.int64, count=len(counts))
+        values = np.fromiter((1.0 + math.log(c) for c in counts.values()), dtype=np.float32, count=len(counts))
+        values *= self.idf[indices]
+        values /= np.linalg.norm(values) or 1.0
+        return indices, values
+
+    def _dense(self, docs):
+        matrix = np.zeros((len(docs), len(self.vocabulary)), dtype=np.float32)
+        for row, (indices, values) in enumerate(docs):
+            matrix[row, indices] = values
+        return matrix
+
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    # Training
+
+    def fit(self, texts, labels, parents, max_features=20000, min_df=2, epochs=40,
+            batch_size=128, learning_rate=20.0, l2=1e-5, seed=0):
+        """
+        Train on texts labelled with subcategories.
+
+        parents maps every subcategory to its main category.
+        """
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(set(tokenize(text)))
+        terms = [t for t, df in document_frequency.most_common() if df >= min_df][:max_features]
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        n_docs = len(texts)
+        self.idf = np.array(
+            [math.log((1 + n_docs) / (1 + document_frequency[t])) + 1.0 for t in terms], dtype=np.float32
+        )
+
+        self.labels = sorted(set(labels))
+        self.parents = {label: parents[label] for label in self.labels}
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        y = np.array([label_index[label] for label in labels], dtype=np.int64)
+        docs = [self._features(text) for text in texts]
+
+        rng = np.random.default_rng(seed)
+        n_classes = len(self.labels)
+        self.weights = np.zeros((len(self.vocabulary), n_classes), dtype=np.float32)
+        self.bias = np.zeros(n_classes, dtype=np.float32)
+        for epoch in range(epochs):
+            lr = learning_rate / (1 + epoch * 0.1)
+            order = rng.permutation(n_docs)
+            for start in range(0, n_docs, batch_size):
+                batch = order[start:start + batch_size]
+                x = self._dense([docs[i] for i in batch])
+                probs = self._softmax(x @ self.weights + self.bias)
+                probs[np.arange(len(batch)), y[batch]] -= 1.0
+                probs /= len(batch)
+                self.weights -= lr * (x.T @ probs + l2 * self.weights)
+                self.bias -= lr * probs.sum(axis=0)
+        return self
+
+    # Prediction
+
+    def predict_proba(self, texts):
+        x = self._dense([self._features(text) for text in texts])
+        return self._softmax(x @ self.weights + self.bias)
+
+    def predict(self, text):
+        """Return (main_category, subcategory, confidence) for text"""
+        probs = self.predict_proba([text])[0]
+        best = int(probs.argmax())
+        label = self.labels[best]
+        return self.parents[label], label, float(probs[best])
+
+    # Persistence
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            idf=self.idf,
+            weights=self.weights,
+            bias=self.bias,
+            meta=np.array(json.dumps({
+                "vocabulary": list(self.vocabulary),
+                "labels": self.labels,
+                "parents": self.parents,
+            })),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                vocabulary={term: i for i, term in enumerate(meta["vocabulary"])},
+                idf=data["idf"],
+                weights=data["weights"],
+                bias=data["bias"],
+                labels=meta["labels"],
+                parents=meta["parents"],
+            )
+
+class LocalFastPath:
+    """
+    Wraps a trained LocalCategorizer with the confidence threshold used at request
+    time and counts how often the local prediction was used.
+    """
+
+    def __init__(self, model, threshold=LOCAL_CLASSIFIER_THRESHOLD):
+        self.model = model
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.stats = {"local": 0, "fallback": 0}
+
+    def categorize(self, news_text):
+        """Return a categorization if the model is confident enough, otherwise None"""
+        main_category, subcategory, confidence = self.model.predict(news_text)
+        with self._lock:
+            if confidence < self.threshold:
+                self.stats["fallback"] += 1
+                return None
+            self.stats["local"] += 1
+        return {
+            "main_category": main_category,
+            "subcategory": subcategory,
+            "explanation": f"Predicted by the local classifier with {confidence:.0%} confidence",
+            "confidence": round(confidence, 4),
+            "source": "local",
+        }
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        total = stats["local"] + stats["fallback"]
+        stats["threshold"] = self.threshold
+        stats["llm_call_rate"] = round(stats["fallback"] / total, 4) if total else 0.0
+        return stats
+
+_fast_path = None
+_fast_path_loaded = False
+_fast_path_lock = threading.Lock()
+
+def get_local_fast_path():
+    """Process-wide fast path, or None when no trained model exists at LOCAL_CLASSIFIER_PATH"""
+    global _fast_path, _fast_path_loaded
+    with _fast_path_lock:
+        if not _fast_path_loaded:
+            _fast_path_loaded = True
+            if LOCAL_CLASSIFIER_PATH and os.path.exists(LOCAL_CLASSIFIER_PATH):
+                _fast_path = LocalFastPath(LocalCategorizer.load(LOCAL_CLASSIFIER_PATH))
+        return _fast_path
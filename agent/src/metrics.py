@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+
+# Buckets sized for calls that take from milliseconds (cache hits) to a minute (slow completions)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# HTTP requests, labelled by route template so path parameters do not create new series
+HTTP_REQUESTS = Counter("agent_http_requests_total", "HTTP requests served", ["endpoint", "method", "status"])
+HTTP_LATENCY = Histogram("agent_http_request_duration_seconds", "Time to serve an HTTP request, including streamed bodies",
+                         ["endpoint", "method"], buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge("agent_http_requests_in_flight", "HTTP requests being served", ["endpoint"])
+
+# Tasks, whichever endpoint they were requested through
+TASKS = Counter("agent_tasks_total", "Tasks processed, by outcome (ok, local, error, exception)", ["task", "outcome"])
+TASK_LATENCY = Histogram("agent_task_duration_seconds", "Time to process a task, including cache, queueing and the LLM",
+                         ["task"], buckets=LATENCY_BUCKETS)
+
+# Upstream LLM calls, timed around the provider request only
+LLM_REQUESTS = Counter("agent_llm_requests_total", "Completions sent upstream, by outcome", ["agent", "outcome"])
+LLM_LATENCY = Histogram("agent_llm_request_duration_seconds", "Time the provider took to answer a completion",
+                        ["agent"], buckets=LATENCY_BUCKETS)
+LLM_IN_FLIGHT = Gauge("agent_llm_requests_in_flight", "Completions waiting on the provider")
+LLM_QUEUE_WAIT = Histogram("agent_llm_queue_wait_seconds", "Time a completion waited for rate limit budget",
+                           buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("agent_llm_tokens_total", "Tokens reported by the provider", ["agent", "kind"])
+
+OUTPUT_PARSES = Counter("agent_output_parses_total", "Model outputs by parse outcome (valid, repaired, invalid)",
+                        ["task", "outcome"])
+
+EVENT_LOOP_LAG = Histogram("agent_event_loop_lag_seconds", "How late the event loop woke up a sleeping task",
+                           buckets=LAG_BUCKETS)
+
+class MetricsMiddleware:
+    """ASGI middleware counting and timing HTTP requests until their last body chunk is sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _endpoint(self, scope):
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(endpoint).inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.labels(endpoint).dec()
+            HTTP_REQUESTS.labels(endpoint, scope["method"], str(status)).inc()
+            HTTP_LATENCY.labels(endpoint, scope["method"]).observe(time.perf_counter() - started)
+
+class TaskTimer:
+    """Times one task and counts it under the outcome of its result"""
+
+    def __init__(self, task):
+        self.task = task
+        self.outcome = "exception"
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def result(self, result):
+        if "error" in result:
+            self.outcome = "error"
+        else:
+            self.outcome = "local" if result.get("source") == "local" else "ok"
+        return result
+
+    def __exit__(self, *exc_info):
+        TASKS.labels(self.task, self.outcome).inc()
+        TASK_LATENCY.labels(self.task).observe(time.perf_counter() - self.started)
+
+def observe_usage(agent_name, usage):
+    """Count the prompt and completion tokens of a completion, if the provider reported them"""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(agent_name, "prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels(agent_name, "completion").inc(usage.completion_tokens or 0)
+
+# Gauges are taken as-is from get_stats(); every other number is exported as a counter
+GAUGE_SUFFIXES = ("ratio", "rate", "entries", "in_flight", "threshold")
+
+class StatsCollector:
+    """Exports the get_stats() counters of the cache, coalescing, classifier etc. at scrape time"""
+
+    def __init__(self, sources):
+        # name -> callable returning a stats dict, or None when the component is disabled
+        self.sources = sources
+
+    def describe(self):
+        # Stats are only read at scrape time: some sources (the scheduler) need the server's event loop
+        return []
+
+    def collect(self):
+        for name, get_stats in self.sources.items():
+            stats = get_stats() or {}
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"agent_{name}_{key}"
+                if key.endswith(GAUGE_SUFFIXES):
+                    yield GaugeMetricFamily(metric, f"{name} {key.replace('_', ' ')}", value=value)
+                else:
+                    yield CounterMetricFamily(metric, f"{name} {key.replace('_', ' ')}", value=value)
+
+def register_stats(sources):
+    REGISTRY.register(StatsCollector(sources))
+
+async def monitor_event_loop(interval=0.25):
+    """Record how late the loop wakes up from a sleep of interval seconds; runs until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
@@ -1,6 +1,16 @@
-import json
-import os
 from agents import Agent, Runner, RunResult
+from prompts import get_prompt_registry
+from local_classifier import get_local_fast_path
+from metrics import TaskTimer
+from preprocess import Preprocessor
+from quiz_set import check_request, parse_quiz_set
+from structured import parse_structured
+
+# Tasks understood by NewsProcessor.process
+TASKS = ["CATEGORIZE", "QUIZ", "SUMMARIZE", "ALL"]
+
+# Keys of the combined TASK: ALL result, mapped to the single task they hold
+ALL_TASK_KEYS = {"categorization": "CATEGORIZE", "quiz": "QUIZ", "summary": "SUMMARIZE"}
 
 class NewsProcessor(Agent):
     """
@@ -8,112 +18,228 @@ class NewsProcessor(Agent):
     1. Categorize news text
     2. Generate quiz questions
     3. Create summaries
+    4. Do all three in a single completion (TASK: ALL)
     """
     
     def __init__(self, api_key=None):
-        # Load categories from the JSON file
-        with open(os.path.join(os.path.dirname(__file__), 'categories.json'), 'r') as f:
-            self.categories_data = json.load(f)
-        
-        # Create a formatted string of categories for the prompt
-        categories_str = self._format_categories()
-        
-        # Define the agent instructions
-        instructions = f"""You are a comprehensive news processing assistant that can analyze news text in multiple ways.
-Depending on the task requested, you will perform one of the following functions:
-
-1. CATEGORIZE: Categorize the news according to these categories and subcategories:
-{categories_str}
-
-2. QUIZ: Create a multiple-choice question based on the news content
-
-3. SUMMARIZE: Create a concise summary of the news
-
-For each task, respond in the appropriate JSON format:
-
-For CATEGORIZE:
-{{
-  "main_category": "Category Name",
-  "subcategory": "Subcategory Name",
-  "explanation": "Brief explanation for the categorization"
-}}
-
-For QUIZ:
-{{
-  "question": "The question text goes here?",
-  "choices": {{
-    "A": "First option",
-    "B": "Second option",
-    "C": "Third option",
-    "D": "Fourth option"
-  }},
-  "correct_answer": "A",
-  "explanation": "Brief explanation of why this is the correct answer"
-}}
-
-For SUMMARIZE:
-{{
-  "summary": "Concise summary of the news (1-3 sentences)",
-  "key_points": ["Key point 1", "Key point 2", "Key point 3"],
-  "entities": ["Important entity 1", "Important entity 2"]
-}}
-
-Only return the JSON object, with no additional text before or after.
-"""
+        # Task prompts come from the shared registry, built once per process
+        self.prompts = get_prompt_registry()
+        self.categories_data = self.prompts.categories_data
         
-        # Initialize the parent Agent class
-        super().__init__(name="News Processor", instructions=instructions, api_key=api_key)
-    
-    def _format_categories(self):
-        """Format the categories data into a readable string for the prompt"""
-        formatted = ""
-        for category in self.categories_data["categories"]:
-            formatted += f"- {category['name']}:\n"
-            for subcategory in category["subcategories"]:
-                formatted += f"  * {subcategory}\n"
-        return formatted
+        # Initialize the parent Agent class with the combined prompt
+        super().__init__(name="News Processor", instructions=self.prompts.get("ALL").text, api_key=api_key,
+                         json_output=True)
+
+        # Each task runs with its own compact prompt, so QUIZ and SUMMARIZE do not pay for the taxonomy
+        self.task_agents = {
+            task: Agent(name=f"News Processor ({task.replace('_', ' ').title()})",
+                        instructions=self.prompts.get(task).text, api_key=self.api_key, cache=self.cache,
+                        json_output=True)
+            for task in TASKS + ["QUIZ_SET"]
+        }
+
+        # Long articles are fitted to a per-task token budget, condensing oversized ones chunk by chunk
+        condense_prompt = self.prompts.get("CONDENSE")
+        self.condense_agent = Agent(name="News Processor (Condense)", instructions=condense_prompt.text,
+                                    api_key=self.api_key, cache=self.cache, json_output=True)
+        self.preprocessor = Preprocessor(self.condense_agent, condense_prompt)
+
+        # Optional local classifier tried before the LLM for CATEGORIZE (None if no model is trained)
+        self.local_fast_path = get_local_fast_path()
     
-    def process(self, news_text, task="CATEGORIZE"):
+    def _check_task(self, task):
+        """Normalize the task name; returns (task, error result or None)"""
+        task = task.upper()
+        if task not in TASKS:
+            return task, {"error": f"Invalid task: {task}. Must be one of: {', '.join(TASKS)}"}
+        return task, None
+
+    def _build_prompt(self, prepared, task):
+        """Build the user prompt for the prepared article text"""
+        return self.prompts.get(task).user_message(prepared.text)
+
+    @staticmethod
+    def _with_usage(result, prepared):
+        """Report the article tokens sent for this result and how many preprocessing saved"""
+        if "error" not in result:
+            result["token_usage"] = prepared.usage()
+        return result
+
+    def _parse_output(self, task, output):
+        """Parse the model output for the given task, validated against its schema"""
+        return parse_structured(task, output)
+
+    def _categorize_locally(self, news_text, task, use_local):
+        """Local fast-path categorization, or None when it does not apply or is not confident"""
+        if task != "CATEGORIZE" or not use_local or self.local_fast_path is None:
+            return None
+        return self.local_fast_path.categorize(news_text)
+
+    def process(self, news_text, task="CATEGORIZE", use_cache=True, use_local=True):
         """
         Process the given news text based on the specified task
         
         Args:
             news_text (str): The news text to process
-            task (str): The processing task - "CATEGORIZE", "QUIZ", or "SUMMARIZE"
+            task (str): The processing task - "CATEGORIZE", "QUIZ", "SUMMARIZE", or "ALL"
+            use_cache (bool): Set to False to bypass (and refresh) the result cache
+            use_local (bool): Set to False to skip the local classifier for CATEGORIZE
             
         Returns:
-            dict: The processed result
+            dict: The processed result. For "ALL" it holds the "categorization",
+            "quiz" and "summary" results.
         """
-        # Validate task
-        task = task.upper()
-        if task not in ["CATEGORIZE", "QUIZ", "SUMMARIZE"]:
-            return {"error": f"Invalid task: {task}. Must be one of: CATEGORIZE, QUIZ, SUMMARIZE"}
-        
-        # Create the prompt with the task and news text
-        prompt = f"TASK: {task}\n\nNEWS TEXT:\n{news_text}"
+        task, error = self._check_task(task)
+        if error:
+            return error
+
+        with TaskTimer(task) as timer:
+            local_result = self._categorize_locally(news_text, task, use_local)
+            if local_result is not None:
+                return timer.result(local_result)
+
+            # Fit the article into the task's token budget; results are still cached under the original text
+            prepared = self.preprocessor.prepare(news_text, task, use_cache=use_cache)
+
+            # Run the agent
+            agent = self.task_agents[task]
+            result = agent._run_cached(news_text, task, self._build_prompt(prepared, task),
+                                       lambda output: self._parse_output(task, output), use_cache=use_cache)
+            return timer.result(self._with_usage(result, prepared))
+
+    async def aprocess(self, news_text, task="CATEGORIZE", timeout=None, use_cache=True, use_local=True):
+        """
+        Async variant of process() that does not block the event loop
         
-        # Run the agent
-        result = Runner.run_sync(self, prompt)
+        Args:
+            news_text (str): The news text to process
+            task (str): The processing task - "CATEGORIZE", "QUIZ", "SUMMARIZE", or "ALL"
+            timeout (float): Optional per-call timeout in seconds
+            use_cache (bool): Set to False to bypass (and refresh) the result cache
+            use_local (bool): Set to False to skip the local classifier for CATEGORIZE
+            
+        Returns:
+            dict: The processed result
+        """
+        task, error = self._check_task(task)
+        if error:
+            return error
+
+        with TaskTimer(task) as timer:
+            local_result = self._categorize_locally(news_text, task, use_local)
+            if local_result is not None:
+                return timer.result(local_result)
+
+            prepared = await self.preprocessor.aprepare(news_text, task, timeout=timeout, use_cache=use_cache)
+
+            agent = self.task_agents[task]
+            result = await agent._arun_cached(news_text, task, self._build_prompt(prepared, task),
+                                              lambda output: self._parse_output(task, output),
+                                              use_cache=use_cache, timeout=timeout)
+            return timer.result(self._with_usage(result, prepared))
+    
+    async def astream(self, news_text, task="QUIZ", timeout=None, use_cache=True):
+        """
+        Stream the processing of the given news text
         
-        try:
-            # Parse the JSON response
-            processed_result = json.loads(result.final_output)
-            return processed_result
-        except json.JSONDecodeError:
-            # If the response isn't valid JSON, return the raw output
-            return {
-                "error": f"Failed to parse {task.lower()} result",
-                "raw_output": result.final_output
-            }
+        Args:
+            news_text (str): The news text to process
+            task (str): The processing task - "CATEGORIZE", "QUIZ", "SUMMARIZE", or "ALL"
+            timeout (float): Optional timeout in seconds for the whole completion
+            use_cache (bool): Set to False to bypass (and refresh) the result cache
+            
+        Yields:
+            tuple: ("token", str) for each piece of model output, then ("result", dict)
+            with the parsed result
+        """
+        task, error = self._check_task(task)
+        if error:
+            yield "result", error
+            return
+
+        with TaskTimer(task) as timer:
+            prepared = await self.preprocessor.aprepare(news_text, task, timeout=timeout, use_cache=use_cache)
+
+            agent = self.task_agents[task]
+            async for kind, data in agent._astream_cached(news_text, task, self._build_prompt(prepared, task),
+                                                          lambda output: self._parse_output(task, output),
+                                                          use_cache=use_cache, timeout=timeout):
+                if kind == "result":
+                    data = timer.result(self._with_usage(data, prepared))
+                yield kind, data
     
-    def categorize(self, news_text):
-        """Categorize the given news text"""
-        return self.process(news_text, task="CATEGORIZE")
+    def categorize(self, news_text, use_cache=True, use_local=True):
+        """Categorize the given news text, trying the local classifier before the LLM"""
+        return self.process(news_text, task="CATEGORIZE", use_cache=use_cache, use_local=use_local)
     
-    def generate_quiz(self, news_text):
+    def generate_quiz(self, news_text, use_cache=True):
         """Generate a quiz question based on the given news text"""
-        return self.process(news_text, task="QUIZ")
+        return self.process(news_text, task="QUIZ", use_cache=use_cache)
     
-    def summarize(self, news_text):
+    def _quiz_set_request(self, prepared, news_text, instruction):
+        """(cache text, user prompt) for a QUIZ_SET; the instruction is part of the cache text"""
+        return f"{instruction}\n{news_text}", f"{instruction}\n{self._build_prompt(prepared, 'QUIZ_SET')}"
+
+    def generate_quiz_set(self, news_text, count=None, difficulty=None, use_cache=True):
+        """
+        Generate several distinct quiz questions from a single completion
+
+        Args:
+            news_text (str): The news text to process
+            count (int): Number of questions (defaults to the total of difficulty, or 1)
+            difficulty (dict): Optional difficulty mix, e.g. {"easy": 2, "medium": 2, "hard": 1}
+            use_cache (bool): Set to False to bypass (and refresh) the result cache
+
+        Returns:
+            dict: "questions" deduplicated against each other, "requested" and
+            "duplicates_removed"; fewer than count questions are returned when the
+            model's answer did not hold enough distinct ones
+        """
+        count, difficulty, instruction, error = check_request(count, difficulty)
+        if error:
+            return error
+        with TaskTimer("QUIZ_SET") as timer:
+            prepared = self.preprocessor.prepare(news_text, "QUIZ_SET", use_cache=use_cache)
+            key_text, prompt = self._quiz_set_request(prepared, news_text, instruction)
+            result = self.task_agents["QUIZ_SET"]._run_cached(
+                key_text, "QUIZ_SET", prompt, lambda output: parse_quiz_set(output, count, difficulty),
+                use_cache=use_cache)
+            return timer.result(self._with_usage(result, prepared))
+
+    async def agenerate_quiz_set(self, news_text, count=None, difficulty=None, timeout=None, use_cache=True):
+        """Generate several distinct quiz questions without blocking the event loop"""
+        count, difficulty, instruction, error = check_request(count, difficulty)
+        if error:
+            return error
+        with TaskTimer("QUIZ_SET") as timer:
+            prepared = await self.preprocessor.aprepare(news_text, "QUIZ_SET", timeout=timeout, use_cache=use_cache)
+            key_text, prompt = self._quiz_set_request(prepared, news_text, instruction)
+            result = await self.task_agents["QUIZ_SET"]._arun_cached(
+                key_text, "QUIZ_SET", prompt, lambda output: parse_quiz_set(output, count, difficulty),
+                use_cache=use_cache, timeout=timeout)
+            return timer.result(self._with_usage(result, prepared))
+
+    def summarize(self, news_text, use_cache=True):
         """Summarize the given news text"""
-        return self.process(news_text, task="SUMMARIZE")
+        return self.process(news_text, task="SUMMARIZE", use_cache=use_cache)
+
+    def process_all(self, news_text, use_cache=True):
+        """Categorize, generate a quiz and summarize in a single completion"""
+        return self.process(news_text, task="ALL", use_cache=use_cache)
+
+    async def acategorize(self, news_text, timeout=None, use_cache=True, use_local=True):
+        """Categorize the given news text without blocking the event loop"""
+        return await self.aprocess(news_text, task="CATEGORIZE", timeout=timeout, use_cache=use_cache,
+                                   use_local=use_local)
+
+    async def agenerate_quiz(self, news_text, timeout=None, use_cache=True):
+        """Generate a quiz question without blocking the event loop"""
+        return await self.aprocess(news_text, task="QUIZ", timeout=timeout, use_cache=use_cache)
+
+    async def asummarize(self, news_text, timeout=None, use_cache=True):
+        """Summarize the given news text without blocking the event loop"""
+        return await self.aprocess(news_text, task="SUMMARIZE", timeout=timeout, use_cache=use_cache)
+
+    async def aprocess_all(self, news_text, timeout=None, use_cache=True):
+        """Run TASK: ALL without blocking the event loop"""
+        return await self.aprocess(news_text, task="ALL", timeout=timeout, use_cache=use_cache)
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import re
+
+from structured import parse_structured
+from tokens import count_tokens
+
+# Maximum article tokens sent with each task's prompt, overridable through the environment.
+# Categorization only needs the headline and lede; quizzes and summaries need more of the body.
+INPUT_TOKEN_BUDGETS = {
+    "CATEGORIZE": int(os.getenv("INPUT_TOKEN_BUDGET_CATEGORIZE", "600")),
+    "QUIZ": int(os.getenv("INPUT_TOKEN_BUDGET_QUIZ", "2500")),
+    "QUIZ_SET": int(os.getenv("INPUT_TOKEN_BUDGET_QUIZ_SET", "3000")),
+    "SUMMARIZE": int(os.getenv("INPUT_TOKEN_BUDGET_SUMMARIZE", "3000")),
+    "ALL": int(os.getenv("INPUT_TOKEN_BUDGET_ALL", "3000")),
+}
+# Articles longer than this multiple of the budget are condensed chunk by chunk instead of truncated
+MAP_REDUCE_FACTOR = float(os.getenv("MAP_REDUCE_FACTOR", "1.5"))
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS", "1500"))
+# Tasks that need the whole article; CATEGORIZE is always just truncated
+MAP_REDUCE_TASKS = {"QUIZ", "QUIZ_SET", "SUMMARIZE", "ALL"}
+
+# Lines that are page furniture rather than article text
+BOILERPLATE_RE = re.compile(
+    r"^\s*("
+    r"advertisement|sponsored( content)?|related( articles| stories)?:?|read (more|also|next)\b.*|"
+    r"(click|tap) here\b.*|(sign up|subscribe)\b.*|follow us\b.*|share (this|on)\b.*|"
+    r"(all rights reserved|copyright|©)\b.*|.*\bcookies?\b.*\b(accept|policy|consent)\b.*|"
+    r"https?://\S+|image( source)?:.*|photo:.*|getty images|reuters|ap photo.*"
+    r")\s*$",
+    re.IGNORECASE,
+)
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def strip_boilerplate(text):
+    """Drop page furniture lines and repeated paragraphs, and collapse runs of whitespace"""
+    seen = set()
+    paragraphs = []
+    for line in (text or "").splitlines():
+        line = re.sub(r"[ \t\u00a0]+", " ", line).strip()
+        if not line or BOILERPLATE_RE.match(line) or line.lower() in seen:
+            continue
+        seen.add(line.lower())
+        paragraphs.append(line)
+    return "\n".join(paragraphs)
+
+def _pieces(text):
+    """Paragraphs, with paragraphs split into sentences, in order"""
+    for paragraph in text.split("\n"):
+        sentences = SENTENCE_RE.split(paragraph)
+        for i, sentence in enumerate(sentences):
+            yield sentence, i == len(sentences) - 1
+
+def truncate(text, budget, model=None):
+    """
+    Cut text to at most budget tokens at a sentence boundary.
+
+    Returns (text, truncated). A first sentence that alone exceeds the budget is
+    cut by characters.
+    """
+    if count_tokens(text, model) <= budget:
+        return text, False
+    kept, used = [], 0
+    for sentence, ends_paragraph in _pieces(text):
+        tokens = count_tokens(sentence, model) + 1
+        if used + tokens > budget:
+            break
+        kept.append(sentence + ("\n" if ends_paragraph else " "))
+        used += tokens
+    if not kept:
+        # Shrink by the overshoot ratio until it fits
+        cut = text
+        while cut and count_tokens(cut, model) > budget:
+            cut = cut[:int(len(cut) * budget / count_tokens(cut, model) * 0.95)]
+        return cut, True
+    return "".join(kept).strip(), True
+
+def split_chunks(text, chunk_tokens, model=None):
+    """Split text into consecutive chunks of at most chunk_tokens tokens, on sentence boundaries"""
+    chunks, current, used = [], [], 0
+    for sentence, ends_paragraph in _pieces(text):
+        tokens = count_tokens(sentence, model) + 1
+        if current and used + tokens > chunk_tokens:
+            chunks.append("".join(current).strip())
+            current, used = [], 0
+        current.append(sentence + ("\n" if ends_paragraph else " "))
+        used += tokens
+    if current:
+        chunks.append("".join(current).strip())
+    # A single sentence longer than a chunk is cut down like any other oversized text
+    return [truncate(chunk, chunk_tokens, model)[0] for chunk in chunks]
+
+class Prepared:
+    """The article text to send for one task, and how many tokens preparing it saved"""
+
+    def __init__(self, text, original_tokens, sent_tokens, truncated=False, chunks=0, map_tokens=0):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.sent_tokens = sent_tokens
+        self.truncated = truncated
+        self.chunks = chunks
+        self.map_tokens = map_tokens
+
+    def usage(self):
+        return {
+            "original_tokens": self.original_tokens,
+            "sent_tokens": self.sent_tokens,
+            "saved_tokens": self.original_tokens - self.sent_tokens,
+            "truncated": self.truncated,
+            "condensed_chunks": self.chunks,
+            "map_tokens": self.map_tokens,
+        }
+
+class Preprocessor:
+    """
+    Fits article text into a per-task token budget before it is sent to the model.
+
+    Boilerplate is stripped first. Text still over the budget is truncated at a
+    sentence boundary, except for tasks that need the whole article: when those run
+    well over the budget, the article is split into chunks that are condensed in
+    parallel by condense_agent (map), and the condensed notes are joined and fitted
+    to the budget (reduce). Condensed chunks go through the result cache like any
+    other completion.
+    """
+
+    def __init__(self, condense_agent, prompt, budgets=None, model=None):
+        self.condense_agent = condense_agent
+        self.prompt = prompt
+        self.budgets = budgets or INPUT_TOKEN_BUDGETS
+        self.model = model
+
+    def _plan(self, news_text, task):
+        """Return (cleaned text, original token count, chunks to condense or None)"""
+        original_tokens = count_tokens(news_text or "", self.model)
+        cleaned = strip_boilerplate(news_text)
+        budget = self.budgets[task]
+        if task in MAP_REDUCE_TASKS and count_tokens(cleaned, self.model) > budget * MAP_REDUCE_FACTOR:
+            return cleaned, original_tokens, split_chunks(cleaned, MAP_CHUNK_TOKENS, self.model)
+        return cleaned, original_tokens, None
+
+    def _condense_request(self, chunk, n_chunks, task):
+        """(cache text, user message) for condensing chunk to its share of the task's budget"""
+        words = max(50, int(self.budgets[task] / n_chunks * 0.7))
+        # The word limit is part of the cache text, so notes condensed for another budget are not reused
+        return f"{words}\n{chunk}", f"Keep the notes under {words} words.\n{self.prompt.user_message(chunk)}"
+
+    @staticmethod
+    def _parse_notes(output):
+        return parse_structured("CONDENSE", output)
+
+    def _finish(self, task, text, original_tokens, chunks=0, map_tokens=0):
+        fitted, truncated = truncate(text, self.budgets[task], self.model)
+        return Prepared(fitted, original_tokens, count_tokens(fitted, self.model), truncated, chunks, map_tokens)
+
+    def _reduce(self, task, chunks, results, original_tokens):
+        # A chunk whose condensing failed keeps its original text, truncated to its share of the budget
+        share = self.budgets[task] // len(chunks)
+        notes = [
+            result["notes"] if "notes" in result else truncate(chunk, share, self.model)[0]
+            for chunk, result in zip(chunks, results)
+        ]
+        map_tokens = sum(count_tokens(chunk, self.model) for chunk in chunks)
+        return self._finish(task, "\n".join(notes), original_tokens, len(chunks), map_tokens)
+
+    def prepare(self, news_text, task, use_cache=True):
+        """Prepare news_text for task, condensing chunks one after another"""
+        cleaned, original_tokens, chunks = self._plan(news_text, task)
+        if chunks is None:
+            return self._finish(task, cleaned, original_tokens)
+        results = []
+        for chunk in chunks:
+            key_text, prompt = self._condense_request(chunk, len(chunks), task)
+            results.append(self.condense_agent._run_cached(key_text, "CONDENSE", prompt, self._parse_notes,
+                                                           use_cache=use_cache))
+        return self._reduce(task, chunks, results, original_tokens)
+
+    async def aprepare(self, news_text, task, timeout=None, use_cache=True):
+        """Async variant of prepare() that condenses all chunks concurrently"""
+        cleaned, original_tokens, chunks = self._plan(news_text, task)
+        if chunks is None:
+            return self._finish(task, cleaned, original_tokens)
+
+        async def condense(chunk):
+            key_text, prompt = self._condense_request(chunk, len(chunks), task)
+            try:
+                return await self.condense_agent._arun_cached(key_text, "CONDENSE", prompt, self._parse_notes,
+                                                              use_cache=use_cache, timeout=timeout)
+            except Exception as e:
+                return {"error": str(e)}
+
+        results = await asyncio.gather(*(condense(chunk) for chunk in chunks))
+        return self._reduce(task, chunks, results, original_tokens)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+
+from tokens import count_tokens
+
+CATEGORIES_PATH = os.path.join(os.path.dirname(__file__), 'categories.json')
+
+# Every prompt starts with the same preamble so that prompts sharing a prefix
+# (CATEGORIZE and ALL share the taxonomy too) hit the provider's prompt cache.
+PREAMBLE = """You are a news processing assistant. You read one news article and answer with a single JSON object.
+Only return the JSON object, with no additional text before or after.
+"""
+
+CATEGORIZE_FORMAT = """{"main_category": "Category Name", "subcategory": "Subcategory Name", "explanation": "Brief explanation for the categorization"}"""
+
+QUIZ_FORMAT = """{"question": "The question text goes here?", "choices": {"A": "First option", "B": "Second option", "C": "Third option", "D": "Fourth option"}, "correct_answer": "A", "explanation": "Brief explanation of why this is the correct answer"}"""
+
+QUIZ_SET_FORMAT = """{"questions": [{"question": "...", "choices": {"A": "...", "B": "...", "C": "...", "D": "..."}, "correct_answer": "A", "explanation": "...", "difficulty": "easy"}]}"""
+
+SUMMARIZE_FORMAT = """{"summary": "Concise summary of the news (1-3 sentences)", "key_points": ["Key point 1", "Key point 2", "Key point 3"], "entities": ["Important entity 1", "Important entity 2"]}"""
+
+CONDENSE_FORMAT = """{"notes": "Condensed passage"}"""
+
+def prompt_version(text):
+    """Short content hash of a prompt, used in cache keys"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+class Prompt:
+    """A system prompt for one task, with its version hash and token count"""
+
+    def __init__(self, task, text):
+        self.task = task
+        self.text = text
+        self.version = prompt_version(text)
+        self.tokens = count_tokens(text)
+
+    def user_message(self, news_text):
+        """The user message sent with this prompt; the article always goes last"""
+        return f"NEWS TEXT:\n{news_text}"
+
+    def to_dict(self):
+        return {"task": self.task, "version": self.version, "tokens": self.tokens}
+
+class PromptRegistry:
+    """
+    Builds the minimal system prompt for each task once per process.
+
+    Only CATEGORIZE and ALL carry the category taxonomy; QUIZ and SUMMARIZE get just
+    their instructions and JSON format.
+    """
+
+    def __init__(self, categories_path=CATEGORIES_PATH):
+        with open(categories_path, 'r') as f:
+            self.categories_data = json.load(f)
+
+        taxonomy = self._format_taxonomy()
+        self.prompts = {
+            "CATEGORIZE": Prompt("CATEGORIZE", f"""{PREAMBLE}
+Categories (main category: subcategories):
+{taxonomy}
+Task: pick the most appropriate main category and subcategory from the list above and briefly explain why (1-2 sentences).
+
+Format:
+{CATEGORIZE_FORMAT}
+"""),
+            "QUIZ": Prompt("QUIZ", f"""{PREAMBLE}
+Task: write one challenging multiple-choice question that tests comprehension of key information in the article, with four options (A-D) of which exactly one is correct.
+
+Format:
+{QUIZ_FORMAT}
+"""),
+            "QUIZ_SET": Prompt("QUIZ_SET", f"""{PREAMBLE}
+Task: write the number of multiple-choice questions asked for, each with four options (A-D) of which exactly one is correct. Every question must test a different fact from the article; never ask about the same fact twice in other words. Label each question's difficulty as easy (stated plainly in the article), medium (needs a detail or a number) or hard (needs connecting several facts), matching the difficulty mix when one is asked for.
+
+Format:
+{QUIZ_SET_FORMAT}
+"""),
+            "SUMMARIZE": Prompt("SUMMARIZE", f"""{PREAMBLE}
+Task: summarize the article in 1-3 sentences and list its key points and important entities.
+
+Format:
+{SUMMARIZE_FORMAT}
+"""),
+            "CONDENSE": Prompt("CONDENSE", f"""{PREAMBLE}
+The text is one part of a longer article.
+Task: condense it into dense plain-text notes that keep every fact a reader could be quizzed on: names, numbers, dates, places, quotes and causes. Drop repetition and commentary.
+
+Format:
+{CONDENSE_FORMAT}
+"""),
+            "ALL": Prompt("ALL", f"""{PREAMBLE}
+Categories (main category: subcategories):
+{taxonomy}
+Task: do all of the following for the same article:
+- categorization: pick the most appropriate main category and subcategory from the list above and briefly explain why
+- quiz: write one challenging multiple-choice question about key information, four options (A-D), exactly one correct
+- summary: summarize in 1-3 sentences with key points and important entities
+
+Format:
+{{
+  "categorization": {CATEGORIZE_FORMAT},
+  "quiz": {QUIZ_FORMAT},
+  "summary": {SUMMARIZE_FORMAT}
+}}
+"""),
+        }
+
+    def _format_taxonomy(self):
+        """One line per category, subcategories separated by semicolons"""
+        return "\n".join(
+            f"- {category['name']}: {'; '.join(category['subcategories'])}"
+            for category in self.categories_data["categories"]
+        )
+
+    def get(self, task):
+        return self.prompts[task.upper()]
+
+    def report(self):
+        """
+        Version and token count of every prompt, plus the input tokens each task saves
+        per call compared to sending the combined (ALL) prompt
+        """
+        combined = self.prompts["ALL"].tokens
+        report = {}
+        for task, prompt in self.prompts.items():
+            report[task] = {**prompt.to_dict(), "tokens_saved_per_call": combined - prompt.tokens}
+        return report
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_prompt_registry():
+    """Process-wide prompt registry, built on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
@@ -1,48 +1,57 @@
-import json
-import os
 from agents import Agent, Runner, RunResult
+from prompts import get_prompt_registry
+from quiz_set import check_request, parse_quiz_set
+from structured import parse_structured
 
 class QuizGenerator(Agent):
     def __init__(self, api_key=None):
-        # Define the agent instructions
-        instructions = """You are a quiz question generator specializing in creating multiple-choice questions based on news text.
-
-For each news text provided, you should:
-1. Create a relevant and challenging multiple-choice question based on the content
-2. Generate 4 possible answers (A, B, C, D), with only one being correct
-3. Indicate which answer is correct
-4. Ensure the question tests comprehension of key information in the news text
-
-Return your question in the following JSON format:
-{
-  "question": "The question text goes here?",
-  "choices": {
-    "A": "First option",
-    "B": "Second option",
-    "C": "Third option",
-    "D": "Fourth option"
-  },
-  "correct_answer": "A",
-  "explanation": "Brief explanation of why this is the correct answer"
-}
-
-Only return the JSON object, with no additional text before or after.
-"""
+        # Use the shared QUIZ prompt from the registry
+        self.prompts = get_prompt_registry()
+        self.prompt = self.prompts.get("QUIZ")
         
         # Initialize the parent Agent class
-        super().__init__(name="Quiz Generator", instructions=instructions, api_key=api_key)
+        super().__init__(name="Quiz Generator", instructions=self.prompt.text, api_key=api_key, json_output=True)
+
+        # Multi-question sets use their own prompt
+        self.set_agent = Agent(name="Quiz Generator (Set)", instructions=self.prompts.get("QUIZ_SET").text,
+                               api_key=self.api_key, cache=self.cache, json_output=True)
     
-    def generate_question(self, news_text):
+    def _parse_output(self, output):
+        """Parse the model output into a quiz question"""
+        return parse_structured("QUIZ", output)
+
+    def generate_question(self, news_text, use_cache=True):
         """Generate a multiple-choice question based on the given news text"""
-        result = Runner.run_sync(self, news_text)
-        try:
-            # Parse the JSON response
-            import json
-            quiz_question = json.loads(result.final_output)
-            return quiz_question
-        except json.JSONDecodeError:
-            # If the response isn't valid JSON, return the raw output
-            return {
-                "error": "Failed to parse quiz question result",
-                "raw_output": result.final_output
-            }
+        return self._run_cached(news_text, "QUIZ", self.prompt.user_message(news_text), self._parse_output,
+                                use_cache=use_cache)
+
+    async def agenerate_question(self, news_text, timeout=None, use_cache=True):
+        """Generate a multiple-choice question without blocking the event loop"""
+        return await self._arun_cached(news_text, "QUIZ", self.prompt.user_message(news_text), self._parse_output,
+                                       use_cache=use_cache, timeout=timeout)
+
+    def _set_request(self, news_text, count, difficulty):
+        """(count, difficulty, cache text, user prompt, error) for a multi-question set"""
+        count, difficulty, instruction, error = check_request(count, difficulty)
+        if error:
+            return None, None, None, None, error
+        user_message = self.prompts.get("QUIZ_SET").user_message(news_text)
+        return count, difficulty, f"{instruction}\n{news_text}", f"{instruction}\n{user_message}", None
+
+    def generate_questions(self, news_text, count=None, difficulty=None, use_cache=True):
+        """Generate count distinct questions (optionally in a difficulty mix) from a single completion"""
+        count, difficulty, key_text, prompt, error = self._set_request(news_text, count, difficulty)
+        if error:
+            return error
+        return self.set_agent._run_cached(key_text, "QUIZ_SET", prompt,
+                                          lambda output: parse_quiz_set(output, count, difficulty),
+                                          use_cache=use_cache)
+
+    async def agenerate_questions(self, news_text, count=None, difficulty=None, timeout=None, use_cache=True):
+        """Generate several distinct questions without blocking the event loop"""
+        count, difficulty, key_text, prompt, error = self._set_request(news_text, count, difficulty)
+        if error:
+            return error
+        return await self.set_agent._arun_cached(key_text, "QUIZ_SET", prompt,
+                                                 lambda output: parse_quiz_set(output, count, difficulty),
+                                                 use_cache=use_cache, timeout=timeout)
@@ -0,0 +1,99 @@
+import os
+import re
+
+from structured import parse_structured
+
+# Most questions one QUIZ_SET completion may be asked for
+QUIZ_MAX_COUNT = int(os.getenv("QUIZ_MAX_COUNT", "10"))
+# Questions whose word sets overlap at least this much (Jaccard) count as duplicates
+QUIZ_DUPLICATE_THRESHOLD = float(os.getenv("QUIZ_DUPLICATE_THRESHOLD", "0.7"))
+
+DIFFICULTIES = ("easy", "medium", "hard")
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {"a", "an", "the", "of", "in", "on", "at", "to", "for", "by", "with", "from", "and", "or", "is", "are",
+             "was", "were", "be", "been", "did", "does", "do", "what", "which", "who", "whom", "when", "where", "why",
+             "how", "according", "article", "this", "that", "these", "those", "it", "its", "as"}
+
+def spare_questions(count):
+    """Extra questions asked for on top of count, so some can be dropped as duplicates"""
+    return 0 if count == 1 else max(1, count // 4)
+
+def check_request(count=None, difficulty=None):
+    """
+    Validate a question count and difficulty mix ({"easy": 2, "hard": 1}).
+
+    Returns (count, difficulty, instruction, error). Without a count, the mix's
+    total is used (or 1). The instruction is the line that asks the model for them.
+    """
+    difficulty = {level.lower(): n for level, n in (difficulty or {}).items() if n}
+    unknown = [level for level in difficulty if level not in DIFFICULTIES]
+    if unknown:
+        return None, None, None, {"error": f"Invalid difficulty: {', '.join(unknown)}. Must be any of: {', '.join(DIFFICULTIES)}"}
+    if any(not isinstance(n, int) or n < 0 for n in difficulty.values()):
+        return None, None, None, {"error": "Difficulty counts must be non-negative integers"}
+    if count is None:
+        count = sum(difficulty.values()) or 1
+    if not 1 <= count <= QUIZ_MAX_COUNT:
+        return None, None, None, {"error": f"count must be between 1 and {QUIZ_MAX_COUNT}"}
+    if difficulty and sum(difficulty.values()) != count:
+        return None, None, None, {"error": f"The difficulty mix adds up to {sum(difficulty.values())}, not {count}"}
+
+    spare = spare_questions(count)
+    if difficulty:
+        mix = ", ".join(f"{difficulty[level]} {level}" for level in DIFFICULTIES if level in difficulty)
+        instruction = f"Write {count} questions ({mix})" + (f", plus {spare} spare questions of any difficulty." if spare else ".")
+    else:
+        instruction = f"Write {count + spare} questions."
+    return count, difficulty, instruction, None
+
+def _words(text):
+    return {word for word in WORD_RE.findall((text or "").lower()) if word not in STOPWORDS}
+
+def _similarity(a, b):
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+def dedupe_questions(questions, threshold=QUIZ_DUPLICATE_THRESHOLD):
+    """
+    Drop questions that repeat an earlier one: their wording overlaps by at least
+    threshold, or they share the correct answer and overlap by half as much.
+    Returns (kept questions, number dropped).
+    """
+    kept, seen = [], []
+    for question in questions:
+        words = _words(question["question"])
+        answer = " ".join(WORD_RE.findall(question["choices"][question["correct_answer"]].lower()))
+        duplicate = any(
+            _similarity(words, other_words) >= (threshold / 2 if answer == other_answer else threshold)
+            for other_words, other_answer in seen
+        )
+        if not duplicate:
+            kept.append(question)
+            seen.append((words, answer))
+    return kept, len(questions) - len(kept)
+
+def select_questions(questions, count, difficulty=None):
+    """
+    Pick count questions, filling the difficulty mix first and any remaining slots
+    in order; the picked questions keep their original order
+    """
+    picked = set()
+    for level, wanted in (difficulty or {}).items():
+        matching = [i for i, q in enumerate(questions) if q.get("difficulty") == level and i not in picked]
+        picked.update(matching[:wanted])
+    for i in range(len(questions)):
+        if len(picked) >= count:
+            break
+        picked.add(i)
+    return [questions[i] for i in sorted(picked)][:count]
+
+def parse_quiz_set(output, count, difficulty=None):
+    """Parse a QUIZ_SET output, then dedupe the questions and trim them to count"""
+    result = parse_structured("QUIZ_SET", output)
+    if "error" in result:
+        return result
+    questions, removed = dedupe_questions(result["questions"])
+    return {"questions": select_questions(questions, count, difficulty), "requested": count,
+            "duplicates_removed": removed}
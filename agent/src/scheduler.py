@@ -0,0 +1,213 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import time
+
+from metrics import LLM_QUEUE_WAIT
+
+# Provider quotas per API key; 0 disables the corresponding limit
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+# Fraction of the quota the scheduler aims for, leaving room for estimation error
+LLM_RATE_HEADROOM = float(os.getenv("LLM_RATE_HEADROOM", "0.95"))
+# Completion tokens assumed per call when reserving TPM before the response is known
+LLM_ESTIMATED_COMPLETION_TOKENS = int(os.getenv("LLM_ESTIMATED_COMPLETION_TOKENS", "400"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Priority classes; lower values are dispatched first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "default": PRIORITY_DEFAULT, "bulk": PRIORITY_BULK}
+
+_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_DEFAULT)
+
+@contextlib.contextmanager
+def priority(level):
+    """Run the completions started inside the block with the given priority class"""
+    token = _priority.set(PRIORITIES[level] if isinstance(level, str) else level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority():
+    return _priority.get()
+
+def api_keys(default_key):
+    """The pool of API keys to spread load over: OPENAI_API_KEYS if set, else default_key"""
+    keys = [key.strip() for key in os.getenv("OPENAI_API_KEYS", "").split(",") if key.strip()]
+    return keys or [default_key]
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute, holding at most one minute's worth"""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken (0 if available now)"""
+        self._refill(now)
+        # A request larger than the bucket can never fit; let it through once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+class KeyState:
+    """Rate limit state of one API key"""
+
+    def __init__(self, api_key, rpm, tpm):
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.cooldown_until = 0.0
+
+    def wait_time(self, tokens, now):
+        waits = [max(0.0, self.cooldown_until - now)]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def reserve(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def to_dict(self):
+        return {
+            "requests_available": round(self.requests.tokens, 1) if self.requests else None,
+            "tokens_available": round(self.tokens.tokens, 1) if self.tokens else None,
+            "cooling_down": max(0.0, round(self.cooldown_until - time.monotonic(), 2)),
+        }
+
+class Scheduler:
+    """
+    Dispatches completions under per-key RPM and TPM budgets.
+
+    Callers wait in a priority queue (interactive before default before bulk, FIFO
+    within a class). A single dispatcher task hands each request the API key that
+    can take it soonest once its token buckets allow, so outbound traffic stays just
+    under the quota instead of running into 429s.
+
+    The buckets live in memory and are scoped to one event loop, so they are per
+    process and per loop, not global: with several uvicorn workers (or loops) each
+    one gets the full limits, and LLM_RPM_LIMIT/LLM_TPM_LIMIT should be set to the
+    key's quota divided by their number.
+    """
+
+    def __init__(self, keys, rpm=LLM_RPM_LIMIT, tpm=LLM_TPM_LIMIT, headroom=LLM_RATE_HEADROOM):
+        self.keys = [KeyState(key, int(rpm * headroom), int(tpm * headroom)) for key in keys]
+        self._queue = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self.stats = {"dispatched": 0, "retries": 0, "rate_limited": 0, "queue_wait_seconds": 0.0}
+
+    async def acquire(self, tokens):
+        """Wait for budget for a call of the given estimated size; returns the API key to use"""
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (current_priority(), next(self._sequence), tokens, future))
+        self._wakeup.set()
+        started = time.monotonic()
+        api_key = await future
+        waited = time.monotonic() - started
+        self.stats["queue_wait_seconds"] += waited
+        LLM_QUEUE_WAIT.observe(waited)
+        return api_key
+
+    async def _dispatch(self):
+        while True:
+            while self._queue and self._queue[0][3].done():
+                # The caller gave up (cancelled or timed out) while queued
+                heapq.heappop(self._queue)
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            _, _, tokens, future = self._queue[0]
+            now = time.monotonic()
+            key, wait = min(((k, k.wait_time(tokens, now)) for k in self.keys), key=lambda kw: kw[1])
+            if wait <= 0:
+                heapq.heappop(self._queue)
+                key.reserve(tokens)
+                self.stats["dispatched"] += 1
+                future.set_result(key.api_key)
+                continue
+
+            # Sleep until budget frees up, or until a higher-priority request arrives
+            self._wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+
+    def settle(self, api_key, estimated, actual):
+        """Correct a key's TPM bucket once the real token usage of a call is known"""
+        for key in self.keys:
+            if key.api_key == api_key and key.tokens is not None:
+                key.tokens.take(actual - estimated)
+
+    def cool_down(self, api_key, seconds):
+        """Stop dispatching to api_key for the given number of seconds (after a 429)"""
+        self.stats["rate_limited"] += 1
+        for key in self.keys:
+            if key.api_key == api_key:
+                key.cooldown_until = max(key.cooldown_until, time.monotonic() + seconds)
+        self._wakeup.set()
+
+    def get_stats(self):
+        queued = {name: 0 for name in PRIORITIES}
+        names = {level: name for name, level in PRIORITIES.items()}
+        for level, _, _, future in self._queue:
+            if not future.done():
+                queued[names[level]] += 1
+        return {
+            **self.stats,
+            "queue_wait_seconds": round(self.stats["queue_wait_seconds"], 3),
+            "queued": queued,
+            "keys": {f"key_{i}": key.to_dict() for i, key in enumerate(self.keys)},
+        }
+
+def retry_after(error):
+    """Seconds the provider asked us to wait in a 429/503 response, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+def backoff(attempt, minimum=0.0):
+    """Full-jitter exponential backoff, never shorter than minimum"""
+    return max(minimum, random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)))
@@ -0,0 +1,80 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, List
+
+# Result models shared by the API and the output validation in structured.py
+
+class TokenUsage(BaseModel):
+    original_tokens: int
+    sent_tokens: int
+    saved_tokens: int
+    truncated: bool
+    condensed_chunks: int
+    map_tokens: int
+
+class CategoryResponse(BaseModel):
+    main_category: str
+    subcategory: str
+    explanation: str
+    source: Optional[str] = None
+    confidence: Optional[float] = None
+    token_usage: Optional[TokenUsage] = None
+
+class QuizChoice(BaseModel):
+    A: str
+    B: str
+    C: str
+    D: str
+
+class QuizResponse(BaseModel):
+    question: str
+    choices: QuizChoice
+    correct_answer: str
+    explanation: str
+    token_usage: Optional[TokenUsage] = None
+
+    @field_validator("correct_answer", mode="before")
+    @classmethod
+    def normalize_answer(cls, value):
+        # Models sometimes answer "b" or "B)" instead of "B"
+        if isinstance(value, str):
+            value = value.strip().rstrip(").").upper()
+        return value
+
+    @model_validator(mode="after")
+    def check_answer(self):
+        if self.correct_answer not in ("A", "B", "C", "D"):
+            raise ValueError(f"correct_answer must be one of A, B, C, D, got {self.correct_answer!r}")
+        return self
+
+class QuizQuestion(QuizResponse):
+    """One question of a QUIZ_SET result"""
+    difficulty: Optional[str] = None
+
+    @field_validator("difficulty", mode="before")
+    @classmethod
+    def normalize_difficulty(cls, value):
+        return value.strip().lower() if isinstance(value, str) else value
+
+class QuizSetResponse(BaseModel):
+    """Several distinct questions about one article, from a single completion (see quiz_set.py)"""
+    questions: List[QuizQuestion] = Field(min_length=1)
+    requested: Optional[int] = None
+    duplicates_removed: Optional[int] = None
+    token_usage: Optional[TokenUsage] = None
+
+class SummaryResponse(BaseModel):
+    summary: str
+    key_points: List[str]
+    entities: List[str]
+    token_usage: Optional[TokenUsage] = None
+
+class CombinedResponse(BaseModel):
+    """Result of a TASK: ALL completion"""
+    categorization: CategoryResponse
+    quiz: QuizResponse
+    summary: SummaryResponse
+    token_usage: Optional[TokenUsage] = None
+
+class CondensedNotes(BaseModel):
+    """Notes condensed from one chunk of a long article (see preprocess.py)"""
+    notes: str = Field(min_length=1)
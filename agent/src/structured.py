@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import threading
+
+from pydantic import ValidationError
+
+from metrics import OUTPUT_PARSES
+
+from schemas import (CategoryResponse, CombinedResponse, CondensedNotes, QuizResponse, QuizSetResponse,
+                     SummaryResponse)
+
+# Ask the provider for a JSON object ("auto": only for models that support JSON mode)
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "auto")
+# Re-ask the model once, quoting the validation error, when an output cannot be parsed or repaired
+STRUCTURED_OUTPUT_RETRY = os.getenv("STRUCTURED_OUTPUT_RETRY", "1") not in ("0", "false", "False")
+
+# Models that reject response_format={"type": "json_object"}
+NO_JSON_MODE_MODELS = {"gpt-4", "gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613"}
+
+TASK_SCHEMAS = {
+    "CATEGORIZE": CategoryResponse,
+    "QUIZ": QuizResponse,
+    "QUIZ_SET": QuizSetResponse,
+    "SUMMARIZE": SummaryResponse,
+    "ALL": CombinedResponse,
+    "CONDENSE": CondensedNotes,
+}
+
+FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+# A trailing key (possibly cut off itself) whose value never arrived
+DANGLING_KEY_RE = re.compile(r',?\s*"(?:[^"\\]|\\.)*"?\s*:?\s*$')
+
+def json_mode_enabled(model):
+    if LLM_JSON_MODE == "auto":
+        return model not in NO_JSON_MODE_MODELS
+    return LLM_JSON_MODE not in ("0", "false", "False")
+
+def _close_truncated(text):
+    """Close the strings, objects and arrays left open by a completion that was cut off"""
+    closers, in_string, escaped = [], False, False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers:
+            closers.pop()
+    if in_string:
+        text += '"'
+    return text.rstrip().rstrip(",") + "".join(reversed(closers))
+
+def extract_json(output):
+    """
+    Parse the JSON object in a model output.
+
+    Returns (value, repaired). Outputs that are not plain JSON are repaired locally:
+    code fences and surrounding prose are removed, trailing commas are dropped and
+    a truncated object is closed. Raises ValueError if nothing parses.
+    """
+    text = (output or "").strip()
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+
+    fenced = FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in output")
+    text = text[start:]
+    end = text.rfind("}")
+
+    candidates = []
+    if end != -1:
+        candidates.append(text[:end + 1])
+    candidates.append(_close_truncated(text))
+    candidates.append(_close_truncated(DANGLING_KEY_RE.sub("", text)))
+    for candidate in candidates:
+        for attempt in (candidate, TRAILING_COMMA_RE.sub(r"\1", candidate)):
+            try:
+                return json.loads(attempt), True
+            except json.JSONDecodeError:
+                continue
+    raise ValueError("Output is not valid JSON and could not be repaired")
+
+class OutputStats:
+    """Counts how model outputs were parsed: cleanly, after local repair, or not at all"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tasks = {}
+
+    def record(self, task, outcome):
+        with self._lock:
+            counts = self.tasks.setdefault(task, {"valid": 0, "repaired": 0, "invalid": 0,
+                                                   "retries": 0, "retry_failures": 0})
+            counts[outcome] += 1
+        OUTPUT_PARSES.labels(task, outcome).inc()
+
+    def get_stats(self):
+        with self._lock:
+            tasks = {task: dict(counts) for task, counts in self.tasks.items()}
+        for counts in tasks.values():
+            outputs = counts["valid"] + counts["repaired"] + counts["invalid"]
+            not_clean = counts["repaired"] + counts["invalid"]
+            counts["outputs"] = outputs
+            counts["parse_failure_rate"] = round(not_clean / outputs, 4) if outputs else 0.0
+            counts["repair_rate"] = round(counts["repaired"] / not_clean, 4) if not_clean else 0.0
+        return tasks
+
+_stats = OutputStats()
+
+def get_output_stats():
+    return _stats
+
+def parse_structured(task, output):
+    """
+    Parse and validate a model output against the task's schema.
+
+    Returns the validated result, or {"error", "raw_output"} when the output can
+    neither be parsed nor repaired into a valid result.
+    """
+    task = task.upper()
+    try:
+        value, repaired = extract_json(output)
+        if not isinstance(value, dict):
+            raise ValueError("Output is not a JSON object")
+        schema = TASK_SCHEMAS.get(task)
+        if schema is not None:
+            value = schema.model_validate(value).model_dump(exclude_none=True)
+    except (ValueError, ValidationError) as e:
+        _stats.record(task, "invalid")
+        return {"error": f"Failed to parse {task.lower()} result: {_describe(e)}", "raw_output": output}
+    _stats.record(task, "repaired" if repaired else "valid")
+    return value
+
+def _describe(error):
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'result'}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+def retry_prompt(prompt, output, error):
+    """User prompt for the one targeted retry: the original request plus what was wrong with the answer"""
+    return (
+        f"{prompt}\n\n"
+        f"Your previous answer could not be used ({error}):\n{output}\n\n"
+        "Answer again with only the corrected JSON object in the required format."
+    )
@@ -0,0 +1,35 @@
+import functools
+import math
+import os
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Rough characters-per-token ratio for English text, used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model):
+    """Load the tiktoken encoding for model, or None if it cannot be loaded (e.g. offline)"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return None
+
+def count_tokens(text, model=None):
+    """Count the tokens in text for model, falling back to an estimate without tiktoken"""
+    encoding = _get_encoding(model or os.getenv("OPENAI_MODEL", "gpt-4"))
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def is_exact(model=None):
+    """Whether count_tokens() uses the model's tokenizer rather than an estimate"""
+    return _get_encoding(model or os.getenv("OPENAI_MODEL", "gpt-4")) is not None
@@ -0,0 +1,112 @@
+"""
+Train the local fast-path categorizer and report accuracy against the LLM.
+
+The input is a JSON Lines file with one article per line, as written by the
+backend's `python manage.py export_newsqa` command:
+
+    {"id": 118, "uri": "...", "text": "Article body..."}
+
+Lines may also carry their labels, {"main_category": "...", "subcategory": "..."}.
+Articles without a `subcategory` from the categories.json taxonomy are labelled
+by the LLM first (through the result cache, so re-running is cheap). The model
+is then trained on a split of the data and evaluated on the rest, and a table of
+local-vs-LLM accuracy for a range of confidence thresholds is printed.
+
+Usage:
+    python train_classifier.py newsqa.jsonl [--out local_classifier.npz] [--test-size 0.2]
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from dotenv import load_dotenv
+
+from local_classifier import LOCAL_CLASSIFIER_PATH, LocalCategorizer
+from prompts import get_prompt_registry
+
+THRESHOLDS = [0.0, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+
+def load_articles(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def label_with_llm(articles, parents, concurrency):
+    """Fill in main_category/subcategory for articles that have none, using the LLM"""
+    from news_processor import NewsProcessor
+
+    processor = NewsProcessor()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def label(article):
+        async with semaphore:
+            result = await processor.acategorize(article["text"], use_local=False)
+        if result.get("subcategory") in parents:
+            article["subcategory"] = result["subcategory"]
+            article["main_category"] = parents[result["subcategory"]]
+
+    unlabelled = [a for a in articles if a.get("subcategory") not in parents and a.get("text")]
+    print(f"Labelling {len(unlabelled)} articles with the LLM...")
+    await asyncio.gather(*(label(article) for article in unlabelled))
+
+def report(model, texts, labels):
+    """Print accuracy against the reference labels and LLM call rate per threshold"""
+    probs = model.predict_proba(texts)
+    predicted = [model.labels[i] for i in probs.argmax(axis=1)]
+    confidence = probs.max(axis=1)
+    n = len(texts)
+
+    print(f"\nHeld-out articles: {n}")
+    print(f"{'threshold':>9}  {'llm_calls':>9}  {'local_acc':>9}  {'local_main_acc':>14}  {'overall_acc':>11}")
+    for threshold in THRESHOLDS:
+        local = [i for i in range(n) if confidence[i] >= threshold]
+        correct = sum(predicted[i] == labels[i] for i in local)
+        correct_main = sum(model.parents[predicted[i]] == model.parents.get(labels[i]) for i in local)
+        llm_rate = 1 - len(local) / n
+        local_acc = correct / len(local) if local else 0.0
+        local_main_acc = correct_main / len(local) if local else 0.0
+        # Articles below the threshold go to the LLM, whose label is the reference
+        overall = (correct + (n - len(local))) / n
+        print(f"{threshold:>9.2f}  {llm_rate:>9.1%}  {local_acc:>9.1%}  {local_main_acc:>14.1%}  {overall:>11.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local fast-path news categorizer")
+    parser.add_argument("data", help="JSON Lines file of articles (see module docstring)")
+    parser.add_argument("--out", default=LOCAL_CLASSIFIER_PATH, help="Where to write the trained model")
+    parser.add_argument("--test-size", type=float, default=0.2, help="Fraction of articles held out for the report")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent LLM calls while labelling")
+    parser.add_argument("--no-llm", action="store_true", help="Only use articles that already carry labels")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv()
+    parents = {
+        subcategory: category["name"]
+        for category in get_prompt_registry().categories_data["categories"]
+        for subcategory in category["subcategories"]
+    }
+
+    articles = load_articles(args.data)
+    if not args.no_llm:
+        asyncio.run(label_with_llm(articles, parents, args.concurrency))
+    articles = [a for a in articles if a.get("text") and a.get("subcategory") in parents]
+    if len(articles) < 10:
+        raise SystemExit(f"Need at least 10 labelled articles to train, got {len(articles)}")
+
+    random.Random(args.seed).shuffle(articles)
+    n_test = max(1, int(len(articles) * args.test_size))
+    test, train = articles[:n_test], articles[n_test:]
+
+    print(f"Training on {len(train)} articles...")
+    model = LocalCategorizer().fit([a["text"] for a in train], [a["subcategory"] for a in train], parents,
+                                   seed=args.seed)
+    report(model, [a["text"] for a in test], [a["subcategory"] for a in test])
+
+    # Refit on everything for the exported model
+    model = LocalCategorizer().fit([a["text"] for a in articles], [a["subcategory"] for a in articles], parents,
+                                   seed=args.seed)
+    model.save(args.out)
+    print(f"\nSaved model with {len(model.vocabulary)} features and {len(model.labels)} classes to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+# Offline settings for importing the API: the in-process fake LLM and no result cache
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("RESULT_CACHE_ENABLED", "0")
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+import agents
+from agents import Agent, Runner
+from backends import FakeBackend
+from fake_openai import FakeLLM
+from prompts import get_prompt_registry
+from scheduler import Scheduler
+
+ARTICLE = "The city council approved a new budget for public transport on Monday."
+
+@pytest.fixture
+def settled(monkeypatch):
+    """Stream through the fake backend with a TPM budget; returns the (estimated, actual) of each settle"""
+    monkeypatch.setattr(agents, "LLM_TPM_LIMIT", 100000)
+    Runner.set_backend(FakeBackend(FakeLLM(latency="fixed:0", token_delay=0, malformed_rate=0, seed=1)))
+    calls = []
+
+    def settle(self, api_key, estimated, actual):
+        calls.append((estimated, actual))
+
+    monkeypatch.setattr(Scheduler, "settle", settle)
+    yield calls
+    Runner.set_backend(None)
+
+def summarizer():
+    return Agent("summarizer", get_prompt_registry().prompts["SUMMARIZE"].text, api_key="test")
+
+async def stream(agent, pieces=None):
+    text = []
+    generator = Runner.stream(agent, ARTICLE)
+    async for piece in generator:
+        text.append(piece)
+        if pieces is not None and len(text) == pieces:
+            break
+    await generator.aclose()
+    await Runner.aclose()
+    return "".join(text)
+
+def test_streamed_call_is_settled_from_the_usage_chunk(settled):
+    agent = summarizer()
+    text = asyncio.run(stream(agent))
+    messages = Runner._messages(agent, ARTICLE)
+    prompt_tokens = sum(agents.count_tokens(m["content"]) for m in messages)
+    assert settled == [(Runner._estimate_tokens(messages), prompt_tokens + agents.count_tokens(text))]
+
+def test_stream_cut_short_is_settled_from_the_streamed_text(settled):
+    agent = summarizer()
+    text = asyncio.run(stream(agent, pieces=2))
+    estimated = Runner._estimate_tokens(Runner._messages(agent, ARTICLE))
+    prompt_tokens = estimated - agents.LLM_ESTIMATED_COMPLETION_TOKENS
+    assert settled == [(estimated, prompt_tokens + agents.count_tokens(text, agents.MODEL))]
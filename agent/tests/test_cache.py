@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from agents import Agent, Runner, RunResult
+from cache import ResultCache, make_key
+from prompts import prompt_version
+
+ARTICLE = "The city council approved a new budget for public transport on Monday."
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(path=str(tmp_path / "results.sqlite3"), memory_size=2)
+
+def test_memory_tier_evicts_the_least_recently_used(cache):
+    cache.set("a", {"n": 1})
+    cache.set("b", {"n": 2})
+    cache.get("a")
+    cache.set("c", {"n": 3})
+    assert list(cache._memory) == ["a", "c"]
+    # Evicted from memory only: the next read comes from SQLite
+    assert cache.get("b") == {"n": 2}
+    assert cache.stats["disk_hits"] == 1
+
+def test_sqlite_hits_are_promoted_into_memory(tmp_path, cache):
+    cache.set("a", {"n": 1})
+    reopened = ResultCache(path=str(tmp_path / "results.sqlite3"), memory_size=2)
+    assert reopened.get("a") == {"n": 1}
+    assert reopened.get("a") == {"n": 1}
+    assert asyncio.run(reopened.aget("a")) == {"n": 1}
+    assert (reopened.stats["disk_hits"], reopened.stats["memory_hits"]) == (1, 2)
+    assert list(reopened._memory) == ["a"]
+
+def test_expired_entries_are_misses(cache):
+    cache.ttl = -1
+    cache.set("a", {"n": 1})
+    assert cache.get("a") is None
+    assert cache.stats["misses"] == 1
+
+def test_get_and_set_return_copies(cache):
+    value = {"key_points": ["budget"]}
+    cache.set("a", value)
+    value["key_points"].append("set")
+    first = cache.get("a")
+    first["key_points"].append("get")
+    assert cache.get("a") == {"key_points": ["budget"]}
+    assert asyncio.run(cache.aget("a")) is not cache._memory["a"][0]
+
+def test_key_changes_with_the_prompt_version():
+    key = make_key(ARTICLE, "summarize", prompt_version("Summarize the article."), "gpt-4")
+    assert key == make_key("  The city council approved a new budget\nfor public transport on Monday. ", "SUMMARIZE",
+                           prompt_version("Summarize the article."), "gpt-4")
+    assert key != make_key(ARTICLE, "SUMMARIZE", prompt_version("Summarize the article briefly."), "gpt-4")
+    assert key != make_key(ARTICLE, "SUMMARIZE", prompt_version("Summarize the article."), "gpt-4o")
+    old = Agent("summarizer", "Summarize the article.", api_key="test", cache=None)
+    new = Agent("summarizer", "Summarize the article briefly.", api_key="test", cache=None)
+    assert old.cache_key(ARTICLE, "SUMMARIZE") != new.cache_key(ARTICLE, "SUMMARIZE")
+
+def test_use_cache_false_refreshes_the_entry(cache, monkeypatch):
+    outputs = iter(["first", "second", "third"])
+    monkeypatch.setattr(Runner, "run_sync", lambda agent, prompt, timeout=None: RunResult(next(outputs)))
+    agent = Agent("summarizer", "Summarize the article.", api_key="test", cache=cache)
+    parse = lambda output: {"summary": output}
+
+    def run(use_cache=True):
+        return agent._run_cached(ARTICLE, "SUMMARIZE", ARTICLE, parse, use_cache=use_cache)
+
+    assert run() == {"summary": "first"}
+    assert run() == {"summary": "first"}
+    assert run(use_cache=False) == {"summary": "second"}
+    assert run() == {"summary": "second"}
+    assert cache.get(agent.cache_key(ARTICLE, "SUMMARIZE")) == {"summary": "second"}
+
+def test_errors_are_not_cached(cache, monkeypatch):
+    outputs = iter(["not json", "first"])
+    monkeypatch.setattr(Runner, "run_sync", lambda agent, prompt, timeout=None: RunResult(next(outputs)))
+    agent = Agent("summarizer", "Summarize the article.", api_key="test", cache=cache)
+    parse = lambda output: {"error": "bad output"} if output == "not json" else {"summary": output}
+    assert "error" in agent._run_cached(ARTICLE, "SUMMARIZE", ARTICLE, parse)
+    assert agent._run_cached(ARTICLE, "SUMMARIZE", ARTICLE, parse) == {"summary": "first"}
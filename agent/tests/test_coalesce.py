@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from coalesce import SingleFlight
+
+class Backend:
+    """Counts calls and answers once released, so that callers can pile up on one call"""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def complete(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"summary": "A budget was approved.", "key_points": ["budget"]}
+
+async def gather(flight, backend, callers, key="key"):
+    tasks = [asyncio.ensure_future(flight.do(key, backend.complete)) for _ in range(callers)]
+    await asyncio.sleep(0)
+    backend.release.set()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+def test_concurrent_identical_calls_run_the_backend_once():
+    async def main():
+        flight, backend = SingleFlight(), Backend()
+        results = await gather(flight, backend, 5)
+        return flight, backend, results
+
+    flight, backend, results = asyncio.run(main())
+    assert backend.calls == 1
+    assert all(result == results[0] for result in results)
+    assert flight.get_stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0, "coalesced_ratio": 0.8}
+
+def test_different_keys_are_not_coalesced():
+    async def main():
+        flight, backend = SingleFlight(), Backend()
+        tasks = [asyncio.ensure_future(flight.do(key, backend.complete)) for key in ("a", "b")]
+        await asyncio.sleep(0)
+        backend.release.set()
+        await asyncio.gather(*tasks)
+        return backend
+
+    assert asyncio.run(main()).calls == 2
+
+def test_followers_get_a_deep_copy():
+    async def main():
+        flight, backend = SingleFlight(), Backend()
+        return await gather(flight, backend, 3)
+
+    leader, *followers = asyncio.run(main())
+    # What NewsProcessor._with_usage does to its own result
+    for result in followers:
+        result["token_usage"] = {"sent_tokens": 1}
+        result["key_points"].append("transport")
+    assert leader == {"summary": "A budget was approved.", "key_points": ["budget"]}
+    assert followers[0] is not followers[1]
+    assert followers[0]["key_points"] is not followers[1]["key_points"]
+
+def test_leader_exception_reaches_every_waiter_and_clears_the_key():
+    async def main():
+        flight, backend = SingleFlight(), Backend(error=RuntimeError("rate limited"))
+        results = await gather(flight, backend, 3)
+        in_flight = flight.get_stats()["in_flight"]
+        retried = await gather(flight, Backend(), 1)
+        return results, in_flight, retried
+
+    results, in_flight, retried = asyncio.run(main())
+    assert [type(result) for result in results] == [RuntimeError] * 3
+    assert all(str(result) == "rate limited" for result in results)
+    assert in_flight == 0
+    # The next call for the key starts a new call instead of getting the old error
+    assert retried == [{"summary": "A budget was approved.", "key_points": ["budget"]}]
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def main():
+        flight, backend = SingleFlight(), Backend()
+        leader = asyncio.ensure_future(flight.do("key", backend.complete))
+        follower = asyncio.ensure_future(flight.do("key", backend.complete))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        backend.release.set()
+        return backend, await follower
+
+    backend, result = asyncio.run(main())
+    assert backend.calls == 1
+    assert result == {"summary": "A budget was approved.", "key_points": ["budget"]}
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+def test_api_imports_outside_an_event_loop(tmp_path):
+    # Registering the /metrics collectors must not read stats that need the server's event loop
+    env = {**os.environ, "JOBS_DB_PATH": str(tmp_path / "jobs.sqlite3")}
+    result = subprocess.run([sys.executable, "-c", "import api"], cwd=SRC_DIR, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+def test_metrics_are_exported(tmp_path):
+    env = {**os.environ, "JOBS_DB_PATH": str(tmp_path / "jobs.sqlite3")}
+    code = ("from fastapi.testclient import TestClient; import api\n"
+            "with TestClient(api.app) as client:\n"
+            "    body = client.get('/metrics').text\n"
+            "assert 'agent_http_requests_total' in body, body\n")
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+def test_lifespan_starts_and_stops_the_job_workers(tmp_path):
+    env = {**os.environ, "JOBS_DB_PATH": str(tmp_path / "jobs.sqlite3")}
+    code = ("from fastapi.testclient import TestClient; import api\n"
+            "with TestClient(api.app) as client:\n"
+            "    assert len(api.job_workers._tasks) == api.job_workers.workers\n"
+            "assert api.job_workers._tasks == []\n")
+    result = subprocess.run([sys.executable, "-W", "error::DeprecationWarning:api", "-c", code], cwd=SRC_DIR, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
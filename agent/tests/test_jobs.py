@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+import pytest
+from pydantic import ValidationError
+
+from jobs import JobStore, JobWorkerPool, ProgressReporter
+
+async def process(request, report_progress):
+    for done in range(1, request["items"] + 1):
+        report_progress(done)
+    return {"items": request["items"]}
+
+async def run_until_finished(pool, store, job_ids, timeout=10):
+    pool.start()
+    try:
+        async with asyncio.timeout(timeout):
+            while any(store.get(job_id)["status"] in ("queued", "running") for job_id in job_ids):
+                await asyncio.sleep(0.01)
+    finally:
+        await pool.close()
+    return [store.get(job_id) for job_id in job_ids]
+
+def test_bad_callback_url_does_not_stop_the_worker(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    bad = store.create({"items": 2}, 2, callback_url="http://[::1")
+    good = store.create({"items": 3}, 3)
+    pool = JobWorkerPool(store, process, workers=1)
+    bad, good = asyncio.run(run_until_finished(pool, store, [bad["id"], good["id"]]))
+    assert bad["status"] == "done"
+    assert bad["callback_status"] == "failed: InvalidURL"
+    assert good["status"] == "done"
+    assert good["result"] == {"items": 3}
+
+def test_worker_survives_an_error_outside_the_job(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    first = store.create({"items": 1}, 1)
+    second = store.create({"items": 1}, 1)
+    pool = JobWorkerPool(store, process, workers=1)
+    finish = store.finish
+    calls = []
+
+    def finish_fails_once(job_id, result=None, error=None):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise RuntimeError("disk full")
+        finish(job_id, result, error)
+
+    monkeypatch.setattr(store, "finish", finish_fails_once)
+    first, second = asyncio.run(run_until_finished(pool, store, [first["id"], second["id"]]))
+    assert first["status"] == "failed"
+    assert first["error"] == "RuntimeError: disk full"
+    assert second["status"] == "done"
+
+def test_job_request_rejects_a_malformed_callback_url():
+    import api
+    with pytest.raises(ValidationError):
+        api.JobRequest(items=[], callback_url="http://[::1")
+    request = api.JobRequest(items=[], callback_url="https://example.com/hooks/jobs")
+    assert request.model_dump(mode="json")["callback_url"] == "https://example.com/hooks/jobs"
+
+def test_progress_is_written_now_and_then_off_the_event_loop():
+    writes = []
+
+    class Store:
+        def progress(self, job_id, items_done):
+            writes.append((items_done, threading.current_thread() is threading.main_thread()))
+
+    async def report(items):
+        progress = ProgressReporter(Store(), "job", every=25, interval=3600)
+        for done in range(1, items + 1):
+            progress(done)
+            await asyncio.sleep(0.001)
+        await progress.wait()
+
+    asyncio.run(report(100))
+    assert [items_done for items_done, _ in writes] == [25, 50, 75, 100]
+    assert not any(on_loop for _, on_loop in writes)
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import preprocess
+from agents import Agent, Runner
+from backends import FakeBackend
+from fake_openai import FakeLLM
+from preprocess import SENTENCE_RE, Preprocessor, split_chunks, strip_boilerplate, truncate
+from prompts import get_prompt_registry
+from tokens import count_tokens
+
+SENTENCES = [f"In district {i}, the council approved {i} new bus lines for the coming year." for i in range(40)]
+ARTICLE = "\n".join(" ".join(SENTENCES[i:i + 4]) for i in range(0, len(SENTENCES), 4))
+BUDGETS = {"CATEGORIZE": 60, "SUMMARIZE": 300}
+CHUNK_TOKENS = 250
+
+@pytest.fixture
+def preprocessor(monkeypatch):
+    monkeypatch.setattr(preprocess, "MAP_CHUNK_TOKENS", CHUNK_TOKENS)
+    Runner.set_backend(FakeBackend(FakeLLM(latency="fixed:0", token_delay=0, malformed_rate=0, seed=1)))
+    prompt = get_prompt_registry().get("CONDENSE")
+    yield Preprocessor(Agent("condenser", prompt.text, api_key="test"), prompt, budgets=BUDGETS)
+    Runner.set_backend(None)
+
+def test_boilerplate_and_repeated_paragraphs_are_stripped():
+    text = "Advertisement\nThe council met.\n\nRead more: other news\nThe council met.\nhttps://example.com/a\nIt voted."
+    assert strip_boilerplate(text) == "The council met.\nIt voted."
+
+def test_text_is_truncated_at_a_sentence_boundary():
+    text, truncated = truncate(ARTICLE, 60)
+    assert truncated
+    assert count_tokens(text) <= 60
+    assert ARTICLE.startswith(text)
+    assert text.endswith("year.")
+    assert truncate("A short article.", 60) == ("A short article.", False)
+
+def test_sentence_over_the_budget_is_cut_by_characters():
+    text, truncated = truncate("word " * 200, 20)
+    assert truncated
+    assert 0 < count_tokens(text) <= 20
+
+def test_chunks_cover_the_text_within_the_chunk_size():
+    chunks = split_chunks(ARTICLE, CHUNK_TOKENS)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= CHUNK_TOKENS for chunk in chunks)
+    assert " ".join(chunks).split() == ARTICLE.split()
+
+def test_categorize_is_truncated_to_its_budget(preprocessor):
+    prepared = preprocessor.prepare(ARTICLE, "CATEGORIZE")
+    usage = prepared.usage()
+    assert prepared.text == truncate(ARTICLE, BUDGETS["CATEGORIZE"])[0]
+    assert usage["truncated"] and usage["condensed_chunks"] == 0
+    assert usage["sent_tokens"] <= BUDGETS["CATEGORIZE"]
+    assert usage["saved_tokens"] == usage["original_tokens"] - usage["sent_tokens"] > 0
+
+def test_text_within_the_budget_is_sent_whole(preprocessor):
+    prepared = preprocessor.prepare(ARTICLE.split("\n")[0], "SUMMARIZE")
+    assert prepared.text == ARTICLE.split("\n")[0]
+    assert prepared.usage()["saved_tokens"] == 0
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_long_article_is_condensed_chunk_by_chunk(preprocessor, asynchronous):
+    if asynchronous:
+        prepared = asyncio.run(preprocessor.aprepare(ARTICLE, "SUMMARIZE"))
+    else:
+        prepared = preprocessor.prepare(ARTICLE, "SUMMARIZE")
+    chunks = split_chunks(ARTICLE, CHUNK_TOKENS)
+    usage = prepared.usage()
+    assert usage["condensed_chunks"] == len(chunks)
+    assert usage["map_tokens"] == sum(count_tokens(chunk) for chunk in chunks)
+    assert usage["sent_tokens"] <= BUDGETS["SUMMARIZE"]
+    # The fake condenses a chunk to its first three sentences
+    assert prepared.text.split("\n") == [" ".join(SENTENCE_RE.split(chunk)[:3]) for chunk in chunks]
+
+def test_failed_chunk_keeps_its_truncated_text(preprocessor, monkeypatch):
+    chunks = split_chunks(ARTICLE, CHUNK_TOKENS)
+    original = Agent._arun_cached
+
+    async def fail_first(agent, text, *args, **kwargs):
+        if text.endswith(chunks[0]):
+            raise TimeoutError("condensing timed out")
+        return await original(agent, text, *args, **kwargs)
+
+    monkeypatch.setattr(Agent, "_arun_cached", fail_first)
+    prepared = asyncio.run(preprocessor.aprepare(ARTICLE, "SUMMARIZE"))
+    share = BUDGETS["SUMMARIZE"] // len(chunks)
+    assert prepared.text.startswith(truncate(chunks[0], share)[0])
+    assert prepared.usage()["condensed_chunks"] == len(chunks)
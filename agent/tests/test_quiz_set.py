@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from quiz_set import QUIZ_MAX_COUNT, check_request, dedupe_questions, parse_quiz_set, select_questions
+
+def question(text, answer="Monday", difficulty=None):
+    result = {"question": text, "choices": {"A": answer, "B": "Tuesday", "C": "Friday", "D": "Sunday"},
+              "correct_answer": "A", "explanation": "The article says so."}
+    if difficulty:
+        result["difficulty"] = difficulty
+    return result
+
+def test_count_defaults_to_the_mix_total():
+    count, difficulty, instruction, error = check_request(difficulty={"Easy": 2, "hard": 1, "medium": 0})
+    assert error is None
+    assert (count, difficulty) == (3, {"easy": 2, "hard": 1})
+    assert instruction == "Write 3 questions (2 easy, 1 hard), plus 1 spare questions of any difficulty."
+    assert check_request() == (1, {}, "Write 1 questions.", None)
+    assert check_request(count=4)[2] == "Write 5 questions."
+
+@pytest.mark.parametrize("count, difficulty, error", [
+    (0, None, f"count must be between 1 and {QUIZ_MAX_COUNT}"),
+    (QUIZ_MAX_COUNT + 1, None, f"count must be between 1 and {QUIZ_MAX_COUNT}"),
+    (3, {"easy": 1, "hard": 1}, "The difficulty mix adds up to 2, not 3"),
+    (2, {"trivial": 2}, "Invalid difficulty: trivial. Must be any of: easy, medium, hard"),
+    (2, {"easy": -1, "hard": 3}, "Difficulty counts must be non-negative integers"),
+    (2, {"easy": 1.5}, "Difficulty counts must be non-negative integers"),
+])
+def test_invalid_requests_are_errors(count, difficulty, error):
+    assert check_request(count, difficulty) == (None, None, None, {"error": error})
+
+def test_reworded_questions_are_duplicates():
+    questions = [
+        question("When did the city council approve the transport budget?"),
+        question("On which day did the city council approve the transport budget?"),
+        question("Which body approved the new budget?", answer="The city council"),
+    ]
+    kept, removed = dedupe_questions(questions)
+    assert kept == [questions[0], questions[2]]
+    assert removed == 1
+
+def test_same_answer_lowers_the_threshold():
+    first = question("When was the public transport budget approved?")
+    second = question("When did the council vote on the public transport budget?")
+    third = question("When did the council vote on the public transport budget?", answer="Wednesday")
+    assert dedupe_questions([first, second]) == ([first], 1)
+    assert dedupe_questions([first, third], threshold=0.7) == ([first, third], 0)
+
+def test_difficulty_mix_is_filled_first():
+    questions = [question(f"Question {i}?", difficulty=level)
+                 for i, level in enumerate(["easy", "easy", "easy", "hard", "medium"])]
+    assert select_questions(questions, 3, {"easy": 1, "hard": 1}) == [questions[0], questions[1], questions[3]]
+    assert select_questions(questions, 2) == questions[:2]
+
+def test_fewer_distinct_questions_than_requested():
+    output = json.dumps({"questions": [
+        question("When did the city council approve the transport budget?", difficulty="easy"),
+        question("On which day did the city council approve the transport budget?", difficulty="hard"),
+    ]})
+    result = parse_quiz_set(output, 2, {"easy": 1, "hard": 1})
+    assert [q["question"] for q in result["questions"]] == ["When did the city council approve the transport budget?"]
+    assert (result["requested"], result["duplicates_removed"]) == (2, 1)
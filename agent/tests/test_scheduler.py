@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+import agents
+from agents import Agent, Runner
+from backends import FakeBackend
+from fake_openai import FakeLLM
+from scheduler import LLM_BACKOFF_MAX, Scheduler, TokenBucket, backoff, priority, retry_after
+
+def test_token_bucket_refills_continuously_up_to_its_capacity():
+    bucket = TokenBucket(60)
+    bucket.updated = 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now=0.0) == 1.0
+    assert bucket.wait_time(1, now=0.5) == 0.5
+    assert bucket.wait_time(1, now=1.0) == 0.0
+    assert bucket.tokens == 1.0
+    bucket.wait_time(1, now=1000.0)
+    assert bucket.tokens == 60.0
+
+def test_oversized_request_waits_for_a_full_bucket():
+    bucket = TokenBucket(60)
+    bucket.updated = 0.0
+    bucket.take(30)
+    assert bucket.wait_time(600, now=0.0) == 30.0
+    assert bucket.wait_time(600, now=30.0) == 0.0
+
+def test_queued_calls_are_dispatched_by_priority_then_in_order():
+    async def main():
+        # 6000 RPM with an empty bucket: one call every 10 ms, so every call queues
+        scheduler = Scheduler(["key"], rpm=6000, tpm=0, headroom=1.0)
+        scheduler.keys[0].requests.take(scheduler.keys[0].requests.tokens)
+        order = []
+
+        async def call(name, level):
+            with priority(level):
+                await scheduler.acquire(1)
+            order.append(name)
+
+        calls = [call("bulk 1", "bulk"), call("default", "default"), call("bulk 2", "bulk"),
+                 call("interactive 1", "interactive"), call("interactive 2", "interactive")]
+        async with asyncio.timeout(5):
+            await asyncio.gather(*calls)
+        scheduler.close()
+        return order, scheduler.stats["dispatched"]
+
+    order, dispatched = asyncio.run(main())
+    assert order == ["interactive 1", "interactive 2", "default", "bulk 1", "bulk 2"]
+    assert dispatched == 5
+
+def rate_limit_error(headers):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+@pytest.mark.parametrize("headers, seconds", [
+    ({"retry-after": "7"}, 7.0),
+    ({"retry-after-ms": "1500", "retry-after": "7"}, 1.5),
+    ({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}, None),
+    ({}, None),
+])
+def test_retry_after_is_read_from_the_response(headers, seconds):
+    assert retry_after(rate_limit_error(headers)) == seconds
+
+def test_backoff_is_never_shorter_than_retry_after():
+    assert all(backoff(attempt, 7.0) >= 7.0 for attempt in range(5))
+    assert all(0 <= backoff(attempt) <= LLM_BACKOFF_MAX for attempt in range(10))
+
+def test_rate_limited_call_is_retried_after_retry_after(monkeypatch):
+    monkeypatch.setattr(agents, "LLM_MAX_RETRIES", 1)
+    Runner.set_backend(FakeBackend(FakeLLM(latency="fixed:0", token_delay=0, rate_limit_rate=1.0, retry_after=7,
+                                           seed=1)))
+    cool_downs, sleeps = [], []
+    monkeypatch.setattr(Scheduler, "cool_down", lambda self, api_key, seconds: cool_downs.append(seconds))
+    sleep = asyncio.sleep
+
+    async def record_sleep(delay, *args, **kwargs):
+        sleeps.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(agents.asyncio, "sleep", record_sleep)
+
+    async def main():
+        try:
+            await Runner.run(Agent("summarizer", "Summarize the article.", api_key="test"), "An article.")
+        finally:
+            await Runner.aclose()
+
+    try:
+        with pytest.raises(openai.RateLimitError):
+            asyncio.run(main())
+    finally:
+        Runner.set_backend(None)
+    # One retry: the key cools down, and the call waits, for at least the Retry-After
+    assert len(cool_downs) == 1 and cool_downs[0] >= 7
+    assert cool_downs[0] in sleeps
@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+from agents import Agent, Runner, RunResult
+from prompts import get_prompt_registry
+from structured import extract_json, get_output_stats, parse_structured
+
+SUMMARY = {"summary": "A budget was approved.", "key_points": ["budget"], "entities": ["city council"]}
+
+def test_plain_json_is_not_repaired():
+    assert extract_json(json.dumps(SUMMARY)) == (SUMMARY, False)
+
+@pytest.mark.parametrize("output", [
+    "```json\n" + json.dumps(SUMMARY) + "\n```",
+    "```\n" + json.dumps(SUMMARY) + "\n```",
+    "Here is the summary:\n" + json.dumps(SUMMARY) + "\nLet me know if you need anything else.",
+    "Sure! ```json\n" + json.dumps(SUMMARY) + "``` Hope this helps.",
+])
+def test_fences_and_prose_are_stripped(output):
+    assert extract_json(output) == (SUMMARY, True)
+
+def test_trailing_commas_are_removed():
+    output = '{"summary": "A budget was approved.", "key_points": ["budget",], "entities": ["city council",],}'
+    assert extract_json(output) == (SUMMARY, True)
+
+@pytest.mark.parametrize("output, expected", [
+    ('{"a": 1, "b": [1, 2', {"a": 1, "b": [1, 2]}),
+    ('{"a": 1, "b": "cut o', {"a": 1, "b": "cut o"}),
+    ('{"a": {"b": 1},', {"a": {"b": 1}}),
+    ('{"a": 1, "b":', {"a": 1}),
+    ('{"a": 1, "unfinished_ke', {"a": 1}),
+])
+def test_truncated_objects_are_closed(output, expected):
+    assert extract_json(output) == (expected, True)
+
+@pytest.mark.parametrize("output", ["", "no json here", "[1, 2, 3]"])
+def test_unusable_output_is_an_error(output):
+    result = parse_structured("SUMMARIZE", output)
+    assert "error" in result
+    assert result["raw_output"] == output
+
+def test_schema_violation_is_an_error():
+    result = parse_structured("SUMMARIZE", json.dumps({"summary": "A budget was approved."}))
+    assert result["error"].startswith("Failed to parse summarize result: key_points: Field required")
+
+class ScriptedRunner:
+    """Stands in for Runner.run_sync/Runner.run, answering with the given outputs in turn"""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.prompts = []
+
+    def run_sync(self, agent, prompt, timeout=None):
+        self.prompts.append(prompt)
+        return RunResult(self.outputs.pop(0))
+
+    async def run(self, agent, prompt, timeout=None):
+        return self.run_sync(agent, prompt, timeout=timeout)
+
+@pytest.fixture
+def scripted(monkeypatch):
+    def script(*outputs):
+        runner = ScriptedRunner(*outputs)
+        monkeypatch.setattr(Runner, "run_sync", runner.run_sync)
+        monkeypatch.setattr(Runner, "run", runner.run)
+        return runner
+    return script
+
+def summarize(agent, prompt, asynchronous=False):
+    parse = lambda output: parse_structured("SUMMARIZE", output)
+    if asynchronous:
+        return asyncio.run(agent._acomplete("SUMMARIZE", prompt, parse))
+    return agent._complete("SUMMARIZE", prompt, parse)
+
+def summarizer():
+    return Agent("summarizer", get_prompt_registry().prompts["SUMMARIZE"].text, api_key="test")
+
+def retry_counts():
+    counts = get_output_stats().get_stats().get("SUMMARIZE", {})
+    return counts.get("retries", 0), counts.get("retry_failures", 0)
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_unusable_output_is_retried_once_with_the_error(scripted, asynchronous):
+    runner = scripted("not json", json.dumps(SUMMARY))
+    retries, failures = retry_counts()
+    assert summarize(summarizer(), "Summarize this.", asynchronous) == SUMMARY
+    assert len(runner.prompts) == 2
+    assert runner.prompts[1].startswith("Summarize this.\n\nYour previous answer could not be used (")
+    assert "No JSON object in output" in runner.prompts[1]
+    assert "not json" in runner.prompts[1]
+    assert retry_counts() == (retries + 1, failures)
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_failed_retry_is_not_retried_again(scripted, asynchronous):
+    runner = scripted("not json", "still not json", json.dumps(SUMMARY))
+    retries, failures = retry_counts()
+    result = summarize(summarizer(), "Summarize this.", asynchronous)
+    assert result["raw_output"] == "still not json"
+    assert len(runner.prompts) == 2
+    assert retry_counts() == (retries + 1, failures + 1)
+
+def test_repaired_output_is_not_retried(scripted):
+    runner = scripted("```json\n" + json.dumps(SUMMARY) + "\n```")
+    assert summarize(summarizer(), "Summarize this.") == SUMMARY
+    assert len(runner.prompts) == 1
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(using, **kwargs):
+    # Rebuilding news_newsqa in a migration drops its triggers; put them back once the index exists
+    from django.db import connections
+    from .search import FTS_TABLE, install_index
+
+    connection = connections[using]
+    if FTS_TABLE in connection.introspection.table_names():
+        install_index(connection)
 
 
 class NewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news'
+
+    def ready(self):
+        from . import category_tree, preferences  # noqa: F401 -- connect their cache invalidation signals
+
+        post_migrate.connect(install_search_index, sender=self)
@@ -0,0 +1,142 @@
+"""
+Process-wide in-memory index of the NewsCategory tree.
+
+The tree is loaded with one query the first time it is needed and kept until a
+category changes. Saving or deleting a NewsCategory stores a new version token in
+Django's cache, and every process reloads its tree when it sees a token other
+than the one it loaded. With a per-process cache backend, other processes only
+notice after CATEGORY_TREE_CHECK_INTERVAL seconds at the latest, when they
+reload anyway.
+
+Lookups by id, uri and name, the ids of a category's whole subtree (for one
+category_id IN (...) query) and the nested tree served by the API all come from
+memory.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import NewsCategory
+
+VERSION_KEY = 'news:category-tree-version'
+
+
+class CategoryTree:
+    """
+    The live (not soft-deleted) categories as a tree. A category whose parent is
+    deleted or missing counts as a root.
+    """
+
+    def __init__(self, categories):
+        # id -> {"id", "name", "uri", "parent_category"}, the shape of NewsCategorySerializer
+        self.nodes = {category['id']: category for category in categories}
+        self.children = {pk: [] for pk in self.nodes}
+        self.roots = []
+        for pk, node in sorted(self.nodes.items()):
+            if node['parent_category'] in self.nodes:
+                self.children[node['parent_category']].append(pk)
+            else:
+                self.roots.append(pk)
+
+        self.by_uri = {node['uri']: pk for pk, node in self.nodes.items()}
+        # Names repeat across branches: every id with the name, lowest first
+        self.by_name = {}
+        for pk, node in sorted(self.nodes.items()):
+            self.by_name.setdefault(node['name'], []).append(pk)
+
+        # Children come after their parent in this order, so walking it backwards fills every
+        # descendant set before the set of the parent that includes it
+        order = []
+        stack = list(self.roots)
+        while stack:
+            pk = stack.pop()
+            order.append(pk)
+            stack.extend(self.children[pk])
+        self.descendants = {}
+        for pk in reversed(order):
+            ids = {pk}
+            for child in self.children[pk]:
+                ids |= self.descendants[child]
+            self.descendants[pk] = frozenset(ids)
+
+        self._nested = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, pk):
+        return self.nodes.get(pk)
+
+    def find(self, key):
+        """The id of the category with this id or uri (an int or a digit string is taken as an id)"""
+        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+            return int(key) if int(key) in self.nodes else None
+        return self.by_uri.get(key)
+
+    def find_by_name(self, name):
+        """The lowest id of the categories with this name"""
+        ids = self.by_name.get(name)
+        return ids[0] if ids else None
+
+    def subtree_ids(self, pk):
+        """pk and the ids of all its descendants (empty for an unknown id)"""
+        return self.descendants.get(pk, frozenset())
+
+    def nested(self, pk=None):
+        """The tree (or the subtree under pk) as nested dicts with their "children"; built once"""
+        if self._nested is None:
+            nested = {key: {**node, 'children': []} for key, node in self.nodes.items()}
+            for parent, children in self.children.items():
+                nested[parent]['children'] = [nested[child] for child in children]
+            self._nested = nested
+        return [self._nested[root] for root in self.roots] if pk is None else self._nested.get(pk)
+
+
+_lock = threading.Lock()
+_tree = None
+_version = None
+_loaded_at = 0.0
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _is_current(version):
+    return (_tree is not None and version == _version
+            and time.monotonic() - _loaded_at < settings.CATEGORY_TREE_CHECK_INTERVAL)
+
+
+def get_category_tree():
+    """The CategoryTree of this process, reloaded when a category changed since it was loaded"""
+    global _tree, _version, _loaded_at
+    version = _current_version()
+    if _is_current(version):
+        return _tree
+    with _lock:
+        if not _is_current(version):
+            _tree = CategoryTree(list(NewsCategory.objects.values('id', 'name', 'uri', 'parent_category')))
+            _version = version
+            _loaded_at = time.monotonic()
+        return _tree
+
+
+def invalidate_category_tree():
+    """Make every process reload its tree on its next lookup, once the transaction commits"""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+
+@receiver(post_save, sender=NewsCategory)
+@receiver(post_delete, sender=NewsCategory)
+def category_changed(sender, **kwargs):
+    invalidate_category_tree()
@@ -0,0 +1,231 @@
+"""
+Background news ingestion.
+
+An IngestionRun fetches recent articles for the root categories from
+EventRegistry (several categories at once), drops the ones already stored with a
+single uri lookup per category, sends the rest to the agent's /batch endpoint in
+batches of BATCH_SIZE articles (processed QUIZ_CONCURRENCY at a time by the agent)
+and bulk inserts the generated questions as NewsQa rows. Progress and counters are
+saved on the run as it goes, so they can be read through the API while it runs.
+
+Runs are started by `python manage.py ingest_news` (in the foreground) or by the
+ingestion-runs endpoint (in a background thread).
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from eventregistry import EventRegistry, QueryArticlesIter
+
+from .models import IngestionRun, NewsCategory, NewsQa
+from .service import create_newsqa_rows
+
+logger = logging.getLogger(__name__)
+
+
+def ingestion_options(**overrides):
+    """NEWS_INGESTION settings with lower-case keys, updated with the non-empty overrides"""
+    options = {key.lower(): value for key, value in settings.NEWS_INGESTION.items()}
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+
+class IngestionPipeline:
+    """Runs one IngestionRun to completion, recording its progress and stats on it"""
+
+    def __init__(self, run, event_registry=None, session=None):
+        self.run = run
+        self.options = ingestion_options(**run.options)
+        self.event_registry = event_registry or EventRegistry(apiKey=settings.EVENTREGISTRY_API_KEY)
+        self.session = session or requests.Session()
+        self.stats = {
+            'categories': 0,
+            'categories_done': 0,
+            'fetch_errors': 0,
+            'articles_fetched': 0,
+            'duplicates': 0,
+            'quiz_requested': 0,
+            'quiz_failed': 0,
+            'created': 0,
+        }
+        self._seen_uris = set()
+
+    def execute(self):
+        run = self.run
+        run.status = IngestionRun.STATUS_RUNNING
+        run.started_at = timezone.now()
+        run.save(update_fields=['status', 'started_at', 'updated_at'])
+        try:
+            self._ingest()
+            run.status = IngestionRun.STATUS_DONE
+        except Exception as e:
+            logger.exception("Ingestion run %s failed", run.id)
+            run.status = IngestionRun.STATUS_FAILED
+            run.error = str(e)
+        run.stats = self.stats
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'error', 'stats', 'finished_at', 'updated_at'])
+        return run
+
+    def _categories(self):
+        categories = NewsCategory.objects.filter(parent_category=None)
+        if self.options.get('categories'):
+            categories = categories.filter(uri__in=self.options['categories'])
+        return list(categories)
+
+    def _fetch(self, category):
+        """Recent articles of one category; runs in a worker thread and does not touch the database"""
+        query = {
+            "$query": {"categoryUri": category.uri},
+            "$filter": {"forceMaxDataTimeWindow": str(self.options['max_days'])},
+        }
+        articles = QueryArticlesIter.initWithComplexQuery(query)
+        return list(articles.execQuery(self.event_registry, maxItems=self.options['max_articles_per_category']))
+
+    def _new_articles(self, category, articles):
+        """The articles with a body that are neither stored (soft-deleted rows included) nor already queued"""
+        articles = [article for article in articles if article.get('uri') and article.get('body')]
+        uris = [article['uri'] for article in articles]
+        known = set(NewsQa.all_objects.filter(uri__in=uris).values_list('uri', flat=True)) | self._seen_uris
+        new = []
+        for article in articles:
+            if article['uri'] in known:
+                self.stats['duplicates'] += 1
+                continue
+            known.add(article['uri'])
+            self._seen_uris.add(article['uri'])
+            new.append((category, article))
+        return new
+
+    def _generate(self, batch):
+        """Quiz results by article uri, from one /batch call streaming NDJSON"""
+        response = self.session.post(
+            f"{settings.QUIZ_SERVICE_URL.rstrip('/')}/batch",
+            json={
+                "items": [{"id": article['uri'], "text": article['body']} for _, article in batch],
+                "tasks": ["QUIZ"],
+                "concurrency": self.options['quiz_concurrency'],
+                "priority": "bulk",
+            },
+            stream=True,
+            timeout=(10, self.options['quiz_timeout']),
+        )
+        response.raise_for_status()
+        results = {}
+        for line in response.iter_lines():
+            if line:
+                result = json.loads(line)
+                results[result['id']] = result
+        return results
+
+    def _process_batch(self, batch):
+        self.stats['quiz_requested'] += len(batch)
+        try:
+            results = self._generate(batch)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Quiz service batch of %s articles failed: %s", len(batch), e)
+            self.stats['quiz_failed'] += len(batch)
+            return
+
+        rows = []
+        for category, article in batch:
+            quiz = (results.get(article['uri']) or {}).get('quiz')
+            if not quiz or 'error' in quiz:
+                # The quiz service could not produce a valid question even after its retry
+                self.stats['quiz_failed'] += 1
+                continue
+            rows.append(NewsQa(
+                category=category,
+                question=quiz["question"],
+                answer=quiz["correct_answer"],
+                description=quiz["explanation"],
+                options=quiz["choices"],
+                paragraph=article["body"],
+                uri=article["uri"],
+            ))
+        # A concurrent writer may have stored some of the uris meanwhile; those rows are left out
+        created = create_newsqa_rows(rows, chunk_size=self.options['batch_size'])
+        self.stats['created'] += len(created)
+        self.stats['duplicates'] += len(rows) - len(created)
+
+    def _save_progress(self):
+        self.run.stats = self.stats
+        self.run.save(update_fields=['stats', 'updated_at'])
+
+    def _ingest(self):
+        categories = self._categories()
+        self.stats['categories'] = len(categories)
+        self._save_progress()
+
+        # The options may come from settings or the ingest_news command, which do not validate them
+        batch_size = max(1, self.options['batch_size'])
+        pending = []
+        with ThreadPoolExecutor(max_workers=max(1, self.options['fetch_workers'])) as pool:
+            futures = {pool.submit(self._fetch, category): category for category in categories}
+            # Questions are generated while the remaining categories are still being fetched
+            for future in as_completed(futures):
+                category = futures[future]
+                try:
+                    articles = future.result()
+                except Exception as e:
+                    logger.warning("Fetching articles for %s failed: %s", category.uri, e)
+                    self.stats['fetch_errors'] += 1
+                    articles = []
+                self.stats['articles_fetched'] += len(articles)
+                self.stats['categories_done'] += 1
+                pending.extend(self._new_articles(category, articles))
+                while len(pending) >= batch_size:
+                    self._process_batch(pending[:batch_size])
+                    pending = pending[batch_size:]
+                self._save_progress()
+        if pending:
+            self._process_batch(pending)
+
+
+def start_run(trigger='api', **options):
+    """
+    Create a queued IngestionRun unless one is already active.
+
+    Returns (run, created); when a run is already queued or running (even one
+    created concurrently), that run is returned instead. Runs that stopped
+    reporting progress for STALE_AFTER seconds are marked failed first.
+    """
+    stale_after = timedelta(seconds=ingestion_options()['stale_after'])
+    active = IngestionRun.objects.filter(status__in=[IngestionRun.STATUS_QUEUED, IngestionRun.STATUS_RUNNING])
+    active.filter(updated_at__lt=timezone.now() - stale_after).update(
+        status=IngestionRun.STATUS_FAILED, error="No progress reported; the process running it stopped",
+        finished_at=timezone.now(),
+    )
+    run = active.order_by('-created_at').first()
+    if run is not None:
+        return run, False
+    options = {key: value for key, value in options.items() if value is not None}
+    try:
+        with transaction.atomic():
+            return IngestionRun.objects.create(trigger=trigger, options=options), True
+    except IntegrityError:
+        # Another caller created a run since the lookup; the ingestionrun_single_active constraint kept it the only one
+        run = active.order_by('-created_at').first()
+        if run is None:
+            raise
+        return run, False
+
+
+def _execute_in_thread(run_id):
+    try:
+        IngestionPipeline(IngestionRun.objects.get(pk=run_id)).execute()
+    finally:
+        close_old_connections()
+
+
+def run_in_background(run):
+    """Execute run in a daemon thread of this process"""
+    thread = threading.Thread(target=_execute_in_thread, args=(run.id,), name=f"ingestion-run-{run.id}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from news.models import NewsCategory, NewsQa
+from news.pagination import KeysetPagination
+from news.search import search
+from news.serializers import NewsQaReadSerializer, NewsQaSerializer
+from news.views import NewsQaViewSet
+
+WORDS = """government minister announced plan budget city council company shares market rose fell percent
+report study researchers found university hospital patients climate energy wind solar project court ruled
+police said officials election voters campaign team season coach match players league record launch rocket
+mission space agency technology startup investors funding million billion year week today country region""".split()
+
+
+# Put in one synthetic article out of RARE_EVERY, for a selective search
+RARE_WORD = "quokka"
+RARE_EVERY = 100
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Time the NewsQa list and search paths over synthetic rows. The rows are added inside a transaction "
+            "that is rolled back, so the database is left as it was.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Synthetic NewsQa rows to add")
+        parser.add_argument('--categories', type=int, default=50, help="Synthetic categories to spread them over")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per path")
+        parser.add_argument('--search', default="quokka",
+                            help=f"Words searched for by the search paths; {RARE_WORD!r} is in 1% of the rows, "
+                                 f"the other words of WORDS in most of them")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options['rows'], options['categories'])
+                self.stdout.write(f"{NewsQa.objects.count()} NewsQa rows, {options['repeat']} runs per path")
+                self.stdout.write(f"{'path':<45} {'median ms':>10} {'min ms':>10} {'queries':>8}")
+                for name, run in self.paths(options['search']):
+                    self.report(name, run, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rows, categories):
+        rng = random.Random(0)
+        created = NewsCategory.objects.bulk_create(
+            NewsCategory(name=f"Benchmark {i}", uri=f"benchmark/{i}") for i in range(categories)
+        )
+        category_ids = list(NewsCategory.objects.filter(uri__in=[c.uri for c in created]).values_list('id', flat=True))
+        self.category_ids = category_ids
+
+        def text(words):
+            return " ".join(rng.choice(WORDS) for _ in range(words))
+
+        NewsQa.objects.bulk_create(
+            (
+                NewsQa(category_id=rng.choice(category_ids), question=text(12) + "?", answer="A",
+                       description=text(25), options={"A": text(3), "B": text(3), "C": text(3), "D": text(3)},
+                       paragraph=text(300) + (f" {RARE_WORD}" if i % RARE_EVERY == 0 else ""),
+                       uri=f"benchmark-{i}")
+                for i in range(rows)
+            ),
+            batch_size=500,
+        )
+
+    def paths(self, words):
+        client = APIClient()
+        request = APIRequestFactory().get('/', {'search': words})
+        request = Request(request)
+        like_search = SearchFilter()
+        # A user following a few categories: the page is one sorted IN query, or one index range per category
+        followed = self.category_ids[:5]
+        in_followed = NewsQaReadSerializer.values(NewsQa.objects.filter(category_id__in=followed))
+        return [
+            # What GET /newsqa/ did before: model instances, one category query per row
+            ("NewsQaSerializer, no select_related",
+             lambda: NewsQaSerializer(NewsQa.objects.order_by('-created_at'), many=True).data),
+            ("NewsQaSerializer, select_related",
+             lambda: NewsQaSerializer(NewsQa.objects.select_related('category').order_by('-created_at'),
+                                      many=True).data),
+            ("NewsQaReadSerializer (values)",
+             lambda: NewsQaReadSerializer(NewsQaReadSerializer.values(NewsQa.objects.order_by('-created_at'))).data),
+            ("GET /api/news/newsqa/", lambda: client.get('/api/news/newsqa/').content),
+            ("Page of 5 categories, category_id IN (...)",
+             lambda: list(in_followed.order_by('-created_at', '-id')[:51])),
+            ("Page of 5 categories, merged per category",
+             lambda: KeysetPagination().merge_categories(in_followed, followed, 'created_at', True, 51)),
+            # What ?search= did before: LIKE '%word%' over the four text columns
+            ("SearchFilter (LIKE), all matches",
+             lambda: list(like_search.filter_queryset(request, NewsQa.objects.all(), NewsQaViewSet).values('id'))),
+            ("FTS5 MATCH, all matches",
+             lambda: list(search(NewsQa.objects.all(), words).values('id'))),
+            ("FTS5 MATCH, top 20 by BM25 with snippets",
+             lambda: list(search(NewsQa.objects.all(), words).order_by('rank').values('id', 'snippet')[:20])),
+            ("GET /api/news/newsqa/search/",
+             lambda: client.get('/api/news/newsqa/search/', {'q': words}).content),
+        ]
+
+    def report(self, name, run, repeat):
+        timings, queries = [], []
+
+        def count_query(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        for _ in range(repeat):
+            queries.append(0)
+            with connection.execute_wrapper(count_query):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f"{name:<45} {statistics.median(timings):>10.1f} {min(timings):>10.1f} {queries[-1]:>8}")
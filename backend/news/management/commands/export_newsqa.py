@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from news.models import NewsQa
+
+
+class Command(BaseCommand):
+    # No category: the stored categories are EventRegistry ones, not the categories.json taxonomy the
+    # categorizer predicts, so train_classifier.py labels the articles with the LLM instead
+    help = "Export NewsQa articles as JSON Lines for training the agent's local categorizer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help="File to write to (defaults to stdout)")
+        parser.add_argument('--limit', type=int, help="Export at most this many articles")
+
+    def handle(self, *args, **options):
+        queryset = (
+            NewsQa.objects.exclude(paragraph__isnull=True).exclude(paragraph='')
+            .only('id', 'uri', 'paragraph').order_by('id')
+        )
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        output = open(options['output'], 'w') if options['output'] else self.stdout
+        count = 0
+        try:
+            for item in queryset.iterator(chunk_size=500):
+                output.write(json.dumps({
+                    'id': item.id,
+                    'uri': item.uri,
+                    'text': item.paragraph,
+                }) + '\n')
+                count += 1
+        finally:
+            if options['output']:
+                output.close()
+        self.stderr.write(f"Exported {count} articles")
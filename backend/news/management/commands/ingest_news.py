@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from news.ingestion import IngestionPipeline, start_run
+from news.models import IngestionRun
+
+
+class Command(BaseCommand):
+    help = "Fetch recent articles for the root categories and store generated quiz questions as NewsQa"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', nargs='+', metavar='URI', help="Only ingest these root category URIs")
+        parser.add_argument('--max-articles', type=int, help="Articles fetched per category")
+        parser.add_argument('--batch-size', type=int, help="Articles per quiz service call and bulk insert")
+        parser.add_argument('--quiz-concurrency', type=int, help="Articles the quiz service works on at once")
+
+    def handle(self, *args, **options):
+        run, created = start_run(
+            trigger='command',
+            categories=options['categories'],
+            max_articles_per_category=options['max_articles'],
+            batch_size=options['batch_size'],
+            quiz_concurrency=options['quiz_concurrency'],
+        )
+        if not created:
+            self.stderr.write(f"Ingestion run {run.id} is already {run.status}")
+            return
+
+        self.stderr.write(f"Started ingestion run {run.id}")
+        run = IngestionPipeline(run).execute()
+        self.stdout.write(json.dumps(run.stats, indent=2))
+        if run.status == IngestionRun.STATUS_FAILED:
+            self.stderr.write(f"Ingestion run {run.id} failed: {run.error}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news.search import is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = ("Recreate the NewsQa full-text search index (news/search.py) and its sync triggers, "
+            "then reindex every live row")
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError("The full-text search index needs SQLite with FTS5")
+        count = rebuild_index()
+        self.stderr.write(f"Indexed {count} questions")
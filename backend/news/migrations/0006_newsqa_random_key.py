@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 10:39
+
+import news.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_random_keys(apps, schema_editor):
+    # AddField evaluates the default once, so existing rows would all share one key. One UPDATE
+    # in the database instead of loading every row; SQLite's random() is a signed 64-bit integer
+    if schema_editor.connection.vendor == 'sqlite':
+        expression = "random() / 18446744073709551616.0 + 0.5"
+    else:
+        expression = "random()"
+    table = apps.get_model('news', 'NewsQa')._meta.db_table
+    schema_editor.execute(f"UPDATE {table} SET random_key = {expression}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0005_ingestionrun'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsqa',
+            name='random_key',
+            field=models.FloatField(default=news.models.new_random_key, editable=False),
+        ),
+        migrations.RunPython(fill_random_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='newsqa',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['random_key'], name='newsqa_random_key'),
+        ),
+        migrations.AddIndex(
+            model_name='newsqa',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['category', 'random_key'], name='newsqa_category_random_key'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 10:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_newsqa_random_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='newsqa',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['created_at', 'id'], name='newsqa_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='newsqa',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['category', 'created_at', 'id'], name='newsqa_category_created_at'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+# The FTS5 index of news/search.py as it was when this migration was written; later changes to the index
+# go in migrations of their own
+
+INSTALL_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS newsqa_fts USING fts5(question, answer, description, paragraph,"
+    " content='news_newsqa', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS newsqa_fts_insert AFTER INSERT ON news_newsqa WHEN new.is_deleted = 0 BEGIN"
+    " INSERT INTO newsqa_fts (rowid, question, answer, description, paragraph)"
+    " VALUES (new.id, new.question, new.answer, new.description, new.paragraph); END",
+    "CREATE TRIGGER IF NOT EXISTS newsqa_fts_delete AFTER DELETE ON news_newsqa WHEN old.is_deleted = 0 BEGIN"
+    " INSERT INTO newsqa_fts (newsqa_fts, rowid, question, answer, description, paragraph)"
+    " VALUES ('delete', old.id, old.question, old.answer, old.description, old.paragraph); END",
+    "CREATE TRIGGER IF NOT EXISTS newsqa_fts_update AFTER UPDATE ON news_newsqa BEGIN"
+    " INSERT INTO newsqa_fts (newsqa_fts, rowid, question, answer, description, paragraph)"
+    " SELECT 'delete', old.id, old.question, old.answer, old.description, old.paragraph WHERE old.is_deleted = 0;"
+    " INSERT INTO newsqa_fts (rowid, question, answer, description, paragraph)"
+    " SELECT new.id, new.question, new.answer, new.description, new.paragraph WHERE new.is_deleted = 0; END",
+    "INSERT INTO newsqa_fts (rowid, question, answer, description, paragraph)"
+    " SELECT id, question, answer, description, paragraph FROM news_newsqa WHERE is_deleted = 0",
+    "INSERT INTO newsqa_fts (newsqa_fts) VALUES ('optimize')",
+]
+
+UNINSTALL_SQL = [
+    "DROP TRIGGER IF EXISTS newsqa_fts_insert",
+    "DROP TRIGGER IF EXISTS newsqa_fts_delete",
+    "DROP TRIGGER IF EXISTS newsqa_fts_update",
+    "DROP TABLE IF EXISTS newsqa_fts",
+]
+
+
+def run_on_sqlite(schema_editor, statements):
+    # FTS5 is SQLite only; other databases search with LIKE and have no index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_index(apps, schema_editor):
+    run_on_sqlite(schema_editor, INSTALL_SQL)
+
+
+def drop_index(apps, schema_editor):
+    run_on_sqlite(schema_editor, UNINSTALL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0007_newsqa_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 11:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_extra_active_runs(apps, schema_editor):
+    # Runs started by the race the constraint closes: only the newest active run stays active
+    IngestionRun = apps.get_model('news', 'IngestionRun')
+    active = IngestionRun.objects.filter(status__in=['queued', 'running']).order_by('-created_at')
+    extra = list(active.values_list('id', flat=True)[1:])
+    IngestionRun.objects.filter(id__in=extra).update(
+        status='failed', error="Started concurrently with another run", finished_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0008_newsqa_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_extra_active_runs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingestionrun',
+            constraint=models.UniqueConstraint(models.Value(1), condition=models.Q(('status__in', ['queued', 'running'])), name='ingestionrun_single_active'),
+        ),
+    ]
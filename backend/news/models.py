@@ -1,3 +1,5 @@
+import random
+
 from unicodedata import category
 from django.db import models
 from django.contrib.auth.models import User
@@ -33,6 +35,10 @@ class NewsCategory(BaseModel):
     parent_category = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True)
 
 
+def new_random_key():
+    return random.random()
+
+
 class NewsQa(BaseModel):
     category = models.ForeignKey(NewsCategory, on_delete=models.CASCADE)
     question = models.TextField()
@@ -41,9 +47,50 @@ class NewsQa(BaseModel):
     options = models.JSONField(max_length=100)
     paragraph = models.TextField(null=True)
     uri = models.CharField(max_length=100, unique=True, null=True)
+    # Uniform random sort key, so a random row is one index seek instead of ORDER BY RANDOM()
+    random_key = models.FloatField(default=new_random_key, editable=False)
+
+    class Meta:
+        indexes = [
+            # Partial on live rows, matching the soft-delete filter of NewsQa.objects
+            models.Index(fields=['random_key'], condition=models.Q(is_deleted=False), name='newsqa_random_key'),
+            models.Index(fields=['category', 'random_key'], condition=models.Q(is_deleted=False),
+                         name='newsqa_category_random_key'),
+            # Keyset pagination (news/pagination.py) walks these in (created_at, id) order
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_deleted=False), name='newsqa_created_at'),
+            models.Index(fields=['category', 'created_at', 'id'], condition=models.Q(is_deleted=False),
+                         name='newsqa_category_created_at'),
+        ]
 
 class UserDetail(BaseModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='user_detail')
     categories = models.JSONField()
 
 
+class IngestionRun(BaseModel):
+    """One run of the news ingestion pipeline (see news/ingestion.py)"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    trigger = models.CharField(max_length=20, default='api')
+    options = models.JSONField(default=dict)
+    stats = models.JSONField(default=dict)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # At most one queued or running run: a unique index on a constant over just those rows
+            models.UniqueConstraint(models.Value(1), condition=models.Q(status__in=['queued', 'running']),
+                                    name='ingestionrun_single_active'),
+        ]
@@ -0,0 +1,55 @@
+"""
+Per-user category preferences, cached in Django's cache framework.
+
+Feed requests read the user's preferred category ids through
+get_user_categories, so once cached they make no UserDetail query. Saving or
+deleting a UserDetail (update_categories, create, update, the admin) writes the
+new preferences through to the cache once the transaction commits. Updates that
+bypass save(), like QuerySet.update(), are only picked up after
+USER_CATEGORIES_CACHE_TIMEOUT, which also bounds staleness with a per-process
+cache backend.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserDetail
+
+# Cached for users without a UserDetail, since the cache cannot tell a stored None from a miss
+NO_DETAIL = 'none'
+
+
+def cache_key(user_id):
+    return f"news:user-categories:{user_id}"
+
+
+def get_user_categories(user):
+    """The category ids the user prefers (possibly empty), or None for anonymous users and users without a UserDetail"""
+    if not user.is_authenticated:
+        return None
+    key = cache_key(user.id)
+    categories = cache.get(key)
+    if categories is None:
+        detail = UserDetail.objects.filter(user_id=user.id).values_list('categories', flat=True).first()
+        categories = NO_DETAIL if detail is None else detail
+        cache.set(key, categories, settings.USER_CATEGORIES_CACHE_TIMEOUT)
+    return None if categories == NO_DETAIL else categories
+
+
+def _store(user_id, categories):
+    transaction.on_commit(
+        lambda: cache.set(cache_key(user_id), categories, settings.USER_CATEGORIES_CACHE_TIMEOUT)
+    )
+
+
+@receiver(post_save, sender=UserDetail)
+def store_user_categories(sender, instance, **kwargs):
+    # A soft-deleted UserDetail no longer counts, like a missing one
+    _store(instance.user_id, NO_DETAIL if instance.is_deleted else instance.categories)
+
+
+@receiver(post_delete, sender=UserDetail)
+def forget_user_categories(sender, instance, **kwargs):
+    _store(instance.user_id, NO_DETAIL)
@@ -0,0 +1,160 @@
+"""
+Full-text search over NewsQa with SQLite FTS5.
+
+newsqa_fts indexes the question, answer, description and paragraph of the rows
+that are not soft-deleted. It is an external content table reading news_newsqa,
+so the text is not stored twice, and triggers on news_newsqa keep it in sync
+with every write, including bulk_create, update() and soft deletes.
+`python manage.py rebuild_newsqa_search` recreates the triggers and reindexes
+every live row.
+
+On other databases there is no index and searches fall back to DRF's
+SearchFilter (LIKE over the same columns).
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+FTS_TABLE = 'newsqa_fts'
+FTS_COLUMNS = ('question', 'answer', 'description', 'paragraph')
+# BM25 weight of each column: a match in the question counts most, one in the article least
+FTS_WEIGHTS = (4.0, 2.0, 2.0, 1.0)
+
+SNIPPET_START, SNIPPET_END, SNIPPET_ELLIPSIS = '<mark>', '</mark>', '…'
+SNIPPET_TOKENS = 16
+# snippet() marks the matches with these private use characters; highlight() turns them into the tags above
+# once the text around them has been escaped
+_MATCH_START, _MATCH_END = '\ue000', '\ue001'
+
+TERM_RE = re.compile(r'(\w+)(\*?)')
+
+_columns = ', '.join(FTS_COLUMNS)
+_new = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+_old = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+
+INSTALL_SQL = [
+    # prefix='2 3' keeps prefix queries of 2 and 3 characters (and anything longer) fast
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_columns}, content='news_newsqa',"
+    f" content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS newsqa_fts_insert AFTER INSERT ON news_newsqa WHEN new.is_deleted = 0 BEGIN"
+    f" INSERT INTO {FTS_TABLE} (rowid, {_columns}) VALUES (new.id, {_new}); END",
+    f"CREATE TRIGGER IF NOT EXISTS newsqa_fts_delete AFTER DELETE ON news_newsqa WHEN old.is_deleted = 0 BEGIN"
+    f" INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old}); END",
+    # An update removes the old text (if it was indexed), then adds the new one (unless soft-deleted)
+    f"CREATE TRIGGER IF NOT EXISTS newsqa_fts_update AFTER UPDATE ON news_newsqa BEGIN"
+    f" INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {_columns})"
+    f" SELECT 'delete', old.id, {_old} WHERE old.is_deleted = 0;"
+    f" INSERT INTO {FTS_TABLE} (rowid, {_columns}) SELECT new.id, {_new} WHERE new.is_deleted = 0; END",
+]
+
+UNINSTALL_SQL = [
+    "DROP TRIGGER IF EXISTS newsqa_fts_insert",
+    "DROP TRIGGER IF EXISTS newsqa_fts_delete",
+    "DROP TRIGGER IF EXISTS newsqa_fts_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def is_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install_index(using=connection):
+    """Create the FTS table and the sync triggers where missing"""
+    if not is_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+
+
+def uninstall_index(using=connection):
+    if not is_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in UNINSTALL_SQL:
+            cursor.execute(sql)
+
+
+def rebuild_index(using=connection):
+    """Recreate missing triggers and reindex all live rows; returns the number of rows indexed"""
+    install_index(using)
+    with using.cursor() as cursor:
+        # Not 'rebuild', which would index the soft-deleted rows of the content table too
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, {_columns})"
+                       f" SELECT id, {_columns} FROM news_newsqa WHERE is_deleted = 0")
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        return count
+
+
+def match_expression(text):
+    """
+    An FTS5 MATCH expression for user input: every word must appear, and a word
+    ending in * matches as a prefix ("clim* energy"). None when there are no words.
+    FTS5 syntax in the input (quotes, NEAR, column filters) is not interpreted.
+    """
+    terms = [f'"{word}"{star}' for word, star in TERM_RE.findall(text or '')]
+    return ' '.join(terms) or None
+
+
+def search(queryset, text):
+    """
+    queryset restricted to the rows matching text, with their BM25 `rank` (lower
+    is better) and a `snippet` of the best matching column, raw: pass it through
+    highlight() before sending it. Not ordered; order_by('rank') for relevance.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return queryset.none()
+    if not is_available():
+        # No ranking or snippets without FTS5, only SearchFilter's matching
+        for word, _ in TERM_RE.findall(text):
+            terms = Q()
+            for column in FTS_COLUMNS:
+                terms |= Q(**{f'{column}__icontains': word})
+            queryset = queryset.filter(terms)
+        return queryset.extra(select={'rank': 'NULL', 'snippet': 'NULL'})
+    table = queryset.model._meta.db_table
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.extra(
+        select={
+            'rank': f"bm25({FTS_TABLE}, {weights})",
+            'snippet': f"snippet({FTS_TABLE}, -1, %s, %s, %s, {SNIPPET_TOKENS})",
+        },
+        select_params=(_MATCH_START, _MATCH_END, SNIPPET_ELLIPSIS),
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+        params=[expression],
+    )
+
+
+def highlight(snippet):
+    """
+    A search() snippet as HTML: the article text escaped, so that markup in it is
+    shown rather than rendered, and the matched words in SNIPPET_START/SNIPPET_END
+    """
+    if snippet is None:
+        return None
+    return html.escape(snippet, quote=False).replace(_MATCH_START, SNIPPET_START).replace(_MATCH_END, SNIPPET_END)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter (?search=) backed by the FTS5 index: keeps the view's ordering
+    and only filters. Falls back to SearchFilter's LIKE lookups without FTS5.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_available():
+            return super().filter_queryset(request, queryset, view)
+        expression = match_expression(request.query_params.get(self.search_param, ''))
+        if expression is None:
+            return queryset
+        return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                                             [expression]))
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import NewsQa, NewsCategory, UserDetail
+from .models import NewsQa, NewsCategory, UserDetail, IngestionRun
 
 
 class NewsCategorySerializer(serializers.ModelSerializer):
@@ -17,9 +17,84 @@ class NewsQaSerializer(serializers.ModelSerializer):
                  'description', 'options', 'paragraph', 'created_at', 'updated_at']
 
 
+class NewsQaReadSerializer:
+    """
+    Read-only NewsQaSerializer output built from values() rows instead of model
+    instances, for list endpoints. `values(queryset)` selects the columns (the
+    category joined in) and `data` renders them in NewsQaSerializer's shape.
+    """
+    columns = ('id', 'category_id', 'category__name', 'category__uri', 'category__parent_category_id', 'question',
+               'answer', 'description', 'options', 'paragraph', 'created_at', 'updated_at')
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.columns)
+
+    @property
+    def data(self):
+        to_datetime = self.datetime_field.to_representation
+        return [
+            {
+                'id': row['id'],
+                'category': row['category_id'],
+                'category_details': {
+                    'id': row['category_id'],
+                    'name': row['category__name'],
+                    'uri': row['category__uri'],
+                    'parent_category': row['category__parent_category_id'],
+                } if row['category_id'] is not None else None,
+                'question': row['question'],
+                'answer': row['answer'],
+                'description': row['description'],
+                'options': row['options'],
+                'paragraph': row['paragraph'],
+                'created_at': to_datetime(row['created_at']),
+                'updated_at': to_datetime(row['updated_at']),
+            }
+            for row in self._rows
+        ]
+
+
+class NewsQaBulkItemSerializer(serializers.Serializer):
+    """
+    One item of a bulk insert. The category is a plain id, checked for all items
+    at once by bulk_insert_newsqa instead of one query per item.
+    """
+    category = serializers.IntegerField()
+    question = serializers.CharField()
+    answer = serializers.CharField()
+    description = serializers.CharField()
+    options = serializers.JSONField()
+    paragraph = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    uri = serializers.CharField(required=False, allow_null=True, max_length=100)
+
+
 class UserDetailSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     
     class Meta:
         model = UserDetail
         fields = ['id', 'user', 'username', 'categories']
+
+
+class IngestionOptionsSerializer(serializers.Serializer):
+    """
+    The options of an ingestion run started through the API; the limits mirror the
+    agent's /batch limits (BATCH_MAX_ITEMS and BATCH_MAX_CONCURRENCY)
+    """
+    categories = serializers.ListField(child=serializers.CharField(max_length=100), required=False, allow_empty=False)
+    max_articles_per_category = serializers.IntegerField(required=False, min_value=1, max_value=1000)
+    batch_size = serializers.IntegerField(required=False, min_value=1, max_value=1000)
+    quiz_concurrency = serializers.IntegerField(required=False, min_value=1, max_value=128)
+
+
+class IngestionRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestionRun
+        fields = ['id', 'status', 'trigger', 'options', 'stats', 'error', 'created_at', 'updated_at',
+                  'started_at', 'finished_at']
+        read_only_fields = ['status', 'trigger', 'stats', 'error', 'started_at', 'finished_at']
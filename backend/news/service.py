@@ -1,6 +1,10 @@
+import random
+
 from eventregistry import *
 
-from news.models import NewsCategory
+from django.db import IntegrityError, transaction
+
+from news.models import NewsCategory, NewsQa
 
 
 
@@ -19,3 +23,112 @@ def upload_categories(flattened_categories):
         )
         id_to_obj[item['id']] = category
 
+
+def create_newsqa_rows(rows, chunk_size=500):
+    """
+    Insert unsaved NewsQa rows in chunks inside one transaction, leaving out those
+    whose uri is already stored. Returns the inserted rows, with their ids set.
+
+    Each chunk is one bulk INSERT. When a concurrent writer stored one of its uris
+    since the caller looked them up, the chunk is rolled back and inserted row by
+    row, so exactly the conflicting rows are left out.
+    """
+    created = []
+    with transaction.atomic():
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                with transaction.atomic():
+                    NewsQa.objects.bulk_create(chunk)
+                created += chunk
+                continue
+            except IntegrityError:
+                pass
+            for row in chunk:
+                try:
+                    with transaction.atomic():
+                        NewsQa.objects.bulk_create([row])
+                    created.append(row)
+                except IntegrityError:
+                    if row.uri is None or not NewsQa.all_objects.filter(uri=row.uri).exists():
+                        raise
+    return created
+
+
+def bulk_insert_newsqa(items, chunk_size=500):
+    """
+    Insert validated NewsQa items (dicts with a `category` id), skipping those whose
+    uri is already stored (soft-deleted rows included) or repeats an earlier item.
+
+    Existing uris and categories are resolved with one query each, and the new rows
+    are inserted in chunks (see create_newsqa_rows), all inside one transaction.
+    Returns one result per item, in order: {"index", "uri", "status": "created" |
+    "skipped" | "invalid", ...}, with the `id` of every created or stored item.
+    """
+    results, pending, seen = [], [], set()
+    with transaction.atomic():
+        uris = {item['uri'] for item in items if item.get('uri')}
+        existing = {
+            uri: (pk, is_deleted)
+            for uri, pk, is_deleted in NewsQa.all_objects.filter(uri__in=uris).values_list('uri', 'id', 'is_deleted')
+        }
+        categories = set(
+            NewsCategory.objects.filter(id__in={item['category'] for item in items}).values_list('id', flat=True)
+        )
+
+        for index, item in enumerate(items):
+            uri = item.get('uri') or None
+            result = {"index": index, "uri": uri}
+            if item['category'] not in categories:
+                result.update(status="invalid", errors={"category": [f"Category {item['category']} does not exist"]})
+            elif uri in existing:
+                pk, is_deleted = existing[uri]
+                result.update(status="skipped", reason="deleted" if is_deleted else "exists", id=pk)
+            elif uri is not None and uri in seen:
+                result.update(status="skipped", reason="duplicate")
+            else:
+                if uri is not None:
+                    seen.add(uri)
+                pending.append((result, NewsQa(
+                    category_id=item['category'],
+                    question=item['question'],
+                    answer=item['answer'],
+                    description=item['description'],
+                    options=item['options'],
+                    paragraph=item.get('paragraph'),
+                    uri=uri,
+                )))
+            results.append(result)
+
+        create_newsqa_rows([row for _, row in pending], chunk_size=chunk_size)
+        # Rows left out were stored by a concurrent writer since the lookup above
+        lost = [row.uri for _, row in pending if row.pk is None]
+        stored = dict(NewsQa.all_objects.filter(uri__in=lost).values_list('uri', 'id')) if lost else {}
+        for result, row in pending:
+            if row.pk is not None:
+                result.update(status="created", id=row.pk)
+            else:
+                result.update(status="skipped", reason="exists", id=stored.get(row.uri))
+    return results
+
+
+def random_newsqa(queryset, count=1, exclude=()):
+    """
+    Up to count distinct random items of queryset, none of them in exclude (ids).
+
+    Each item is one index seek on NewsQa.random_key: the first row at or after a
+    random point, wrapping around to the start of the key range. Rows after a wide
+    gap between keys are a little more likely to be picked than others.
+    """
+    excluded = set(exclude)
+    picked = []
+    for _ in range(count):
+        candidates = queryset.exclude(id__in=excluded) if excluded else queryset
+        point = random.random()
+        item = (candidates.filter(random_key__gte=point).order_by('random_key').first()
+                or candidates.filter(random_key__lt=point).order_by('random_key').first())
+        if item is None:
+            break
+        picked.append(item)
+        excluded.add(item.id)
+    return picked
@@ -1,3 +1,551 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .ingestion import IngestionPipeline, start_run
+from .models import IngestionRun, NewsCategory, NewsQa, UserDetail
+from .serializers import NewsQaReadSerializer, NewsQaSerializer
+from . import service
+from .service import create_newsqa_rows
+
+
+def create_questions(category, count):
+    return [
+        NewsQa.objects.create(category=category, question=f"{category.name} question {i}", answer="A",
+                              description="Because", options={"A": "yes", "B": "no"})
+        for i in range(count)
+    ]
+
+
+class ByCategoryTests(TestCase):
+    url = '/api/news/newsqa/by_category/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def add_categories(self, count, questions=3):
+        start = NewsCategory.objects.count()
+        for i in range(start, start + count):
+            create_questions(NewsCategory.objects.create(name=f"Category {i}", uri=f"news/Category_{i}"), questions)
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_categories(self):
+        self.add_categories(2)
+        few = self.count_queries()
+        self.add_categories(20)
+        self.assertEqual(self.count_queries(), few)
+        self.assertEqual(few, 1)
+
+    def test_query_count_with_user_categories(self):
+        user = User.objects.create_user('reader', password='secret')
+        self.client.force_authenticate(user)
+        self.add_categories(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            detail = UserDetail.objects.create(user=user,
+                                               categories=list(NewsCategory.objects.values_list('id', flat=True)))
+        few = self.count_queries()
+        self.add_categories(20)
+        with self.captureOnCommitCallbacks(execute=True):
+            detail.categories = list(NewsCategory.objects.values_list('id', flat=True))
+            detail.save()
+        self.assertEqual(self.count_queries(), few)
+
+    def test_returns_newest_items_per_category(self):
+        self.add_categories(2, questions=7)
+        response = self.client.get(self.url)
+        self.assertEqual(sorted(response.data), ["Category 0", "Category 1"])
+        for name, items in response.data.items():
+            self.assertEqual(len(items), 5)
+            newest = NewsQa.objects.filter(category__name=name).order_by('-created_at', '-id')[:5]
+            self.assertEqual([item['id'] for item in items], [item.id for item in newest])
+            self.assertEqual({item['category_details']['name'] for item in items}, {name})
+
+    @override_settings(NEWSQA_BY_CATEGORY_LIMIT=2)
+    def test_limit(self):
+        self.add_categories(2, questions=4)
+        self.assertEqual([len(items) for items in self.client.get(self.url).data.values()], [2, 2])
+        self.assertEqual([len(items) for items in self.client.get(self.url, {'limit': 3}).data.values()], [3, 3])
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).status_code, 400)
+
+    def test_skips_soft_deleted_items_and_categories(self):
+        self.add_categories(2, questions=2)
+        deleted = NewsQa.objects.filter(category__name="Category 0").first()
+        deleted.is_deleted = True
+        deleted.save()
+        NewsCategory.objects.filter(name="Category 1").update(is_deleted=True)
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.data), ["Category 0"])
+        self.assertNotIn(deleted.id, [item['id'] for item in response.data["Category 0"]])
+
+
+@override_settings(NEWSQA_PAGE_SIZE=4)
+class KeysetPaginationTests(TestCase):
+    url = '/api/news/newsqa/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = NewsCategory.objects.create(name="World", uri="news/World")
+        create_questions(self.category, 10)
+
+    def walk(self, url, **params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            pages += 1
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_created_at_and_id(self):
+        ids, pages = self.walk(self.url)
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, list(NewsQa.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+        ids, _ = self.walk(self.url, ordering='created_at')
+        self.assertEqual(ids, list(NewsQa.objects.order_by('created_at', 'id').values_list('id', flat=True)))
+
+    def test_rows_added_between_pages_are_not_repeated(self):
+        first = self.client.get(self.url).data
+        create_questions(self.category, 3)
+        rest, _ = self.walk(first['next'])
+        self.assertEqual(len(set(rest)), 6)
+        self.assertFalse(set(rest) & {item['id'] for item in first['results']})
+
+    def test_count_is_optional(self):
+        self.assertNotIn('count', self.client.get(self.url).data)
+        self.assertEqual(self.client.get(self.url, {'count': 'true'}).data['count'], 10)
+
+    def test_category_questions(self):
+        ids, pages = self.walk(f'/api/news/categories/{self.category.id}/questions/', page_size=5)
+        self.assertEqual((len(ids), pages), (10, 2))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def test_pages_over_several_categories_are_merged_from_the_category_index(self):
+        cache.clear()
+        user = User.objects.create_user('reader', password='secret')
+        self.client.force_authenticate(user)
+        science = NewsCategory.objects.create(name="Science", uri="news/Science")
+        sports = NewsCategory.objects.create(name="Sports", uri="news/Sports")
+        for _ in range(3):
+            create_questions(science, 2)
+            create_questions(self.category, 1)
+        create_questions(sports, 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserDetail.objects.create(user=user, categories=[self.category.id, science.id])
+
+        with CaptureQueriesContext(connection) as queries:
+            ids, pages = self.walk(self.url)
+        expected = NewsQa.objects.filter(category__in=[self.category, science]).order_by('-created_at', '-id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+        self.assertEqual(pages, 5)
+        # Each page reads one range of newsqa_category_created_at per category, with no sort of its own, in a
+        # single UNION ALL query, then the rows of the page by id
+        position_queries = [query['sql'] for query in queries
+                            if query['sql'].startswith('SELECT * FROM (SELECT "news_newsqa"."created_at"')]
+        row_queries = [query['sql'] for query in queries if query['sql'].startswith('SELECT "news_newsqa"."id"')]
+        self.assertEqual((len(position_queries), len(row_queries)), (pages, pages))
+        self.assertEqual(len(queries), 2 * pages)
+        with connection.cursor() as cursor:
+            for sql in position_queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+                self.assertEqual(sum('newsqa_category_created_at' in step for step in plan), 2)
+
+    def test_merged_page_query_count_does_not_grow_with_categories(self):
+        cache.clear()
+        user = User.objects.create_user('reader', password='secret')
+        self.client.force_authenticate(user)
+        categories = [NewsCategory.objects.create(name=f"Category {i}", uri=f"news/Category_{i}") for i in range(30)]
+        for category in categories:
+            create_questions(category, 1)
+        detail = UserDetail.objects.create(user=user, categories=[category.id for category in categories[:2]])
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(len(self.client.get(self.url).data['results']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            detail.categories = [category.id for category in categories]
+            detail.save()
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as many:
+            ids, pages = self.walk(self.url)
+        self.assertEqual((len(ids), pages), (30, 8))
+        self.assertEqual(len(many), 2 * pages)
+        self.assertLessEqual(len(few), 2 + 2)
+
+
+class ReadSerializerTests(TestCase):
+    def test_same_output_as_newsqa_serializer(self):
+        world = NewsCategory.objects.create(name="World", uri="news/World")
+        europe = NewsCategory.objects.create(name="Europe", uri="news/Europe", parent_category=world)
+        create_questions(world, 2)
+        create_questions(europe, 2)
+        NewsQa.objects.filter(category=europe).update(paragraph="In Brussels")
+        queryset = NewsQa.objects.order_by('-created_at', '-id')
+        expected = NewsQaSerializer(queryset, many=True).data
+        self.assertEqual(NewsQaReadSerializer(NewsQaReadSerializer.values(queryset)).data, expected)
+        # Top-level categories have a null parent, and items without a paragraph a null paragraph
+        self.assertIsNone(expected[-1]['category_details']['parent_category'])
+        self.assertIsNone(expected[-1]['paragraph'])
+        self.assertEqual(expected[0]['category_details']['parent_category'], world.id)
+
+    def test_missing_category_has_no_details(self):
+        row = dict.fromkeys(NewsQaReadSerializer.columns)
+        row.update(id=1, created_at=None, updated_at=None)
+        data = NewsQaReadSerializer([row]).data[0]
+        self.assertIsNone(data['category'])
+        self.assertIsNone(data['category_details'])
+
+
+class FullTextSearchTests(TestCase):
+    url = '/api/news/newsqa/search/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = NewsCategory.objects.create(name="Science", uri="news/Science")
+
+    def create(self, question, paragraph=""):
+        return NewsQa.objects.create(category=self.category, question=question, answer="A", description="Because",
+                                     options={"A": "yes", "B": "no"}, paragraph=paragraph)
+
+    def search(self, q):
+        response = self.client.get(self.url, {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_ranks_question_matches_first_and_highlights(self):
+        in_paragraph = self.create("What happened?", "The telescope found a comet")
+        in_question = self.create("What did the telescope find?")
+        self.assertEqual(self.search("telescope"), [in_question.id, in_paragraph.id])
+        result = self.client.get(self.url, {'q': "comet"}).data['results'][0]
+        self.assertIn("<mark>comet</mark>", result['snippet'])
+
+    def test_snippet_text_is_escaped(self):
+        self.create("What happened?", 'The <img src=x onerror="alert(1)"> telescope found a comet & more')
+        snippet = self.client.get(self.url, {'q': "comet"}).data['results'][0]['snippet']
+        self.assertEqual(snippet, 'The &lt;img src=x onerror="alert(1)"&gt; telescope found a <mark>comet</mark>'
+                                  ' &amp; more')
+
+    def test_prefix_and_all_words(self):
+        item = self.create("Which telescope spotted the comet?")
+        self.create("Which comet was spotted?")
+        self.assertEqual(self.search("teles*"), [item.id])
+        self.assertEqual(self.search("comet telescope"), [item.id])
+        self.assertEqual(self.search("teles"), [])
+
+    def test_index_follows_updates_and_soft_deletes(self):
+        item = self.create("Which telescope spotted the comet?")
+        item.question = "Which probe landed on the comet?"
+        item.save()
+        self.assertEqual(self.search("telescope"), [])
+        self.assertEqual(self.search("probe"), [item.id])
+        item.delete()
+        self.assertEqual(self.search("probe"), [])
+        NewsQa.all_objects.filter(id=item.id).update(is_deleted=False)
+        self.assertEqual(self.search("probe"), [item.id])
+
+    def test_search_filter_on_list(self):
+        item = self.create("Which telescope spotted the comet?")
+        self.create("Which probe landed?")
+        response = self.client.get('/api/news/newsqa/', {'search': "telescope"})
+        self.assertEqual([result['id'] for result in response.data['results']], [item.id])
+
+
+class PreferenceCacheTests(TestCase):
+    url = '/api/news/newsqa/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user('reader', password='secret')
+        self.client.force_authenticate(self.user)
+        self.science = NewsCategory.objects.create(name="Science", uri="news/Science")
+        self.sports = NewsCategory.objects.create(name="Sports", uri="news/Sports")
+        create_questions(self.science, 2)
+        create_questions(self.sports, 3)
+
+    def get(self, url=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or self.url)
+        detail_queries = [query for query in queries if 'news_userdetail' in query['sql']]
+        return response, len(detail_queries)
+
+    def test_feed_requests_make_no_preference_queries_once_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/news/user-details/update_categories/', {'categories': [self.science.id]},
+                             format='json')
+        for url in (self.url, '/api/news/newsqa/by_category/', '/api/news/categories/user_categories/'):
+            response, detail_queries = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(detail_queries, 0)
+        self.assertEqual(len(self.get()[0].data['results']), 2)
+
+    def test_missing_detail_is_cached(self):
+        response, detail_queries = self.get()
+        self.assertEqual((len(response.data['results']), detail_queries), (5, 1))
+        response, detail_queries = self.get()
+        self.assertEqual((len(response.data['results']), detail_queries), (5, 0))
+        response, _ = self.get('/api/news/categories/user_categories/')
+        self.assertEqual(response.data, {"detail": "User detail not found"})
+
+    def test_updates_are_written_through(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/news/user-details/',
+                                        {'user': self.user.id, 'categories': [self.science.id]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.get()[0].data['results']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/news/user-details/update_categories/', {'categories': [self.sports.id]},
+                             format='json')
+        response, detail_queries = self.get()
+        self.assertEqual((len(response.data['results']), detail_queries), (3, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            UserDetail.objects.get(user=self.user).delete()
+        response, detail_queries = self.get()
+        self.assertEqual((len(response.data['results']), detail_queries), (5, 0))
+
+
+class CategoryTreeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.science = NewsCategory.objects.create(name="Science", uri="news/Science")
+            self.space = NewsCategory.objects.create(name="Space", uri="news/Space", parent_category=self.science)
+            self.mars = NewsCategory.objects.create(name="Mars", uri="news/Mars", parent_category=self.space)
+            self.sports = NewsCategory.objects.create(name="Sports", uri="news/Sports")
+        for category in (self.science, self.space, self.mars, self.sports):
+            create_questions(category, 2)
+
+    def test_subtree_filter(self):
+        response = self.client.get('/api/news/newsqa/', {'subtree': self.space.uri})
+        self.assertEqual({item['category'] for item in response.data['results']}, {self.space.id, self.mars.id})
+        response = self.client.get('/api/news/newsqa/', {'subtree': self.science.id})
+        self.assertEqual(len(response.data['results']), 6)
+        response = self.client.get(f'/api/news/categories/{self.science.id}/questions/', {'subcategories': 'true'})
+        self.assertEqual(len(response.data['results']), 6)
+        response = self.client.post('/api/news/newsqa/all_by_category/', {'category': "Space", 'subcategories': True},
+                                    format='json')
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_unknown_subtree(self):
+        for subtree in ('news/Unknown', 999999):
+            response = self.client.get('/api/news/newsqa/', {'subtree': subtree})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.data['detail'], "Category not found")
+
+    def test_tree_is_served_from_memory(self):
+        self.client.get('/api/news/categories/tree/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/news/categories/tree/')
+        self.assertEqual([node['name'] for node in response.data], ["Science", "Sports"])
+        self.assertEqual(response.data[0]['children'][0]['children'][0]['name'], "Mars")
+        self.assertEqual(self.client.get('/api/news/categories/tree/', {'root': 'news/Space'}).data['name'], "Space")
+
+    def test_reloaded_after_a_change(self):
+        self.client.get('/api/news/categories/tree/')
+        with self.captureOnCommitCallbacks(execute=True):
+            NewsCategory.objects.create(name="Moon", uri="news/Moon", parent_category=self.space)
+            self.sports.delete()
+        response = self.client.get('/api/news/categories/tree/')
+        self.assertEqual([node['name'] for node in response.data], ["Science"])
+        self.assertEqual([node['name'] for node in response.data[0]['children'][0]['children']], ["Mars", "Moon"])
+
+
+class IngestionTests(TestCase):
+
+    def setUp(self):
+        self.category = NewsCategory.objects.create(name="World", uri="news/World")
+
+    def row(self, uri):
+        return NewsQa(category=self.category, question=f"Question {uri}", answer="A", description="Because",
+                      options={"A": "yes", "B": "no"}, uri=uri)
+
+    def test_rows_stored_meanwhile_are_left_out(self):
+        # As if a concurrent writer stored "b" after the caller checked which uris were new
+        stored = self.row("b")
+        stored.save()
+        created = create_newsqa_rows([self.row("a"), self.row("b"), self.row("c"), self.row(None)], chunk_size=3)
+        self.assertEqual([row.uri for row in created], ["a", "c", None])
+        self.assertTrue(all(row.pk for row in created))
+        self.assertEqual(NewsQa.objects.get(uri="b").pk, stored.pk)
+        self.assertEqual(NewsQa.objects.count(), 4)
+
+    def test_batch_counts_only_inserted_rows(self):
+        self.row("b").save()
+        pipeline = IngestionPipeline(IngestionRun.objects.create(), event_registry=object(), session=object())
+        quiz = {"question": "Q?", "correct_answer": "A", "explanation": "Because", "choices": {"A": "yes"}}
+        pipeline._generate = lambda batch: {article['uri']: {"quiz": quiz} for _, article in batch}
+        pipeline._process_batch([(self.category, {"uri": uri, "body": "Text"}) for uri in ("a", "b", "c")])
+        self.assertEqual((pipeline.stats['created'], pipeline.stats['duplicates']), (2, 1))
+
+    def test_only_one_active_run(self):
+        run, created = start_run()
+        self.assertTrue(created)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            IngestionRun.objects.create(status=IngestionRun.STATUS_RUNNING)
+        # Another caller created its run between this one's lookup and insert
+        first = QuerySet.first
+        lookups = []
+
+        def lookup_misses_once(queryset):
+            lookups.append(queryset)
+            return None if len(lookups) == 1 else first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', lookup_misses_once):
+            self.assertEqual(start_run(), (run, False))
+        run.status = IngestionRun.STATUS_DONE
+        run.save()
+        self.assertTrue(start_run()[1])
+
+    def test_api_validates_options(self):
+        client = APIClient()
+        url = '/api/news/ingestion-runs/'
+        for options in ({'batch_size': 0}, {'batch_size': -5}, {'categories': "news/World"},
+                        {'max_articles_per_category': 100000}, {'quiz_concurrency': 'many'}, {'unknown': 1}, [1]):
+            with self.subTest(options=options), mock.patch('news.views.run_in_background') as run_in_background:
+                response = client.post(url, {'options': options}, format='json')
+                self.assertEqual(response.status_code, 400)
+                run_in_background.assert_not_called()
+        self.assertFalse(IngestionRun.objects.exists())
+        with mock.patch('news.views.run_in_background'):
+            response = client.post(url, {'options': {'batch_size': 10, 'categories': ["news/World"]}}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['options'], {'batch_size': 10, 'categories': ["news/World"]})
+
+    def test_batch_size_from_settings_is_clamped(self):
+        pipeline = IngestionPipeline(IngestionRun.objects.create(options={'batch_size': 0}), event_registry=object(),
+                                     session=object())
+        pipeline._categories = lambda: [self.category]
+        pipeline._fetch = lambda category: [{"uri": "a", "body": "Text"}, {"uri": "b", "body": "Text"}]
+        batches = []
+        pipeline._process_batch = batches.append
+        pipeline._ingest()
+        self.assertEqual(batches, [[(self.category, {"uri": "a", "body": "Text"})],
+                                   [(self.category, {"uri": "b", "body": "Text"})]])
+
+
+class BulkInsertTests(TestCase):
+    url = '/api/news/newsqa/bulk/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = NewsCategory.objects.create(name="World", uri="news/World")
+
+    def item(self, uri=None, **fields):
+        return {"category": self.category.id, "question": f"Question {uri}", "answer": "A", "description": "Because",
+                "options": {"A": "yes", "B": "no"}, "uri": uri, **fields}
+
+    def post(self, items):
+        return self.client.post(self.url, items, format='json')
+
+    def test_duplicates_in_the_batch_and_in_the_database(self):
+        stored, deleted = create_questions(self.category, 2)
+        NewsQa.objects.filter(pk=stored.pk).update(uri="stored")
+        NewsQa.objects.filter(pk=deleted.pk).update(uri="deleted", is_deleted=True)
+        response = self.post([self.item("new"), self.item("new"), self.item("stored"), self.item("deleted"),
+                              self.item("other", category=0)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({key: response.data[key] for key in ("created", "skipped", "invalid")},
+                         {"created": 1, "skipped": 3, "invalid": 1})
+        new, repeated, existing, removed, invalid = response.data["items"]
+        self.assertEqual((new["status"], new["id"]), ("created", NewsQa.objects.get(uri="new").id))
+        self.assertEqual((repeated["status"], repeated["reason"]), ("skipped", "duplicate"))
+        self.assertEqual((existing["reason"], existing["id"]), ("exists", stored.id))
+        self.assertEqual((removed["reason"], removed["id"]), ("deleted", deleted.id))
+        self.assertEqual(invalid["status"], "invalid")
+
+    def test_items_without_uri_get_their_ids(self):
+        response = self.post({"items": [self.item(), self.item(None, question="Another")]})
+        ids = [item["id"] for item in response.data["items"]]
+        self.assertEqual([item["status"] for item in response.data["items"]], ["created", "created"])
+        self.assertEqual(sorted(ids), sorted(NewsQa.objects.values_list('id', flat=True)))
+
+    def test_uri_stored_concurrently_is_reported_as_skipped(self):
+        create_rows = service.create_newsqa_rows
+
+        def concurrent_writer_first(rows, chunk_size):
+            self.concurrent = NewsQa.objects.create(**{**self.item("b"), "category": self.category})
+            return create_rows(rows, chunk_size)
+
+        with mock.patch.object(service, 'create_newsqa_rows', concurrent_writer_first):
+            response = self.post([self.item("a"), self.item("b")])
+        created, skipped = response.data["items"]
+        self.assertEqual((created["status"], created["id"]), ("created", NewsQa.objects.get(uri="a").id))
+        self.assertEqual((skipped["status"], skipped["reason"]), ("skipped", "exists"))
+        self.assertEqual(skipped["id"], self.concurrent.id)
+        self.assertEqual(response.data["created"], 1)
+
+
+class RandomTests(TestCase):
+    url = '/api/news/newsqa/random/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.world = NewsCategory.objects.create(name="World", uri="news/World")
+        self.sports = NewsCategory.objects.create(name="Sports", uri="news/Sports")
+        self.items = create_questions(self.world, 5)
+        self.sports_items = create_questions(self.sports, 2)
+
+    def get(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_single_item_or_count(self):
+        self.assertIn(self.get().data['id'], [item.id for item in self.items + self.sports_items])
+        ids = [item['id'] for item in self.get(count=6).data]
+        self.assertEqual(len(set(ids)), 6)
+        self.assertEqual(len(self.get(count=50).data), 7)
+        self.assertEqual(self.get(count=0).status_code, 400)
+        self.assertEqual(self.get(count=51).status_code, 400)
+
+    def test_exclude(self):
+        seen = [item.id for item in self.items[:4] + self.sports_items]
+        self.assertEqual(self.get(exclude=','.join(map(str, seen))).data['id'], self.items[4].id)
+        response = self.client.get(f"{self.url}?exclude={seen[0]}&exclude={seen[1]}&count=10")
+        self.assertEqual(len(response.data), 5)
+        self.assertFalse({item['id'] for item in response.data} & set(seen[:2]))
+        everything = ','.join(str(item.id) for item in self.items + self.sports_items)
+        self.assertEqual(self.get(exclude=everything).status_code, 404)
+        self.assertEqual(self.get(exclude='one').status_code, 400)
+
+    def test_category(self):
+        response = self.get(category=self.sports.id, count=10)
+        self.assertEqual({item['id'] for item in response.data}, {item.id for item in self.sports_items})
+        self.assertEqual(self.get(category=self.sports.id).data['category'], self.sports.id)
+        NewsQa.objects.filter(category=self.sports).update(is_deleted=True)
+        self.assertEqual(self.get(category=self.sports.id).status_code, 404)
+
+    def test_user_categories(self):
+        user = User.objects.create_user('reader', password='secret')
+        UserDetail.objects.create(user=user, categories=[self.sports.id])
+        self.client.force_authenticate(user)
+        response = self.get(count=10)
+        self.assertEqual({item['id'] for item in response.data}, {item.id for item in self.sports_items})
+        self.assertEqual(self.get().data['category'], self.sports.id)
+        sports_ids = ','.join(str(item.id) for item in self.sports_items)
+        self.assertEqual(self.get(exclude=sports_ids).status_code, 404)
+
+    def test_point_past_the_last_key_wraps_around(self):
+        items = self.items + self.sports_items
+        for position, item in enumerate(items, 1):
+            NewsQa.objects.filter(id=item.id).update(random_key=position / 10)
+        with mock.patch('news.service.random.random', return_value=0.95):
+            self.assertEqual(self.get().data['id'], items[0].id)
+            self.assertEqual(self.get(exclude=items[0].id).data['id'], items[1].id)
+        with mock.patch('news.service.random.random', return_value=0.45):
+            self.assertEqual(self.get().data['id'], items[4].id)
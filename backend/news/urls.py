@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import NewsQaViewSet, NewsCategoryViewSet, UserDetailViewSet
+from .views import NewsQaViewSet, NewsCategoryViewSet, UserDetailViewSet, IngestionRunViewSet
 
 router = DefaultRouter()
 router.register(r'newsqa', NewsQaViewSet)
 router.register(r'categories', NewsCategoryViewSet)
 router.register(r'user-details', UserDetailViewSet, basename='user-details')
+router.register(r'ingestion-runs', IngestionRunViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
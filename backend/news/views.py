@@ -1,15 +1,24 @@
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from rest_framework import viewsets, mixins, filters, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import NewsQa, NewsCategory, UserDetail
-from .serializers import NewsQaSerializer, NewsCategorySerializer, UserDetailSerializer
-import requests
-from eventregistry import EventRegistry, QueryArticlesIter
+from .models import NewsQa, NewsCategory, UserDetail, IngestionRun
+from django.conf import settings
+from .serializers import (NewsQaSerializer, NewsCategorySerializer, UserDetailSerializer, IngestionRunSerializer,
+                          IngestionOptionsSerializer, NewsQaBulkItemSerializer, NewsQaReadSerializer)
+from .ingestion import start_run, run_in_background
+from .category_tree import get_category_tree
+from .pagination import KeysetPagination
+from .preferences import get_user_categories
+from .search import FullTextSearchFilter, highlight, search
+from .service import bulk_insert_newsqa, random_newsqa
 
 # Create your views here.
 
@@ -25,7 +34,10 @@ class NewsQaViewSet(ExtendedViewSet):
     Return a specific NewsQa item.
 
     list:
-    Return a list of all NewsQa items filtered by the user's preferred categories.
+    Return a page of NewsQa items filtered by the user's preferred categories,
+    newest first. Follow `next` for the following page; see KeysetPagination
+    for `page_size`, `count` and `ordering`. `subtree` (a category ID or URI)
+    keeps the items of that category and all its subcategories (404 if unknown).
     
     create:
     Create a new NewsQa item.
@@ -42,38 +54,56 @@ class NewsQaViewSet(ExtendedViewSet):
     queryset = NewsQa.objects.all()
     serializer_class = NewsQaSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category']
     search_fields = ['question', 'answer', 'description', 'paragraph']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
+    # Set by restrict_categories(); KeysetPagination reads each of these categories on its own
+    pagination_category_ids = None
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('category')
 
-        # Only filter by user categories if user is authenticated
-        if self.request.user.is_authenticated:
-            try:
-                user_detail = UserDetail.objects.get(user=self.request.user)
-                user_categories = user_detail.categories
+        # Only filter by user categories if user is authenticated and has some
+        user_categories = get_user_categories(self.request.user)
+        if user_categories:
+            queryset = self.restrict_categories(queryset, user_categories)
 
-                if user_categories:
-                    queryset = queryset.filter(category_id__in=user_categories)
-            except UserDetail.DoesNotExist:
-                # If user has no details, return all questions
-                pass
+        # ?subtree=<id or uri>: that category and all its subcategories, in one IN query
+        subtree = self.request.query_params.get('subtree')
+        if subtree:
+            tree = get_category_tree()
+            category_id = tree.find(subtree)
+            if category_id is None:
+                raise NotFound("Category not found")
+            queryset = self.restrict_categories(queryset, tree.subtree_ids(category_id))
         
         return queryset
 
+    def restrict_categories(self, queryset, category_ids):
+        """queryset limited to category_ids, which the pagination then reads one category at a time"""
+        category_ids = set(category_ids)
+        if self.pagination_category_ids is not None:
+            category_ids &= self.pagination_category_ids
+        self.pagination_category_ids = category_ids
+        return queryset.filter(category_id__in=category_ids)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(NewsQaReadSerializer.values(queryset))
+        return self.get_paginated_response(NewsQaReadSerializer(page).data)
+
     @action(detail=False, methods=['get'])
     def all(self, request):
         """
         Get all NewsQa items
         
-        Returns a list of all NewsQa items in the database.
+        Returns all NewsQa items in the database, one page at a time.
         
         Returns:
-            A list of NewsQa items
+            A page of NewsQa items and the `next` page link
         """
         return self.list(request)
 
@@ -82,105 +112,202 @@ class NewsQaViewSet(ExtendedViewSet):
         """
         Get all NewsQa items
         
-        Returns a list of all NewsQa items in the database.
+        Returns the NewsQa items of the category named in `category`, one page at a time.
+        With `subcategories` true, the items of all its subcategories are included.
+        The name is looked up in the in-memory category tree.
         
         Returns:
-            A list of NewsQa items
+            A page of NewsQa items and the `next` page link (404 for an unknown category)
         """
         data = self.request.data
-        category = data['category']
-        category_id = NewsCategory.objects.filter(name=category).first().id
-        return JsonResponse(data = self.get_serializer(self.get_queryset().filter(category_id=category_id), many=True).data, safe=False)
+        tree = get_category_tree()
+        category_id = tree.find_by_name(data.get('category'))
+        if category_id is None:
+            return Response({"detail": "Category not found"}, status=status.HTTP_404_NOT_FOUND)
+        category_ids = tree.subtree_ids(category_id) if data.get('subcategories') else [category_id]
+        questions = self.restrict_categories(self.get_queryset(), category_ids)
+        page = self.paginate_queryset(NewsQaReadSerializer.values(questions))
+        return self.get_paginated_response(NewsQaReadSerializer(page).data)
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over NewsQa items
+        
+        Searches the question, answer, description and paragraph of the items in
+        the user's categories with the FTS5 index, best matches first (BM25, a match
+        in the question weighing most). Every word must match; a word ending in *
+        matches as a prefix, e.g. `q=clim* energy`.
+        
+        Parameters:
+            q (str): The words to search for
+            limit (int): Results per request (default 20, at most NEWSQA_SEARCH_MAX_RESULTS)
+            offset (int): Results to skip
+        
+        Returns:
+            The matching NewsQa items with their `rank` (lower is better) and a
+            `snippet` of the best matching column as escaped HTML, the matched words
+            in <mark> tags
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 20))
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            return Response({"detail": "limit and offset must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= settings.NEWSQA_SEARCH_MAX_RESULTS or offset < 0:
+            return Response({"detail": f"limit must be between 1 and {settings.NEWSQA_SEARCH_MAX_RESULTS}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = DjangoFilterBackend().filter_queryset(request, self.get_queryset(), self)
+        matches = search(queryset, text).order_by('rank', '-created_at')
+        rows = list(matches.values(*NewsQaReadSerializer.columns, 'rank', 'snippet')[offset:offset + limit])
+        results = NewsQaReadSerializer(rows).data
+        for result, row in zip(results, rows):
+            result['rank'] = row['rank']
+            result['snippet'] = highlight(row['snippet'])
+        return Response({"results": results})
     
     @action(detail=False, methods=['get'])
     def random(self, request):
         """
-        Get a random NewsQa item
+        Get random NewsQa items
+        
+        Returns a randomly selected NewsQa item from the user's categories.
+        Useful for quiz applications or random question generators. Each item is
+        found with one index lookup, so the cost does not grow with the table.
+        
+        Parameters:
+            count (int): Return a list of this many distinct items instead of one
+            exclude (str): Comma-separated IDs not to return, e.g. already seen ones
         
-        Returns a randomly selected NewsQa item from the database.
-        Useful for quiz applications or random question generators.
+        Returns:
+            A NewsQa item, or a list of them when count is given (404 if none is left)
         """
-        random_item = NewsQa.objects.order_by('?').first()
-        if random_item:
-            serializer = self.get_serializer(random_item)
-            return Response(serializer.data)
-        return Response({"detail": "No items found"}, status=status.HTTP_404_NOT_FOUND)
+        count = request.query_params.get('count')
+        try:
+            exclude = [int(pk) for value in request.query_params.getlist('exclude')
+                       for pk in value.split(',') if pk.strip()]
+            if count is not None:
+                count = int(count)
+        except ValueError:
+            return Response({"detail": "count and exclude must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if count is not None and not 1 <= count <= settings.NEWSQA_RANDOM_MAX_COUNT:
+            return Response({"detail": f"count must be between 1 and {settings.NEWSQA_RANDOM_MAX_COUNT}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(exclude) > settings.NEWSQA_RANDOM_MAX_EXCLUDE:
+            return Response({"detail": f"At most {settings.NEWSQA_RANDOM_MAX_EXCLUDE} excluded IDs"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        items = random_newsqa(self.filter_queryset(self.get_queryset()), count or 1, exclude)
+        if not items:
+            return Response({"detail": "No items found"}, status=status.HTTP_404_NOT_FOUND)
+        if count is None:
+            return Response(self.get_serializer(items[0]).data)
+        return Response(self.get_serializer(items, many=True).data)
     
     @action(detail=False, methods=['get'])
     def by_category(self, request):
         """
         Get NewsQa items grouped by category
         
-        Returns NewsQa items organized by category. If the user has preferred categories
-        in their UserDetail, only those categories will be included. Otherwise, all
-        categories will be returned.
+        Returns the newest NewsQa items of each category. If the user has preferred
+        categories in their UserDetail, only those categories will be included.
+        Otherwise, all categories will be returned. The items of all categories are
+        fetched in one query, numbered per category with ROW_NUMBER().
+        
+        Parameters:
+            limit (int): Items per category (default NEWSQA_BY_CATEGORY_LIMIT)
         
         Returns:
             A dictionary with category names as keys and lists of NewsQa items as values.
         """
-        # Default to all categories
-        categories = NewsCategory.objects.all()
-        
-        # If user is authenticated, try to get their preferred categories
-        if request.user.is_authenticated:
-            try:
-                user_detail = UserDetail.objects.get(user=request.user)
-                user_categories = user_detail.categories
-                # If user has preferred categories, use them
-                if user_categories:
-                    categories = NewsCategory.objects.filter(id__in=user_categories)
-            except UserDetail.DoesNotExist:
-                # Fallback to all categories if user detail doesn't exist
-                pass
+        limit = request.query_params.get('limit', settings.NEWSQA_BY_CATEGORY_LIMIT)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= settings.NEWSQA_BY_CATEGORY_MAX_LIMIT:
+            return Response({"detail": f"limit must be between 1 and {settings.NEWSQA_BY_CATEGORY_MAX_LIMIT}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        items = (
+            self.get_queryset()
+            .filter(category__is_deleted=False)
+            .select_related('category')
+            .annotate(position=Window(RowNumber(), partition_by=F('category_id'),
+                                      order_by=[F('created_at').desc(), F('id').desc()]))
+            .filter(position__lte=limit)
+            .order_by('category_id', 'position')
+        )
         
         result = {}
+        for item in items:
+            result.setdefault(item.category.name, []).append(item)
+        return Response({name: self.get_serializer(group, many=True).data for name, group in result.items()})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many NewsQa items in one request
         
-        for category in categories:
-            items = NewsQa.objects.filter(category=category)[:5]  # Limit to 5 items per category
-            if items.exists():
-                result[category.name] = self.get_serializer(items, many=True).data
+        Accepts a list of items (or {"items": [...]}) with the same fields as create,
+        `category` being a category ID. Items whose `uri` is already stored, or
+        repeats an earlier item, are skipped. Existing uris are resolved with a single
+        query and new rows are inserted in chunks inside one transaction; an item whose
+        uri another request stored in the meantime is reported as skipped.
         
-        return Response(result)
+        Returns:
+            Counts of created, skipped and invalid items, and one result per item in
+            request order with its `status` (and `id`, skip `reason` or `errors`).
+        """
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Expected a list of items"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.NEWSQA_BULK_MAX_ITEMS:
+            return Response({"detail": f"At most {settings.NEWSQA_BULK_MAX_ITEMS} items per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['get'])
+        # Validate each item on its own, so one bad item does not reject the others
+        valid, invalid = [], {}
+        for index, item in enumerate(items):
+            serializer = NewsQaBulkItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                invalid[index] = {"index": index, "uri": item.get('uri') if isinstance(item, dict) else None,
+                                  "status": "invalid", "errors": serializer.errors}
+
+        inserted = bulk_insert_newsqa([data for _, data in valid], chunk_size=settings.NEWSQA_BULK_CHUNK_SIZE)
+        for (index, _), result in zip(valid, inserted):
+            result["index"] = index
+        results = sorted(list(invalid.values()) + inserted, key=lambda result: result["index"])
+
+        counts = {key: sum(result["status"] == key for result in results) for key in ("created", "skipped", "invalid")}
+        response_status = status.HTTP_201_CREATED if counts["created"] else status.HTTP_200_OK
+        return Response({**counts, "items": results}, status=response_status)
+
+    @action(detail=False, methods=['get', 'post'])
     def update_news(self, request):
         """
         Update news questions from external sources
         
-        Fetches news articles from EventRegistry API for each root category,
-        generates quiz questions using an external AI service, and stores them
-        in the database as NewsQa items.
+        Starts an ingestion run in the background and returns right away. The run
+        fetches news articles from EventRegistry for each root category, generates
+        quiz questions using the quiz service, and stores them as NewsQa items.
+        Follow its progress at /ingestion-runs/{run_id}/.
         
         Returns:
-            A success message when the update is complete.
+            The run ID (202), or the ID of the run already in progress (409).
         """
-        categories = NewsCategory.objects.filter(parent_category=None)
-        er = EventRegistry(apiKey = 'e76ab0cf-e470-4a1f-b166-19e95f10e96c')
-        for category in categories:
-            query = {
-            "$query": {
-                "categoryUri": category.uri
-            },
-            "$filter": {
-            "forceMaxDataTimeWindow": "31"
-            }
-        }
-            q = QueryArticlesIter.initWithComplexQuery(query)
-            for article in q.execQuery(er, maxItems=10):
-                if NewsQa.objects.filter(uri=article["uri"]).exists():
-                    continue
-                response_data = requests.post('https://3249-103-163-65-38.ngrok-free.app/quiz', json={"text": article["body"]}).json()
-                NewsQa.objects.create(
-                    category=category,
-                    question=response_data["question"],
-                    answer=response_data["correct_answer"],
-                    description=response_data["explanation"],
-                    options=response_data["choices"],
-                    paragraph=article["body"],
-                    uri=article["uri"]
-                )
-        return Response({"message": "News updated successfully"})
-
+        run, created = start_run(trigger='api')
+        if not created:
+            return Response({"message": f"An ingestion run is already {run.status}", "run_id": run.id},
+                            status=status.HTTP_409_CONFLICT)
+        run_in_background(run)
+        return Response({"message": "News update started", "run_id": run.id}, status=status.HTTP_202_ACCEPTED)
 
 
 class NewsCategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -204,18 +331,48 @@ class NewsCategoryViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Get all questions for a specific category
         
-        Returns all NewsQa items that belong to the specified category.
+        Returns the NewsQa items that belong to the specified category, newest
+        first, one page at a time.
         
         Parameters:
             pk (int): The primary key of the category
+            subcategories (bool): Include the items of all its subcategories
             
         Returns:
-            A list of NewsQa items belonging to the category
+            A page of NewsQa items belonging to the category and the `next` page link
         """
         category = self.get_object()
-        questions = NewsQa.objects.filter(category=category)
-        serializer = NewsQaSerializer(questions, many=True)
-        return Response(serializer.data)
+        category_ids = [category.id]
+        if request.query_params.get('subcategories', '').lower() in ('1', 'true', 'yes'):
+            category_ids = get_category_tree().subtree_ids(category.id)
+        questions = NewsQa.objects.filter(category_id__in=category_ids)
+        self.pagination_category_ids = set(category_ids)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(NewsQaReadSerializer.values(questions), request, view=self)
+        return paginator.get_paginated_response(NewsQaReadSerializer(page).data)
+    
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Get the category tree
+        
+        Returns the categories as nested objects with their `children`, served from
+        the in-memory category tree.
+        
+        Parameters:
+            root (str): Only the subtree under this category ID or URI
+            
+        Returns:
+            A list of root categories, or the requested category (404 if unknown)
+        """
+        tree = get_category_tree()
+        root = request.query_params.get('root')
+        if root is None:
+            return Response(tree.nested())
+        node = tree.nested(tree.find(root))
+        if node is None:
+            return Response({"detail": "Category not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(node)
     
     @action(detail=False, methods=['get'])
     def user_categories(self, request):
@@ -232,17 +389,54 @@ class NewsCategoryViewSet(viewsets.ReadOnlyModelViewSet):
         if not request.user.is_authenticated:
             return Response({"detail": "Authentication required to get user categories"}, status=status.HTTP_200_OK)
             
-        try:
-            user_detail = UserDetail.objects.get(user=request.user)
-            user_categories = user_detail.categories
-            if user_categories:
-                categories = self.get_queryset().filter(id__in=user_categories)
-                serializer = self.get_serializer(categories, many=True)
-                return Response(serializer.data)
-            else:
-                return Response({"detail": "User has no preferred categories"}, status=status.HTTP_200_OK)
-        except UserDetail.DoesNotExist:
+        user_categories = get_user_categories(request.user)
+        if user_categories is None:
             return Response({"detail": "User detail not found"}, status=status.HTTP_200_OK)
+        if user_categories:
+            categories = self.get_queryset().filter(id__in=user_categories)
+            serializer = self.get_serializer(categories, many=True)
+            return Response(serializer.data)
+        else:
+            return Response({"detail": "User has no preferred categories"}, status=status.HTTP_200_OK)
+
+
+class IngestionRunViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for news ingestion runs.
+    
+    create:
+    Start an ingestion run in the background and return it right away (202).
+    Accepts optional `options`: `categories` (root category URIs),
+    `max_articles_per_category`, `batch_size` and `quiz_concurrency` (positive and
+    bounded, see IngestionOptionsSerializer; 400 otherwise). Returns the active run
+    with 409 if one is already queued or running.
+    
+    retrieve:
+    Return a run with its status and progress counters.
+    
+    list:
+    Return all runs, newest first.
+    """
+    queryset = IngestionRun.objects.order_by('-created_at')
+    serializer_class = IngestionRunSerializer
+    permission_classes = [permissions.AllowAny]
+    
+    def create(self, request):
+        options = request.data.get('options') or {}
+        if not isinstance(options, dict):
+            return Response({"detail": "options must be an object"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = IngestionOptionsSerializer(data=options)
+        unknown = set(options) - set(serializer.fields)
+        if unknown:
+            return Response({"detail": f"Unknown options: {', '.join(sorted(unknown))}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response({"options": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        run, created = start_run(trigger='api', **serializer.validated_data)
+        if not created:
+            return Response(self.get_serializer(run).data, status=status.HTTP_409_CONFLICT)
+        run_in_background(run)
+        return Response(self.get_serializer(run).data, status=status.HTTP_202_ACCEPTED)
 
 
 class UserDetailViewSet(viewsets.ModelViewSet):
@@ -189,4 +189,57 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-}
\ No newline at end of file
+}
+
+# Cache for per-user category preferences (news/preferences.py). The default cache is per process:
+# point CACHE_BACKEND/CACHE_LOCATION at a shared one (e.g. Redis) when running several processes,
+# otherwise other processes see preference changes only after USER_CATEGORIES_CACHE_TIMEOUT seconds
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+USER_CATEGORIES_CACHE_TIMEOUT = int(os.environ.get('USER_CATEGORIES_CACHE_TIMEOUT', 300))
+# Each process reloads its in-memory category tree (news/category_tree.py) when a category changes,
+# and at the latest after this many seconds
+CATEGORY_TREE_CHECK_INTERVAL = int(os.environ.get('CATEGORY_TREE_CHECK_INTERVAL', 300))
+
+# Bulk NewsQa inserts (POST /newsqa/bulk/): items accepted per request and rows per INSERT
+NEWSQA_BULK_MAX_ITEMS = int(os.environ.get('NEWSQA_BULK_MAX_ITEMS', 10000))
+NEWSQA_BULK_CHUNK_SIZE = int(os.environ.get('NEWSQA_BULK_CHUNK_SIZE', 500))
+
+# NewsQa list pages (?page_size=), by default and at most; see news/pagination.py
+NEWSQA_PAGE_SIZE = int(os.environ.get('NEWSQA_PAGE_SIZE', 50))
+NEWSQA_MAX_PAGE_SIZE = int(os.environ.get('NEWSQA_MAX_PAGE_SIZE', 500))
+# Most categories a list restricted to several categories is read from one index range each (one UNION ALL query)
+NEWSQA_PAGE_MERGE_MAX_CATEGORIES = int(os.environ.get('NEWSQA_PAGE_MERGE_MAX_CATEGORIES', 100))
+
+# Most results of one full-text search (GET /newsqa/search/?limit=)
+NEWSQA_SEARCH_MAX_RESULTS = int(os.environ.get('NEWSQA_SEARCH_MAX_RESULTS', 100))
+
+# Random NewsQa items (GET /newsqa/random/): most items per request and most excluded ids
+NEWSQA_RANDOM_MAX_COUNT = int(os.environ.get('NEWSQA_RANDOM_MAX_COUNT', 50))
+NEWSQA_RANDOM_MAX_EXCLUDE = int(os.environ.get('NEWSQA_RANDOM_MAX_EXCLUDE', 1000))
+
+# Items per category returned by GET /newsqa/by_category/ (?limit=), by default and at most
+NEWSQA_BY_CATEGORY_LIMIT = int(os.environ.get('NEWSQA_BY_CATEGORY_LIMIT', 5))
+NEWSQA_BY_CATEGORY_MAX_LIMIT = int(os.environ.get('NEWSQA_BY_CATEGORY_MAX_LIMIT', 50))
+
+# News ingestion (news/ingestion.py), overridable through the environment
+EVENTREGISTRY_API_KEY = os.environ.get('EVENTREGISTRY_API_KEY', 'e76ab0cf-e470-4a1f-b166-19e95f10e96c')
+# Base URL of the agent API that generates the quiz questions
+QUIZ_SERVICE_URL = os.environ.get('QUIZ_SERVICE_URL', 'https://3249-103-163-65-38.ngrok-free.app')
+NEWS_INGESTION = {
+    'MAX_ARTICLES_PER_CATEGORY': int(os.environ.get('INGEST_MAX_ARTICLES_PER_CATEGORY', 10)),
+    'MAX_DAYS': int(os.environ.get('INGEST_MAX_DAYS', 31)),
+    # Categories fetched from EventRegistry at once
+    'FETCH_WORKERS': int(os.environ.get('INGEST_FETCH_WORKERS', 4)),
+    # Articles the quiz service works on at once (the concurrency of each /batch call)
+    'QUIZ_CONCURRENCY': int(os.environ.get('INGEST_QUIZ_CONCURRENCY', 8)),
+    'QUIZ_TIMEOUT': float(os.environ.get('INGEST_QUIZ_TIMEOUT', 300)),
+    # Articles per /batch call and per bulk insert
+    'BATCH_SIZE': int(os.environ.get('INGEST_BATCH_SIZE', 50)),
+    # A running run that has not reported progress for this long is considered dead
+    'STALE_AFTER': int(os.environ.get('INGEST_STALE_AFTER', 3600)),
+}
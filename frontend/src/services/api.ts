@@ -151,8 +151,8 @@ export const fetchQuizQuestions = async (): Promise<QuizQuestion[]> => {
     const response = await apiClient.get("/news/newsqa/?format=json");
 
     // Check if the response is valid JSON with expected structure
-    if (isValidJsonResponse(response.data)) {
-      return response.data;
+    if (isValidJsonResponse(response.data?.results)) {
+      return response.data.results;
     } else {
       console.warn("API returned invalid data format", response.data);
       console.log("Using fallback questions data");
@@ -174,8 +174,8 @@ export const fetchCategoryQuizQuestions = async (
     );
 
     // Check if the response is valid JSON with expected structure
-    if (isValidJsonResponse(response.data)) {
-      return response.data;
+    if (isValidJsonResponse(response.data?.results)) {
+      return response.data.results;
     } else {
       console.warn(
         "API returned invalid data format for category",
@@ -199,11 +199,11 @@ export const fetchMixQuizQuestions = async (
   limit: number = 10
 ): Promise<QuizQuestion[]> => {
   try {
-    const response = await apiClient.get(`/news/newsqa/?limit=${limit}&format=json`);
+    const response = await apiClient.get(`/news/newsqa/?page_size=${limit}&format=json`);
 
     // Check if the response is valid JSON with expected structure
-    if (isValidJsonResponse(response.data)) {
-      return response.data;
+    if (isValidJsonResponse(response.data?.results)) {
+      return response.data.results;
     } else {
       console.warn(
         "API returned invalid data format for mix questions",